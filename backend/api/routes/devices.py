@@ -1,56 +1,114 @@
-from fastapi import APIRouter, HTTPException, Request
-from pydantic import BaseModel
+import json
+import math
+import time
 from typing import Any
 
+from api.routes.rooms import snapshot_response
+from core.bulk import BULK_MAX_COMMANDS, BulkCommand
+from core.snapshots import FLEET_MAX_LIMIT, etag_matches
+from devices.base import CommandSuperseded
+from devices.breaker import DeviceUnavailable
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
 router = APIRouter()
 
 
 class CommandRequest(BaseModel):
     command: str
     params: dict[str, Any] = {}
+    # Read-only commands may be answered from state polled at most this many seconds ago
+    max_age: float | None = None
+
+
+class BulkCommandEntry(BaseModel):
+    device_id: str
+    command: str
+    params: dict[str, Any] = {}
+
+
+class BulkCommandRequest(BaseModel):
+    commands: list[BulkCommandEntry]
+
+
+def _split(value: str | None) -> list[str] | None:
+    return None if value is None else [v.strip() for v in value.split(",") if v.strip()]
+
+
+@router.get("/devices")
+async def fleet_devices(
+    request: Request,
+    status: str | None = None,
+    power: str | None = None,
+    driver: str | None = None,
+    type: str | None = None,
+    room: str | None = None,
+    fields: str | None = None,
+    cursor: str | None = None,
+    limit: int = 500,
+):
+    """Devices across every room, filtered, projected and paged.
+
+    Filters take comma-separated alternatives (``status=offline,unknown``,
+    ``power=true|false|null``). ``fields`` picks dotted paths such as
+    ``id,room_id,state.power``. Pass ``next_cursor`` back as ``cursor`` for
+    the next page.
+
+    The ETag is the global snapshot version rather than one per result: any
+    state or config change anywhere invalidates it, even outside the filter,
+    so a client revalidates more often than strictly needed but never keeps a
+    stale page.
+    """
+    if not 1 <= limit <= FLEET_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{FLEET_MAX_LIMIT}")
+    filters = {
+        name: _split(value)
+        for name, value in (
+            ("status", status), ("power", power), ("driver", driver), ("type", type),
+            ("room", room),
+        )
+        if value is not None
+    }
+    snapshots = request.app.state.room_manager.snapshots
+    etag = f'"{snapshots.version}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    try:
+        body = snapshots.fleet.query(filters, _split(fields), cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(body, media_type="application/json", headers={"ETag": etag})
 
 
 @router.get("/rooms/{room_id}/devices")
-async def list_devices(room_id: str, request: Request):
+async def list_devices(room_id: str, request: Request, since: int | None = None):
+    """Devices in a room with their state; supports If-None-Match and ``since`` like the room."""
     rm = request.app.state.room_manager
-    room_data = rm.get_room(room_id)
-    if not room_data:
+    if not rm.get_room(room_id):
         raise HTTPException(status_code=404, detail=f"Room {room_id!r} not found")
-
-    results = []
-    for dev_conf in room_data.get("devices", []):
-        did = dev_conf["id"]
-        drv = rm.get_device(did)
-        results.append({
-            "id": did,
-            "name": dev_conf.get("name", did),
-            "type": dev_conf.get("type"),
-            "driver": dev_conf.get("driver"),
-            "state": drv.state.model_dump() if drv else None,
-        })
-    return results
+    body = None if since is not None else rm.snapshots.devices_body(room_id)
+    return snapshot_response(request, room_id, body, since)
 
 
 @router.get("/rooms/{room_id}/devices/{device_id}")
 async def get_device(room_id: str, device_id: str, request: Request):
     rm = request.app.state.room_manager
-    room_data = rm.get_room(room_id)
-    if not room_data:
+    room = rm.get_room(room_id)
+    if not room:
         raise HTTPException(status_code=404, detail=f"Room {room_id!r} not found")
 
     drv = rm.get_device(device_id)
-    if not drv:
+    if not drv or device_id not in room.device_set:
         raise HTTPException(status_code=404, detail=f"Device {device_id!r} not found")
 
-    dev_conf = next(
-        (d for d in room_data.get("devices", []) if d["id"] == device_id), {}
-    )
+    dev = rm.get_device_config(device_id)
     return {
         "id": device_id,
-        "name": dev_conf.get("name", device_id),
-        "type": dev_conf.get("type"),
-        "driver": dev_conf.get("driver"),
-        "state": drv.state.model_dump(),
+        "name": dev.name,
+        "type": dev.type,
+        "driver": dev.driver,
+        "state": drv.state.to_dict(),
     }
 
 
@@ -62,9 +120,60 @@ async def send_command(room_id: str, device_id: str, body: CommandRequest, reque
         raise HTTPException(status_code=404, detail=f"Device {device_id!r} not found")
 
     try:
-        result = await drv.send_command(body.command, **body.params)
-        return {"ok": True, "result": str(result) if result is not None else None}
+        source = "device"
+        if body.max_age is None:
+            result = await rm.send_command(device_id, body.command, **body.params)
+        else:
+            result, source = await rm.query_command(
+                device_id, body.command, body.max_age, **body.params
+            )
+        return {
+            "ok": True, "result": str(result) if result is not None else None, "source": source,
+        }
+    except CommandSuperseded as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Device {device_id!r} timed out")
+    except DeviceUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Device error: {e}")
+
+
+@router.post("/commands/bulk")
+async def bulk_commands(body: BulkCommandRequest, request: Request):
+    """Run many commands across devices and rooms, streaming results as NDJSON.
+
+    One line per command in completion order (``index`` refers to the request),
+    then a final line with ``"done": true`` and totals.
+    """
+    if not body.commands:
+        raise HTTPException(status_code=400, detail="No commands given")
+    if len(body.commands) > BULK_MAX_COMMANDS:
+        raise HTTPException(
+            status_code=413, detail=f"At most {BULK_MAX_COMMANDS} commands per request"
+        )
+    commands = [BulkCommand(c.device_id, c.command, c.params) for c in body.commands]
+    dispatcher = request.app.state.bulk
+
+    async def lines():
+        start = time.perf_counter()
+        ok = 0
+        async for result in dispatcher.run(commands):
+            ok += result["ok"]
+            yield json.dumps(result) + "\n"
+        yield json.dumps({
+            "done": True,
+            "total": len(commands),
+            "ok": ok,
+            "failed": len(commands) - ok,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+        }) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,57 @@
+import time
+
+from fastapi import APIRouter, HTTPException, Query, Request
+
+router = APIRouter()
+
+DEFAULT_RANGE = 24 * 3600
+
+
+def _resolve(request: Request, device_id: str, start: float | None, end: float | None):
+    history = getattr(request.app.state, "history", None)
+    if history is None:
+        raise HTTPException(status_code=503, detail="State history is disabled")
+    if request.app.state.room_manager.get_device_config(device_id) is None:
+        raise HTTPException(status_code=404, detail=f"Device {device_id!r} not found")
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - DEFAULT_RANGE
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return history, start, end
+
+
+@router.get("/devices/{device_id}/history")
+async def device_history(
+    device_id: str,
+    request: Request,
+    start: float | None = Query(None, description="Unix time, default end - 24h"),
+    end: float | None = Query(None, description="Unix time, default now"),
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    history, start, end = _resolve(request, device_id, start, end)
+    return {
+        "device_id": device_id,
+        "start": start,
+        "end": end,
+        "samples": await history.samples(device_id, start, end, limit),
+    }
+
+
+@router.get("/devices/{device_id}/history/aggregate")
+async def device_history_aggregate(
+    device_id: str,
+    request: Request,
+    start: float | None = Query(None, description="Unix time, default end - 24h"),
+    end: float | None = Query(None, description="Unix time, default now"),
+    bucket: float = Query(3600, ge=60, description="Bucket size in seconds"),
+):
+    history, start, end = _resolve(request, device_id, start, end)
+    if (end - start) / bucket > 10000:
+        raise HTTPException(status_code=400, detail="Too many buckets; use a larger bucket")
+    return {
+        "device_id": device_id,
+        "start": start,
+        "end": end,
+        "bucket": bucket,
+        "buckets": await history.aggregate(device_id, start, end, bucket),
+    }
@@ -1,80 +1,57 @@
-from fastapi import APIRouter, HTTPException, Request
+from core.snapshots import etag_matches
+from fastapi import APIRouter, HTTPException, Request, Response
 
 router = APIRouter()
 
 
+def snapshot_response(request: Request, room_id: str, body: bytes | None, since: int | None):
+    """A cached room body with its ETag, 304 if the client's copy is current, or a delta."""
+    snapshots = request.app.state.room_manager.snapshots
+    etag = snapshots.etag(room_id)
+    if since is not None:
+        body = snapshots.delta_body(room_id, since)
+    elif etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
 @router.get("/rooms")
 async def list_rooms(request: Request):
     rm = request.app.state.room_manager
     result = []
-    for room_id, room_data in rm.rooms.items():
-        room_info = room_data.get("room", {})
-        device_ids = rm.get_room_devices(room_id)
+    for room_id, room in rm.rooms.items():
         result.append({
             "id": room_id,
-            "name": room_info.get("name", room_id),
-            "description": room_info.get("description", ""),
-            "device_count": len(device_ids),
+            "name": room.name,
+            "description": room.description,
+            "device_count": len(room.device_ids),
         })
     return result
 
 
 @router.get("/rooms/{room_id}")
-async def get_room(room_id: str, request: Request):
+async def get_room(room_id: str, request: Request, since: int | None = None):
+    """Room details with every device's state.
+
+    Send the ETag back in If-None-Match to get 304 while nothing changed, or
+    pass ``since=<version>`` to get only the devices changed after it.
+    """
     rm = request.app.state.room_manager
-    room_data = rm.get_room(room_id)
-    if not room_data:
+    if not rm.get_room(room_id):
         raise HTTPException(status_code=404, detail=f"Room {room_id!r} not found")
-
-    room_info = room_data.get("room", {})
-    device_ids = rm.get_room_devices(room_id)
-    devices = []
-    for did in device_ids:
-        drv = rm.get_device(did)
-        state = drv.state.model_dump() if drv else None
-        dev_conf = next(
-            (d for d in room_data.get("devices", []) if d["id"] == did), {}
-        )
-        devices.append({
-            "id": did,
-            "name": dev_conf.get("name", did),
-            "type": dev_conf.get("type"),
-            "driver": dev_conf.get("driver"),
-            "state": state,
-        })
-
-    return {
-        "id": room_id,
-        "name": room_info.get("name", room_id),
-        "description": room_info.get("description", ""),
-        "devices": devices,
-        "scenes": [s["name"] for s in room_data.get("scenes", [])],
-    }
+    body = None if since is not None else rm.snapshots.room_body(room_id)
+    return snapshot_response(request, room_id, body, since)
 
 
 @router.post("/rooms/{room_id}/scene/{scene_name}")
 async def activate_scene(room_id: str, scene_name: str, request: Request):
     rm = request.app.state.room_manager
-    room_data = rm.get_room(room_id)
-    if not room_data:
+    room = rm.get_room(room_id)
+    if not room:
         raise HTTPException(status_code=404, detail=f"Room {room_id!r} not found")
 
-    scenes = room_data.get("scenes", [])
-    scene = next((s for s in scenes if s["name"] == scene_name), None)
+    scene = room.scenes.get(scene_name)
     if not scene:
         raise HTTPException(status_code=404, detail=f"Scene {scene_name!r} not found")
 
-    results = []
-    for action in scene.get("actions", []):
-        did = action["device"]
-        cmd = action["command"]
-        params = action.get("params", {})
-        drv = rm.get_device(did)
-        if drv:
-            try:
-                await drv.send_command(cmd, **params)
-                results.append({"device": did, "ok": True})
-            except Exception as e:
-                results.append({"device": did, "ok": False, "error": str(e)})
-
-    return {"scene": scene_name, "results": results}
+    return await request.app.state.scene_engine.activate(scene)
@@ -1,8 +1,13 @@
+import os
 import platform
 import sys
+import time
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Request
+from core.metrics import REGISTRY
+from core.watchdog import PROFILE_MAX_SECONDS, PROFILE_MIN_INTERVAL
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 
 router = APIRouter()
 
@@ -15,16 +20,52 @@ async def health():
 @router.get("/system/status")
 async def system_status(request: Request):
     room_manager = request.app.state.room_manager
+    cluster = request.app.state.cluster
     rooms = list(room_manager.rooms.keys())
-    device_statuses = {
-        did: drv.state.status.value
-        for did, drv in room_manager.devices.items()
-    }
     return {
         "version": "0.1.0",
         "python": sys.version,
         "platform": platform.system(),
         "rooms": rooms,
-        "devices": device_statuses,
+        "devices": room_manager.snapshots.statuses,
+        "polling": room_manager.poller.stats(),
+        "startup": room_manager.startup_stats(),
+        "breakers": room_manager.breaker_stats(),
+        "notifications": room_manager.notification_stats(),
+        "event_bus": request.app.state.event_bus.stats(),
+        "cluster": cluster.cluster_stats() if cluster else None,
+        "event_loop": request.app.state.watchdog.stats(),
         "timestamp": datetime.now(timezone.utc).isoformat(),
     }
+
+
+@router.get("/system/profile", response_class=PlainTextResponse)
+async def profile(request: Request, seconds: float = 5.0, interval: float = 0.005):
+    """Sample the event loop thread for ``seconds`` and download folded stacks.
+
+    Render with ``flamegraph.pl profile.folded > profile.svg`` or open in
+    speedscope. Each stack starts with the kind of task that was running.
+    """
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(
+            status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}]"
+        )
+    if not PROFILE_MIN_INTERVAL <= interval <= seconds:
+        raise HTTPException(
+            status_code=400,
+            detail=f"interval must be in [{PROFILE_MIN_INTERVAL:g}, seconds]",
+        )
+    try:
+        folded = await request.app.state.watchdog.profile(seconds, interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    filename = f"nomy-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+    return PlainTextResponse(
+        folded, headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of Nomy's internal metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
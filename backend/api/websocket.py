@@ -1,125 +1,369 @@
 import asyncio
 import json
 import logging
-from datetime import datetime, timezone
+import math
+import time
+from collections.abc import Callable
+from datetime import UTC, datetime
 
+from core.bulk import BULK_MAX_COMMANDS, BulkCommand
+from core.metrics import WS_CONNECTIONS, WS_SEND_SECONDS, Histogram
+from devices.base import CommandSuperseded
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+WS_SEND_TIMEOUT = 2.0
+WS_MIN_RATE = 0.2   # updates/s a client may negotiate
+WS_MAX_RATE = 50.0
+WS_HUB_QUEUE = 1024  # per-room backlog of device updates before coalescing/dropping
+
+
+async def _send_frame(ws: WebSocket, frame: str, timer: Histogram) -> bool:
+    t0 = time.perf_counter()
+    try:
+        await asyncio.wait_for(ws.send_text(frame), timeout=WS_SEND_TIMEOUT)
+        return True
+    except Exception:
+        logger.debug("WS send failed", exc_info=True)
+        return False
+    finally:
+        timer.observe(time.perf_counter() - t0)
+
+
+class ThrottledClient:
+    """Caps one client's update rate.
+
+    Updates arriving within a window collapse to the latest state per device and
+    go out together as one ``device_state_batch`` frame.
+    """
+
+    def __init__(
+        self,
+        ws: WebSocket,
+        max_rate: float,
+        on_dead: Callable[[WebSocket], None],
+        send_timer: Histogram,
+    ):
+        self.ws = ws
+        self.max_rate = max_rate
+        self._send_timer = send_timer
+        self._pending: dict[str, dict] = {}
+        self._snapshot: dict | None = None
+        self._wake = asyncio.Event()
+        self._on_dead = on_dead
+        self._task = asyncio.create_task(self._run(), name="ws-throttle")
+
+    def offer(self, device_id: str, message: dict) -> None:
+        self._pending[device_id] = message
+        self._wake.set()
+
+    def offer_snapshot(self, message: dict) -> None:
+        """A snapshot supersedes every pending update."""
+        self._pending.clear()
+        self._snapshot = message
+        self._wake.set()
+
+    def close(self) -> None:
+        self._task.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            messages = [self._snapshot] if self._snapshot is not None else []
+            self._snapshot = None
+            updates = list(self._pending.values())
+            self._pending.clear()
+            if len(updates) == 1:
+                messages.append(updates[0])
+            elif updates:
+                messages.append({"type": "device_state_batch", "updates": updates})
+            for message in messages:
+                if not await _send_frame(self.ws, json.dumps(message), self._send_timer):
+                    self._on_dead(self.ws)
+                    return
+            await asyncio.sleep(1.0 / self.max_rate)
+
+
+class RoomHub:
+    """Single event-bus subscriber per room that fans pre-encoded frames out to its clients."""
+
+    def __init__(self, room_id: str, room_manager):
+        self.room_id = room_id
+        self.room_manager = room_manager
+        self.device_ids = room_manager.get_room(room_id).device_set
+        self.connections: set[WebSocket] = set()
+        self.throttled: dict[WebSocket, ThrottledClient] = {}
+        self._closing: set[asyncio.Task] = set()
+        self._send_timer = WS_SEND_SECONDS.labels(room_id)
+        self._connections_gauge = WS_CONNECTIONS.labels(room_id)
+        self._event_bus = room_manager.event_bus
+        # A slow room must not hold up the poller: queue updates, and once the queue is full
+        # keep only the latest per device
+        self._event_bus.subscribe(
+            "device_state_update",
+            self._on_device_update,
+            queue_size=WS_HUB_QUEUE,
+            overflow="coalesce",
+            key=lambda data: data["device_id"],
+        )
+        self._event_bus.subscribe("room_config_changed", self._on_room_config_changed)
+
+    def add(self, ws: WebSocket, max_rate: float | None = None) -> None:
+        if max_rate is None:
+            self.connections.add(ws)
+        else:
+            self.throttled[ws] = ThrottledClient(ws, max_rate, self._drop, self._send_timer)
+        self._connections_gauge.set(len(self))
+
+    def remove(self, ws: WebSocket) -> None:
+        self.connections.discard(ws)
+        client = self.throttled.pop(ws, None)
+        if client:
+            client.close()
+        self._connections_gauge.set(len(self))
+
+    def __len__(self) -> int:
+        return len(self.connections) + len(self.throttled)
+
+    def close(self) -> None:
+        self._event_bus.unsubscribe("device_state_update", self._on_device_update)
+        self._event_bus.unsubscribe("room_config_changed", self._on_room_config_changed)
+        for client in self.throttled.values():
+            client.close()
+        # Rooms come and go with reloads; don't keep reporting torn-down ones
+        WS_CONNECTIONS.remove(self.room_id)
+        WS_SEND_SECONDS.remove(self.room_id)
+
+    async def _on_room_config_changed(self, data: dict) -> None:
+        if data["room_id"] != self.room_id:
+            return
+        if data["removed"]:
+            for ws in [*self.connections, *self.throttled]:
+                self.remove(ws)
+                self._spawn_close(ws, 4004, f"Room {self.room_id!r} removed")
+            return
+        self.device_ids = self.room_manager.get_room(self.room_id).device_set
+        snapshot = {"type": "snapshot", "states": self.room_manager.room_snapshot(self.room_id)}
+        for client in self.throttled.values():
+            client.offer_snapshot({**snapshot, "max_rate": client.max_rate})
+        await self.broadcast({**snapshot, "max_rate": None})
+
+    async def _on_device_update(self, data: dict) -> None:
+        if data["device_id"] not in self.device_ids or not len(self):
+            return
+        message = {
+            "type": "device_state_update",
+            "device_id": data["device_id"],
+            "state": data["state"],
+            "version": data.get("version"),
+            "changed": data.get("changed", []),
+            "timestamp": datetime.now(UTC).isoformat(),
+        }
+        for client in self.throttled.values():
+            client.offer(data["device_id"], message)
+        await self.broadcast(message)
+
+    async def broadcast(self, message: dict) -> None:
+        """Send to every unthrottled connection."""
+        if not self.connections:
+            return
+        frame = json.dumps(message)
+        conns = list(self.connections)
+        sent = await asyncio.gather(*(_send_frame(ws, frame, self._send_timer) for ws in conns))
+        for ws, ok in zip(conns, sent):
+            if not ok:
+                self._drop(ws)
+
+    def _drop(self, ws: WebSocket) -> None:
+        # Stalled or dead client: drop it so it cannot hold up the room again
+        self.remove(ws)
+        self._spawn_close(ws)
+        logger.info(f"WS dropped slow/dead client: room={self.room_id}")
+
+    def _spawn_close(self, ws: WebSocket, code: int = 1000, reason: str | None = None) -> None:
+        # Keep a reference so the loop can't garbage-collect the close mid-way
+        task = asyncio.create_task(_close_quietly(ws, code, reason))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+
+async def _close_quietly(ws: WebSocket, code: int = 1000, reason: str | None = None) -> None:
+    try:
+        await ws.close(code, reason)
+    except Exception:
+        logger.debug("WS close failed", exc_info=True)
+
 
 class ConnectionManager:
     def __init__(self):
-        self._connections: dict[str, list[WebSocket]] = {}
+        self._hubs: dict[str, RoomHub] = {}
 
-    async def connect(self, room_id: str, ws: WebSocket) -> None:
+    async def connect(
+        self, room_id: str, ws: WebSocket, room_manager, max_rate: float | None = None
+    ) -> bool:
+        """Accept and register a client; False if the room was removed in the meantime."""
         await ws.accept()
-        self._connections.setdefault(room_id, []).append(ws)
-        logger.info(f"WS connected: room={room_id}, total={len(self._connections[room_id])}")
+        if room_manager.get_room(room_id) is None:
+            # A reload removed the room between the endpoint's check and the accept
+            await _close_quietly(ws, 4004, f"Room {room_id!r} removed")
+            return False
+        hub = self._hubs.get(room_id)
+        if hub is None:
+            hub = self._hubs[room_id] = RoomHub(room_id, room_manager)
+        hub.add(ws, max_rate)
+        logger.info(f"WS connected: room={room_id}, total={len(hub)}")
+        return True
 
     def disconnect(self, room_id: str, ws: WebSocket) -> None:
-        room_conns = self._connections.get(room_id, [])
-        if ws in room_conns:
-            room_conns.remove(ws)
+        hub = self._hubs.get(room_id)
+        if hub is None:
+            return
+        hub.remove(ws)
+        if not len(hub):
+            hub.close()
+            del self._hubs[room_id]
         logger.info(f"WS disconnected: room={room_id}")
 
     async def broadcast(self, room_id: str, message: dict) -> None:
-        conns = self._connections.get(room_id, [])
-        dead = []
-        for ws in conns:
-            try:
-                await ws.send_json(message)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            self.disconnect(room_id, ws)
+        hub = self._hubs.get(room_id)
+        if hub:
+            await hub.broadcast(message)
 
 
 manager = ConnectionManager()
 
 
 @router.websocket("/ws/rooms/{room_id}")
-async def websocket_endpoint(websocket: WebSocket, room_id: str):
-    app = websocket.app
-    room_manager = app.state.room_manager
-    event_bus = app.state.event_bus
+async def websocket_endpoint(websocket: WebSocket, room_id: str, max_rate: float | None = None):
+    """Room state stream. ``?max_rate=N`` caps updates to N frames/s, batching in between."""
+    room_manager = websocket.app.state.room_manager
 
     room = room_manager.get_room(room_id)
     if not room:
         await websocket.close(code=4004, reason=f"Room {room_id!r} not found")
         return
 
-    await manager.connect(room_id, websocket)
-
-    room_devices = set(room_manager.get_room_devices(room_id))
-
-    async def on_device_update(data: dict):
-        if data["device_id"] in room_devices:
-            await manager.broadcast(room_id, {
-                "type": "device_state_update",
-                "device_id": data["device_id"],
-                "state": data["state"],
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-            })
-
-    event_bus.subscribe("device_state_update", on_device_update)
+    if max_rate is not None:
+        if not math.isfinite(max_rate):
+            await websocket.close(code=4400, reason="max_rate must be a finite number")
+            return
+        max_rate = min(max(max_rate, WS_MIN_RATE), WS_MAX_RATE)
+    if not await manager.connect(room_id, websocket, room_manager, max_rate):
+        return
 
     # Send initial state snapshot
-    snapshot = {}
-    for did in room_devices:
-        driver = room_manager.get_device(did)
-        if driver:
-            snapshot[did] = driver.state.model_dump()
-    await websocket.send_json({"type": "snapshot", "states": snapshot})
+    snapshot = room_manager.room_snapshot(room_id)
 
+    # Long-running requests (bulk commands) run beside the receive loop
+    tasks: set[asyncio.Task] = set()
     try:
+        await websocket.send_json({"type": "snapshot", "states": snapshot, "max_rate": max_rate})
         while True:
             raw = await websocket.receive_text()
             msg = json.loads(raw)
-            await _handle_client_message(msg, room_id, room_manager, websocket)
+            await _handle_client_message(msg, room_id, room_manager, websocket, tasks)
     except WebSocketDisconnect:
         pass
     finally:
-        event_bus.unsubscribe("device_state_update", on_device_update)
         manager.disconnect(room_id, websocket)
+        for task in list(tasks):
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
-async def _handle_client_message(msg: dict, room_id: str, room_manager, websocket: WebSocket):
+async def _handle_client_message(
+    msg: dict, room_id: str, room_manager, websocket: WebSocket, tasks: set[asyncio.Task]
+):
     msg_type = msg.get("type")
 
     if msg_type == "command":
         device_id = msg.get("device_id")
         command = msg.get("command")
         params = msg.get("params", {})
+        if not isinstance(params, dict):
+            await websocket.send_json({"type": "error", "message": "params must be an object"})
+            return
         driver = room_manager.get_device(device_id)
         if not driver:
             await websocket.send_json({"type": "error", "message": f"Device {device_id!r} not found"})
             return
+        max_age = msg.get("max_age")
         try:
-            result = await driver.send_command(command, **params)
-            await websocket.send_json({"type": "command_result", "device_id": device_id, "result": str(result)})
+            source = "device"
+            if max_age is None:
+                result = await room_manager.send_command(device_id, command, **params)
+            else:
+                result, source = await room_manager.query_command(
+                    device_id, command, float(max_age), **params
+                )
+            await websocket.send_json({
+                "type": "command_result", "device_id": device_id, "result": str(result),
+                "source": source,
+            })
+        except CommandSuperseded as e:
+            # A newer command for the same setting replaced this one; not a device fault
+            await websocket.send_json(
+                {"type": "command_superseded", "device_id": device_id, "message": str(e)}
+            )
         except Exception as e:
             await websocket.send_json({"type": "error", "message": str(e)})
 
+    elif msg_type == "bulk_command":
+        request_id = msg.get("request_id")
+        entries = msg.get("commands")
+        try:
+            if not isinstance(entries, list) or not entries:
+                raise ValueError("commands must be a non-empty list")
+            if len(entries) > BULK_MAX_COMMANDS:
+                raise ValueError(f"At most {BULK_MAX_COMMANDS} commands per request")
+            commands = [_bulk_entry(e) for e in entries]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            await websocket.send_json({"type": "error", "message": f"Invalid bulk_command: {e}"})
+            return
+        task = asyncio.create_task(
+            _run_bulk(websocket, request_id, commands), name=f"ws-bulk:{room_id}"
+        )
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
     elif msg_type == "scene":
         scene_name = msg.get("scene_name")
-        room_data = room_manager.get_room(room_id)
-        scenes = room_data.get("scenes", []) if room_data else []
-        scene = next((s for s in scenes if s["name"] == scene_name), None)
+        room = room_manager.get_room(room_id)
+        scene = room.scenes.get(scene_name) if room else None
         if not scene:
             await websocket.send_json({"type": "error", "message": f"Scene {scene_name!r} not found"})
             return
-        results = []
-        for action in scene.get("actions", []):
-            did = action["device"]
-            cmd = action["command"]
-            params = action.get("params", {})
-            driver = room_manager.get_device(did)
-            if driver:
-                try:
-                    await driver.send_command(cmd, **params)
-                    results.append({"device": did, "ok": True})
-                except Exception as e:
-                    results.append({"device": did, "ok": False, "error": str(e)})
-        await websocket.send_json({"type": "scene_result", "scene": scene_name, "results": results})
+        result = await websocket.app.state.scene_engine.activate(scene)
+        await websocket.send_json({"type": "scene_result", **result})
+
+
+def _bulk_entry(entry: dict) -> BulkCommand:
+    params = entry.get("params") or {}
+    if not isinstance(params, dict):
+        raise TypeError(f"params must be an object, got {type(params).__name__}")
+    return BulkCommand(entry["device_id"], entry["command"], params)
+
+
+async def _run_bulk(websocket: WebSocket, request_id, commands: list[BulkCommand]) -> None:
+    start = time.perf_counter()
+    ok = 0
+    try:
+        async for result in websocket.app.state.bulk.run(commands):
+            ok += result["ok"]
+            await websocket.send_json(
+                {"type": "bulk_command_result", "request_id": request_id, **result}
+            )
+        await websocket.send_json({
+            "type": "bulk_command_done",
+            "request_id": request_id,
+            "total": len(commands),
+            "ok": ok,
+            "failed": len(commands) - ok,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+    except Exception:
+        # The client went away mid-batch; bulk.run cancels what is still queued
+        logger.debug("WS bulk_command aborted", exc_info=True)
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator, Mapping
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from devices.base import CommandSuperseded
+from devices.breaker import DeviceUnavailable
+
+if TYPE_CHECKING:
+    from core.state import RoomStateManager
+
+logger = logging.getLogger(__name__)
+
+BULK_CONCURRENCY = 64
+BULK_COMMAND_TIMEOUT = 10.0
+BULK_MAX_COMMANDS = 10000
+
+
+@dataclass(frozen=True, slots=True)
+class BulkCommand:
+    device_id: str
+    command: str
+    params: Mapping[str, Any]
+
+
+def _error_status(exc: BaseException) -> int:
+    """HTTP-style status for a failed command, matching the single-command endpoint."""
+    if isinstance(exc, DeviceUnavailable):
+        return 503
+    if isinstance(exc, CommandSuperseded):
+        return 409
+    if isinstance(exc, TimeoutError):
+        return 504
+    if isinstance(exc, ValueError):
+        return 400
+    return 502
+
+
+class BulkDispatcher:
+    """Runs batches of device commands, possibly across rooms.
+
+    Commands for different devices run concurrently, at most ``concurrency`` at
+    a time across all batches; commands for the same device run in the order
+    given. ``run`` yields each result as soon as its command finishes.
+    """
+
+    def __init__(
+        self,
+        room_manager: "RoomStateManager",
+        concurrency: int = BULK_CONCURRENCY,
+        command_timeout: float = BULK_COMMAND_TIMEOUT,
+    ):
+        self.room_manager = room_manager
+        self.concurrency = concurrency
+        self.command_timeout = command_timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(self, commands: list[BulkCommand]) -> AsyncIterator[dict]:
+        start = time.perf_counter()
+        done: asyncio.Queue[dict] = asyncio.Queue()
+        chains: dict[str, list[tuple[int, BulkCommand]]] = {}
+        for index, cmd in enumerate(commands):
+            chains.setdefault(cmd.device_id, []).append((index, cmd))
+
+        async def run_chain(chain: list[tuple[int, BulkCommand]]) -> None:
+            for index, cmd in chain:
+                done.put_nowait(await self._run_one(index, cmd, start))
+
+        tasks = [
+            asyncio.create_task(run_chain(chain), name=f"bulk:{device_id}")
+            for device_id, chain in chains.items()
+        ]
+        try:
+            for _ in range(len(commands)):
+                yield await done.get()
+        finally:
+            # The caller went away or finished; don't leave chains running behind it
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info(
+            f"Bulk run of {len(commands)} commands on {len(chains)} devices "
+            f"finished in {time.perf_counter() - start:.2f}s"
+        )
+
+    async def _run_one(self, index: int, cmd: BulkCommand, batch_start: float) -> dict:
+        result: dict[str, Any] = {
+            "index": index,
+            "device_id": cmd.device_id,
+            "command": cmd.command,
+        }
+        if self.room_manager.get_device(cmd.device_id) is None:
+            result.update(
+                ok=False, status=404, error=f"Device {cmd.device_id!r} not found",
+                duration_ms=0.0,
+                finished_ms=round((time.perf_counter() - batch_start) * 1000, 1),
+            )
+            return result
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                value = await asyncio.wait_for(
+                    self.room_manager.send_command(cmd.device_id, cmd.command, **cmd.params),
+                    self.command_timeout,
+                )
+                result.update(ok=True, status=200, result=None if value is None else str(value))
+            except TimeoutError as e:
+                result.update(
+                    ok=False, status=_error_status(e),
+                    error=f"Timed out after {self.command_timeout:g}s",
+                )
+            except Exception as e:  # noqa: BLE001 - reported in the command's result
+                result.update(ok=False, status=_error_status(e), error=str(e))
+        finished = time.perf_counter()
+        result["duration_ms"] = round((finished - started) * 1000, 1)
+        result["finished_ms"] = round((finished - batch_start) * 1000, 1)
+        return result
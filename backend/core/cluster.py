@@ -0,0 +1,557 @@
+"""Several API worker processes sharing one device owner.
+
+With ``cluster.enabled`` every uvicorn worker tries to take an exclusive lock
+file at startup. The worker that gets it becomes the owner: it polls devices
+and runs commands as usual, mirrors every published device state into a
+SQLite (WAL) store, and accepts commands from the other workers on a unix
+socket. The other workers are followers: they never talk to devices, read
+state from the store, republish it on their own EventBus (so REST,
+WebSockets and scenes work unchanged) and forward commands to the owner.
+"""
+import asyncio
+import fcntl
+import itertools
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import aiosqlite
+from core.config import ConfigIndex, DeviceConfig
+from core.snapshots import SnapshotCache
+from core.state import RoomStateManager
+from devices.base import CommandSuperseded, DeviceDriver, DeviceState, DeviceStatus
+from devices.breaker import DeviceUnavailable
+
+if TYPE_CHECKING:
+    from core.event_bus import EventBus
+    from core.plugin_loader import PluginLoader
+
+logger = logging.getLogger(__name__)
+
+SYNC_INTERVAL = 0.1
+OWNER_WAIT = 30.0  # how long a follower waits at startup for the owner's store
+OWNER_TIMEOUT_SYNCS = 10  # missed owner heartbeats before followers report devices unknown
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_state (
+    device_id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    written_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS device_state_seq ON device_state (seq);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class OwnerLease:
+    """An exclusive, non-blocking lock on a file, released when the process exits."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: int | None = None
+
+    def acquire(self) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class ClusterOwner:
+    """Owner side: mirrors published states into the store and serves forwarded commands."""
+
+    def __init__(
+        self,
+        room_manager: RoomStateManager,
+        directory: Path,
+        sync_interval: float = SYNC_INTERVAL,
+    ):
+        self.room_manager = room_manager
+        self.db_path = directory / "state.db"
+        self.socket_path = directory / "commands.sock"
+        self.sync_interval = sync_interval
+        self.commands = 0
+        self._pending: dict[str, dict] = {}
+        self._seq = 0
+        self._room_config: dict[str, int] = {}
+        self._db: aiosqlite.Connection | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._db = await _open_store(self.db_path)
+        cur = await self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM device_state")
+        (self._seq,) = await cur.fetchone()
+        known = list(self.room_manager.index.devices)
+        await self._db.execute(
+            f"DELETE FROM device_state WHERE device_id NOT IN ({','.join('?' * len(known))})",
+            known,
+        )
+        # Followers number their snapshots from here so ETags and ?since= agree across workers
+        self._room_config = dict(self.room_manager.snapshots.room_configs)
+        await self._db.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('version', ?), ('owner_pid', ?), "
+            "('room_config', ?), ('heartbeat', ?)",
+            (
+                str(self.room_manager.snapshots.base), str(os.getpid()),
+                json.dumps(self._room_config), repr(time.time()),
+            ),
+        )
+        await self._db.commit()
+        self.room_manager.event_bus.subscribe("device_state_update", self._on_state_update)
+
+        self.socket_path.unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(self._serve, path=str(self.socket_path))
+        self._task = asyncio.create_task(self._writer(), name="cluster-writer")
+        logger.info(f"Cluster owner (pid {os.getpid()}): polling devices for all workers")
+
+    async def stop(self) -> None:
+        self.room_manager.event_bus.unsubscribe("device_state_update", self._on_state_update)
+        if self._server is not None:
+            self._server.close()
+            self.socket_path.unlink(missing_ok=True)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._db is not None:
+            await self._flush()
+            await self._db.close()
+            self._db = None
+
+    async def _on_state_update(self, data: dict) -> None:
+        self._pending[data["device_id"]] = data
+
+    async def _writer(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self._flush()
+            except Exception:
+                logger.exception("Cluster state write failed")
+
+    async def _flush(self) -> None:
+        if self._db is None:
+            return
+        # A config reload renumbers rooms; followers adopt these rather than their own
+        room_config = dict(self.room_manager.snapshots.room_configs)
+        pending, self._pending = self._pending, {}
+        rows = []
+        now = time.time()
+        for device_id, data in pending.items():
+            self._seq += 1
+            version = self.room_manager.snapshots.changed_version(device_id)
+            rows.append((device_id, self._seq, version, now, json.dumps(data)))
+        if rows:
+            await self._db.executemany(
+                "INSERT OR REPLACE INTO device_state VALUES (?, ?, ?, ?, ?)", rows
+            )
+        # Written every cycle, even when nothing changed, so followers can tell a quiet
+        # fleet from an owner that has stopped
+        await self._db.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('heartbeat', ?)", (repr(now),)
+        )
+        if room_config != self._room_config:
+            await self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('room_config', ?)", (json.dumps(room_config),)
+            )
+        await self._db.commit()
+        self._room_config = room_config
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        tasks: set[asyncio.Task] = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._run_command(json.loads(line), writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError) as e:
+            logger.debug(f"Cluster command connection closed: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _run_command(self, request: dict, writer: asyncio.StreamWriter) -> None:
+        self.commands += 1
+        response: dict[str, Any] = {"id": request["id"]}
+        try:
+            source = "device"
+            if request.get("max_age") is None:
+                result = await self.room_manager.send_command(
+                    request["device_id"], request["command"], **request.get("params", {})
+                )
+            else:
+                result, source = await self.room_manager.query_command(
+                    request["device_id"], request["command"], request["max_age"],
+                    **request.get("params", {}),
+                )
+            response.update(ok=True, result=None if result is None else str(result), source=source)
+        except DeviceUnavailable as e:
+            response.update(
+                ok=False, error="unavailable", message=str(e),
+                retry_after=e.retry_after, last_error=e.last_error,
+            )
+        except CommandSuperseded as e:
+            response.update(ok=False, error="superseded", message=str(e))
+        except KeyError:
+            response.update(ok=False, error="unknown_device", message=request["device_id"])
+        except ValueError as e:
+            response.update(ok=False, error="invalid", message=str(e))
+        except TimeoutError:
+            response.update(ok=False, error="timeout", message="Device timed out")
+        except Exception as e:  # noqa: BLE001 - handed to the follower in the response
+            response.update(ok=False, error="device", message=str(e) or type(e).__name__)
+        try:
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+        except ConnectionError:
+            pass  # the follower went away; it will see its call fail
+
+    def cluster_stats(self) -> dict:
+        return {"role": "owner", "pid": os.getpid(), "forwarded_commands": self.commands}
+
+
+class CommandClient:
+    """Follower side of the command socket: many calls in flight over one connection."""
+
+    def __init__(self, socket_path: Path):
+        self.socket_path = socket_path
+        self._ids = itertools.count(1)
+        self._calls: dict[int, asyncio.Future] = {}
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._connect_lock = asyncio.Lock()
+
+    async def call(
+        self, device_id: str, command: str, params: dict, max_age: float | None = None
+    ) -> tuple[Any, str]:
+        """Run a command on the owner; returns (result, source) as from query_command."""
+        try:
+            writer = await self._connection()
+        except OSError as e:
+            raise DeviceUnavailable(device_id, 1.0, f"device owner not reachable: {e}") from e
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._calls[call_id] = future
+        try:
+            writer.write((json.dumps({
+                "id": call_id, "device_id": device_id, "command": command, "params": params,
+                "max_age": max_age,
+            }) + "\n").encode())
+            await writer.drain()
+            response = await future
+        except OSError as e:
+            raise DeviceUnavailable(device_id, 1.0, f"device owner not reachable: {e}") from e
+        finally:
+            self._calls.pop(call_id, None)
+        if response["ok"]:
+            return response.get("result"), response.get("source", "device")
+        raise _remote_error(device_id, response)
+
+    async def _connection(self) -> asyncio.StreamWriter:
+        async with self._connect_lock:
+            if self._writer is None or self._writer.is_closing():
+                reader, self._writer = await asyncio.open_unix_connection(str(self.socket_path))
+                self._reader_task = asyncio.create_task(
+                    self._read_responses(reader), name="cluster-command-reader"
+                )
+            return self._writer
+
+    async def _read_responses(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while line := await reader.readline():
+                response = json.loads(line)
+                future = self._calls.get(response["id"])
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for future in self._calls.values():
+                if not future.done():
+                    future.set_exception(ConnectionResetError("device owner closed the connection"))
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+
+def _remote_error(device_id: str, response: dict) -> Exception:
+    """Rebuild the owner's exception so routes answer exactly as on the owner."""
+    error, message = response.get("error"), response.get("message", "")
+    if error == "unavailable":
+        return DeviceUnavailable(
+            device_id, response.get("retry_after", 1.0), response.get("last_error")
+        )
+    if error == "superseded":
+        return CommandSuperseded(message)
+    if error == "unknown_device":
+        return DeviceUnavailable(device_id, 1.0, "not loaded by the device owner")
+    if error == "invalid":
+        return ValueError(message)
+    if error == "timeout":
+        return TimeoutError(message)
+    return RuntimeError(message)
+
+
+class RemoteDriver(DeviceDriver):
+    """A follower's stand-in for a device owned by another process."""
+
+    def __init__(self, device_id: str, config: dict, client: CommandClient):
+        super().__init__(device_id, config)
+        self.client = client
+        self._state.status = DeviceStatus.CONNECTING
+
+    async def connect(self) -> bool:
+        return True
+
+    async def disconnect(self) -> None:
+        pass
+
+    async def get_state(self) -> DeviceState:
+        return self._state
+
+    async def send_command(self, command: str, **kwargs) -> Any:
+        result, _ = await self.client.call(self.device_id, command, kwargs)
+        return result
+
+    async def execute(self, command: str, priority: int = 0, **kwargs) -> Any:
+        # Queueing, coalescing and the circuit breaker all happen in the owner
+        return await self.send_command(command, **kwargs)
+
+    async def poll(self) -> DeviceState:
+        return self._state
+
+
+class FollowerStateManager(RoomStateManager):
+    """RoomStateManager for a worker that doesn't own the devices.
+
+    Device state comes from the owner's store and commands are forwarded to
+    the owner; config reloads only rebuild the local room index, and room
+    config versions (part of the ETags) come from the owner too. If the
+    owner's heartbeat stops for ``OWNER_TIMEOUT_SYNCS`` sync intervals, every
+    device is reported unknown until it comes back.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        plugin_loader: "PluginLoader",
+        event_bus: "EventBus",
+        directory: Path,
+        sync_interval: float = SYNC_INTERVAL,
+    ):
+        super().__init__(config, plugin_loader, event_bus)
+        self.notifications = None
+        self.db_path = directory / "state.db"
+        self.sync_interval = sync_interval
+        self.client = CommandClient(directory / "commands.sock")
+        self._seq = 0
+        self._room_config_raw: str | None = None
+        self._room_configs: dict[str, int] = {}
+        self._db: aiosqlite.Connection | None = None
+        self._sync_task: asyncio.Task | None = None
+        self.owner_timeout = OWNER_TIMEOUT_SYNCS * sync_interval
+        self.owner_connected = False
+        # Seconds since the owner's last heartbeat
+        self.lag = 0.0
+
+    async def startup(self) -> None:
+        for device_id, dev in self.index.devices.items():
+            self._load_driver(device_id, dev)
+        self._db = await self._wait_for_owner()
+        if self._db is not None:
+            await self._sync()
+        self._sync_task = asyncio.create_task(self._sync_loop(), name="cluster-sync")
+        logger.info(f"Cluster follower (pid {os.getpid()}): reading state from {self.db_path}")
+
+    async def _wait_for_owner(self) -> aiosqlite.Connection | None:
+        deadline = time.monotonic() + OWNER_WAIT
+        while True:
+            if self.db_path.exists():
+                db = await _open_store(self.db_path, readonly=True)
+                try:
+                    cur = await db.execute("SELECT value FROM meta WHERE key = 'version'")
+                    row = await cur.fetchone()
+                except aiosqlite.OperationalError:
+                    row = None  # the owner hasn't created the schema yet
+                if row is not None:
+                    return db
+                await db.close()
+            if time.monotonic() > deadline:
+                logger.warning("No cluster owner yet; serving config only until one appears")
+                return None
+            await asyncio.sleep(self.sync_interval)
+
+    def _resync(self, base: int) -> None:
+        # Replay the whole store into a cache numbered from the owner's base, so versions
+        # agree with the owner again after startup or an outage
+        self.snapshots = SnapshotCache(self.index, base=base)
+        self._seq = 0
+        self._room_config_raw = None
+        for device_id, driver in self.devices.items():
+            self._cache_local(device_id, driver)
+
+    async def _owner_lost(self) -> None:
+        logger.warning(
+            f"Cluster owner silent for {self.lag:.1f}s; reporting its devices as unknown"
+        )
+        self.owner_connected = False
+        # Numbered from the clock, far past the owner's counter, so no ETag is shared
+        version = time.time_ns() // 1000
+        for device_id, driver in self.devices.items():
+            driver.state.update(status=DeviceStatus.UNKNOWN)
+            state = driver.state.to_dict()
+            self.snapshots.update(device_id, state, version=version)
+            await self.event_bus.publish("device_state_update", {
+                "device_id": device_id,
+                "state": state,
+                "version": self.versions.get(device_id, 0),
+                "changed": True,
+                "heartbeat": False,
+            })
+
+    def _load_driver(self, device_id: str, dev: DeviceConfig) -> DeviceDriver:
+        driver = RemoteDriver(device_id, dict(dev.raw.get("config", {})), self.client)
+        self.devices[device_id] = driver
+        self._cache_local(device_id, driver)
+        return driver
+
+    def _reindex(self, index: ConfigIndex, rooms_changed: frozenset[str]) -> None:
+        # Numbering the changed rooms here would diverge from the owner's versions
+        self.snapshots.set_index(index, (), bump=False)
+        self.snapshots.set_room_configs(self._room_configs)
+
+    def _cache_local(self, device_id: str, driver: DeviceDriver) -> None:
+        # Only the owner numbers versions; a local placeholder must not advance them
+        self.snapshots.update(device_id, driver.state.to_dict(), version=self.snapshots.version)
+
+    async def _connect_device(self, device_id: str, driver: DeviceDriver) -> None:
+        pass  # the owner connects
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                if self._db is None:
+                    self._db = await self._wait_for_owner()
+                if self._db is not None:
+                    await self._sync()
+            except Exception:
+                logger.exception("Cluster state sync failed")
+
+    async def _sync(self) -> None:
+        assert self._db is not None
+        cur = await self._db.execute(
+            "SELECT key, value FROM meta WHERE key IN ('version', 'heartbeat', 'room_config')"
+        )
+        meta = dict(await cur.fetchall())
+        self.lag = max(0.0, time.time() - float(meta.get("heartbeat", 0)))
+        if self.lag > self.owner_timeout:
+            if self.owner_connected:
+                await self._owner_lost()
+            return
+        if not self.owner_connected:
+            self._resync(int(meta["version"]))
+            self.owner_connected = True
+            logger.info(f"Cluster follower (pid {os.getpid()}): following the owner")
+        cur = await self._db.execute(
+            "SELECT seq, version, written_at, data FROM device_state WHERE seq > ? ORDER BY seq",
+            (self._seq,),
+        )
+        rows = await cur.fetchall()
+        for seq, version, _written_at, data in rows:
+            self._seq = max(self._seq, seq)
+            await self._apply(json.loads(data), version)
+        raw = meta.get("room_config")
+        if raw is not None and raw != self._room_config_raw:
+            self._room_config_raw = raw
+            self._room_configs = {room: int(v) for room, v in json.loads(raw).items()}
+            self.snapshots.set_room_configs(self._room_configs)
+
+    async def _apply(self, data: dict, version: int) -> None:
+        device_id = data["device_id"]
+        driver = self.devices.get(device_id)
+        if driver is None:
+            return  # not in this worker's config (yet)
+        state = data["state"]
+        driver.state.update(**state)
+        self.versions[device_id] = data.get("version", 0)
+        self._last_states[device_id] = state
+        # Heartbeat rows carry the owner's last version, so this is a no-op for an
+        # unchanged device but restores it when replaying the store after a resync
+        self.snapshots.update(device_id, state, version=version)
+        await self.event_bus.publish("device_state_update", data)
+
+    async def send_command(self, device_id: str, command: str, **kwargs) -> Any:
+        return await self.devices[device_id].execute(command, **kwargs)
+
+    async def query_command(
+        self, device_id: str, command: str, max_age: float, **kwargs
+    ) -> tuple[Any, str]:
+        # Only the owner knows how fresh its polls are
+        return await self.devices[device_id].client.call(device_id, command, kwargs, max_age)
+
+    def breaker_stats(self) -> dict:
+        tripped = {
+            did: {"state": drv.state.breaker}
+            for did, drv in self.devices.items()
+            if drv.state.breaker != "closed"
+        }
+        return {"open": len(tripped), "devices": tripped}
+
+    def cluster_stats(self) -> dict:
+        return {
+            "role": "follower",
+            "pid": os.getpid(),
+            "owner_connected": self.owner_connected,
+            "synced_seq": self._seq,
+            "lag_ms": round(self.lag * 1000, 1),
+        }
+
+    async def shutdown(self) -> None:
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+        await self.client.close()
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+        logger.info("Cluster follower stopped")
+
+
+async def _open_store(path: Path, readonly: bool = False) -> aiosqlite.Connection:
+    if readonly:
+        # Followers only read; the owner sets WAL mode and creates the schema
+        return await aiosqlite.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = await aiosqlite.connect(path)
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.executescript(SCHEMA)
+    await db.commit()
+    return db
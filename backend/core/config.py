@@ -1,29 +1,247 @@
+import copy
+import hashlib
 import os
+from collections.abc import Mapping
+from dataclasses import dataclass
 from pathlib import Path
+from types import MappingProxyType
+from typing import Any
+
 import yaml
 
 # Support running from backend/ or project root
-_THIS_DIR = Path(__file__).parent.parent.parent  # project root
+PROJECT_ROOT = Path(__file__).parent.parent.parent
 
-CONFIG_PATH = Path(os.getenv("NOMY_CONFIG", str(_THIS_DIR / "config" / "nomy.yaml")))
-ROOMS_DIR = Path(os.getenv("NOMY_ROOMS_DIR", str(_THIS_DIR / "config" / "rooms")))
+CONFIG_PATH = Path(os.getenv("NOMY_CONFIG", str(PROJECT_ROOT / "config" / "nomy.yaml")))
+ROOMS_DIR = Path(os.getenv("NOMY_ROOMS_DIR", str(PROJECT_ROOT / "config" / "rooms")))
 
 
 def load_config() -> dict:
     """Load global config and all room configs."""
-    config = {}
-
-    if CONFIG_PATH.exists():
-        with open(CONFIG_PATH) as f:
-            config = yaml.safe_load(f) or {}
-
-    config["rooms"] = {}
-    if ROOMS_DIR.exists():
-        for room_file in ROOMS_DIR.glob("*.yaml"):
-            with open(room_file) as f:
-                room_data = yaml.safe_load(f)
-                if room_data and "room" in room_data:
-                    room_id = room_data["room"]["id"]
-                    config["rooms"][room_id] = room_data
-
-    return config
+    return ConfigLoader().load()
+
+
+class ConfigLoader:
+    """Loads the config files, reparsing only files whose mtime and content changed."""
+
+    def __init__(self, config_path: Path = CONFIG_PATH, rooms_dir: Path = ROOMS_DIR):
+        self.config_path = config_path
+        self.rooms_dir = rooms_dir
+        # path -> (mtime_ns, sha1 of content, parsed YAML)
+        self._files: dict[Path, tuple[int, str, Any]] = {}
+
+    def _paths(self) -> list[Path]:
+        paths = [self.config_path] if self.config_path.exists() else []
+        if self.rooms_dir.exists():
+            paths.extend(sorted(self.rooms_dir.glob("*.yaml")))
+        return paths
+
+    def changed(self) -> bool:
+        """Cheap mtime-only check for added, removed or modified files."""
+        paths = self._paths()
+        if set(paths) != set(self._files):
+            return True
+        for path in paths:
+            try:
+                if path.stat().st_mtime_ns != self._files[path][0]:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+
+    def revision(self) -> tuple[tuple[Path, int], ...]:
+        """The current files and their mtimes; changes whenever ``changed()`` would notice."""
+        revision = []
+        for path in self._paths():
+            try:
+                revision.append((path, path.stat().st_mtime_ns))
+            except FileNotFoundError:
+                continue
+        return tuple(revision)
+
+    def _read(self, path: Path) -> Any:
+        mtime = path.stat().st_mtime_ns
+        cached = self._files.get(path)
+        if cached and cached[0] == mtime:
+            return cached[2]
+        content = path.read_bytes()
+        digest = hashlib.sha1(content).hexdigest()
+        if cached and cached[1] == digest:
+            data = cached[2]  # touched but unchanged
+        else:
+            data = yaml.safe_load(content)
+        self._files[path] = (mtime, digest, data)
+        return data
+
+    def load(self) -> dict:
+        paths = self._paths()
+        for stale in set(self._files) - set(paths):
+            del self._files[stale]
+
+        config = {}
+        if self.config_path in paths:
+            config = dict(self._read(self.config_path) or {})
+
+        config["rooms"] = {}
+        for room_file in paths:
+            if room_file == self.config_path:
+                continue
+            room_data = self._read(room_file)
+            if room_data and "room" in room_data:
+                room_id = room_data["room"]["id"]
+                config["rooms"][room_id] = room_data
+
+        return config
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceConfig:
+    id: str
+    room_id: str
+    name: str
+    type: str | None
+    driver: str | None
+    poll_interval: float | None
+    raw: Mapping[str, Any]
+
+
+@dataclass(frozen=True, slots=True)
+class SceneAction:
+    device: str
+    command: str
+    params: Mapping[str, Any]
+    stage: int = 0
+    timeout: float | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class SceneConfig:
+    name: str
+    actions: tuple[SceneAction, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class RoomConfig:
+    id: str
+    name: str
+    description: str
+    devices: tuple[DeviceConfig, ...]
+    device_ids: tuple[str, ...]
+    device_set: frozenset[str]
+    scenes: Mapping[str, SceneConfig]
+    raw: Mapping[str, Any]
+
+
+@dataclass(frozen=True, slots=True)
+class ConfigIndex:
+    """Immutable lookup tables compiled from the YAML config."""
+
+    rooms: Mapping[str, RoomConfig]
+    devices: Mapping[str, DeviceConfig]
+
+    def room_of(self, device_id: str) -> RoomConfig | None:
+        dev = self.devices.get(device_id)
+        return self.rooms.get(dev.room_id) if dev else None
+
+
+def compile_room(room_id: str, room_data: dict) -> RoomConfig:
+    """Build a RoomConfig, raising ValueError for scenes that reference unknown devices.
+
+    ``raw`` and ``params`` wrap deep copies, so later edits to the loaded dict can't leak in.
+    """
+    room_info = room_data.get("room", {})
+    devices = []
+    for dev in room_data.get("devices", []):
+        interval = dev.get("poll_interval")
+        devices.append(DeviceConfig(
+            id=dev["id"],
+            room_id=room_id,
+            name=dev.get("name", dev["id"]),
+            type=dev.get("type"),
+            driver=dev.get("driver"),
+            poll_interval=float(interval) if interval is not None else None,
+            raw=MappingProxyType(copy.deepcopy(dev)),
+        ))
+    device_set = frozenset(d.id for d in devices)
+
+    scenes = {}
+    for scene in room_data.get("scenes", []):
+        name = scene["name"]
+        actions = []
+        for action in scene.get("actions", []):
+            did, cmd = action.get("device"), action.get("command")
+            if did not in device_set:
+                raise ValueError(f"Room {room_id!r} scene {name!r}: unknown device {did!r}")
+            if not isinstance(cmd, str) or not cmd:
+                raise ValueError(
+                    f"Room {room_id!r} scene {name!r}: action for {did!r} has no command"
+                )
+            timeout = action.get("timeout")
+            actions.append(SceneAction(
+                device=did,
+                command=cmd,
+                params=MappingProxyType(copy.deepcopy(dict(action.get("params") or {}))),
+                stage=int(action.get("stage", 0)),
+                timeout=float(timeout) if timeout is not None else None,
+            ))
+        scenes[name] = SceneConfig(name=name, actions=tuple(actions))
+
+    return RoomConfig(
+        id=room_id,
+        name=room_info.get("name", room_id),
+        description=room_info.get("description", ""),
+        devices=tuple(devices),
+        device_ids=tuple(d.id for d in devices),
+        device_set=device_set,
+        scenes=MappingProxyType(scenes),
+        raw=MappingProxyType(copy.deepcopy(room_data)),
+    )
+
+
+def compile_config(config: dict) -> ConfigIndex:
+    """Compile the rooms of a loaded config into O(1) lookup tables."""
+    rooms: dict[str, RoomConfig] = {}
+    devices: dict[str, DeviceConfig] = {}
+    for room_id, room_data in config.get("rooms", {}).items():
+        room = compile_room(room_id, room_data)
+        for dev in room.devices:
+            if dev.id in devices:
+                raise ValueError(
+                    f"Device {dev.id!r} is defined in both {devices[dev.id].room_id!r} "
+                    f"and {room_id!r}"
+                )
+            devices[dev.id] = dev
+        rooms[room_id] = room
+    return ConfigIndex(rooms=MappingProxyType(rooms), devices=MappingProxyType(devices))
+
+
+@dataclass(frozen=True, slots=True)
+class ConfigDiff:
+    rooms_added: frozenset[str]
+    rooms_removed: frozenset[str]
+    rooms_changed: frozenset[str]
+    devices_added: frozenset[str]
+    devices_removed: frozenset[str]
+    devices_changed: frozenset[str]
+
+    def __bool__(self) -> bool:
+        return any((
+            self.rooms_added, self.rooms_removed, self.rooms_changed,
+            self.devices_added, self.devices_removed, self.devices_changed,
+        ))
+
+
+def diff_config(old: ConfigIndex, new: ConfigIndex) -> ConfigDiff:
+    """Compare two compiled configs room by room and device by device."""
+    old_rooms, new_rooms = old.rooms.keys(), new.rooms.keys()
+    old_devs, new_devs = old.devices.keys(), new.devices.keys()
+    return ConfigDiff(
+        rooms_added=frozenset(new_rooms - old_rooms),
+        rooms_removed=frozenset(old_rooms - new_rooms),
+        rooms_changed=frozenset(r for r in new_rooms & old_rooms if old.rooms[r] != new.rooms[r]),
+        devices_added=frozenset(new_devs - old_devs),
+        devices_removed=frozenset(old_devs - new_devs),
+        devices_changed=frozenset(
+            d for d in new_devs & old_devs if old.devices[d] != new.devices[d]
+        ),
+    )
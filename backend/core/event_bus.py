@@ -1,29 +1,173 @@
 import asyncio
 import logging
-from collections import defaultdict
-from typing import Any, Callable, Coroutine
+import time
+from collections import OrderedDict, defaultdict
+from collections.abc import Callable, Coroutine, Hashable
+from typing import Any, Literal
+
+from core.metrics import EVENT_PUBLISH_SECONDS, Histogram
 
 logger = logging.getLogger(__name__)
 
+Overflow = Literal["drop_oldest", "coalesce"]
+
+
+class _Subscriber:
+    """A handler, optionally fed through its own bounded queue and worker task."""
+
+    def __init__(
+        self,
+        event_type: str,
+        handler: Callable[..., Coroutine],
+        queue_size: int | None = None,
+        overflow: Overflow = "drop_oldest",
+        key: Callable[[Any], Hashable] | None = None,
+    ):
+        if overflow == "coalesce" and key is None:
+            raise ValueError("overflow='coalesce' needs a key function")
+        self.event_type = event_type
+        self.handler = handler
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.key = key
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+        # seq -> (data, enqueued_at, key); key is only computed when coalescing
+        self._pending: OrderedDict[int, tuple[Any, float, Hashable]] = OrderedDict()
+        # key -> seq of its newest queued event, for coalescing on overflow
+        self._latest: dict[Hashable, int] = {}
+        self._seq = 0
+        self._ready = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def name(self) -> str:
+        return getattr(self.handler, "__qualname__", repr(self.handler))
+
+    async def call(self, data: Any) -> None:
+        try:
+            await self.handler(data)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Event handler error for {self.event_type}: {e}")
+        else:
+            self.delivered += 1
+
+    def offer(self, data: Any) -> None:
+        """Queue an event without waiting; when full, drop the oldest or coalesce by key."""
+        key = self.key(data) if self.overflow == "coalesce" else None
+        if len(self._pending) >= self.queue_size:
+            seq = self._latest.get(key) if key is not None else None
+            if seq is not None:
+                # Replace the newest queued event for this key in place
+                self._pending[seq] = (data, self._pending[seq][1], key)
+                self.coalesced += 1
+                return
+            self._pop()
+            self.dropped += 1
+        self._seq += 1
+        self._pending[self._seq] = (data, time.monotonic(), key)
+        if key is not None:
+            self._latest[key] = self._seq
+        self._ready.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"bus:{self.name}")
+
+    def _pop(self) -> Any:
+        seq, (data, _, key) = self._pending.popitem(last=False)
+        if key is not None and self._latest.get(key) == seq:
+            del self._latest[key]
+        return data
+
+    async def _run(self) -> None:
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._pending:
+                await self.call(self._pop())
+
+    def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        oldest = next(iter(self._pending.values()), None)
+        return {
+            "handler": self.name,
+            "queued": len(self._pending) if self.queue_size else None,
+            "queue_size": self.queue_size,
+            "overflow": self.overflow if self.queue_size else None,
+            "lag_ms": round((time.monotonic() - oldest[1]) * 1000, 1) if oldest else 0.0,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+        }
+
 
 class EventBus:
-    """Simple async pub/sub event bus for internal communication."""
+    """Simple async pub/sub event bus for internal communication.
+
+    Plain subscribers are awaited concurrently by ``publish``. Subscribers
+    registered with a ``queue_size`` get their own bounded queue and worker, so
+    publishing to them never waits. Events are delivered in order; only when the
+    queue is full is the oldest event dropped, or with ``overflow="coalesce"`` a
+    newer event replaces the queued one with the same ``key``.
+    """
 
     def __init__(self):
-        self._subscribers: dict[str, list[Callable]] = defaultdict(list)
+        self._subscribers: dict[str, list[_Subscriber]] = defaultdict(list)
+        # Metric child per event type, resolved once rather than on every publish
+        self._timers: dict[str, Histogram] = {}
 
-    def subscribe(self, event_type: str, handler: Callable[..., Coroutine]) -> None:
-        self._subscribers[event_type].append(handler)
+    def subscribe(
+        self,
+        event_type: str,
+        handler: Callable[..., Coroutine],
+        queue_size: int | None = None,
+        overflow: Overflow = "drop_oldest",
+        key: Callable[[Any], Hashable] | None = None,
+    ) -> None:
+        self._subscribers[event_type].append(
+            _Subscriber(event_type, handler, queue_size, overflow, key)
+        )
+        self._timer(event_type)
 
     def unsubscribe(self, event_type: str, handler: Callable) -> None:
-        handlers = self._subscribers.get(event_type, [])
-        if handler in handlers:
-            handlers.remove(handler)
+        subs = self._subscribers.get(event_type, [])
+        for sub in subs:
+            if sub.handler == handler:
+                sub.close()
+                subs.remove(sub)
+                break
 
     async def publish(self, event_type: str, data: Any = None) -> None:
-        handlers = self._subscribers.get(event_type, [])
-        for handler in handlers:
-            try:
-                await handler(data)
-            except Exception as e:
-                logger.error(f"Event handler error for {event_type}: {e}")
+        t0 = time.perf_counter()
+        direct = []
+        for sub in self._subscribers.get(event_type, []):
+            if sub.queue_size:
+                sub.offer(data)
+            else:
+                direct.append(sub.call(data))
+        if len(direct) == 1:
+            await direct[0]
+        elif direct:
+            await asyncio.gather(*direct)
+        timer = self._timers.get(event_type) or self._timer(event_type)
+        timer.observe(time.perf_counter() - t0)
+
+    def _timer(self, event_type: str) -> Histogram:
+        timer = self._timers.get(event_type)
+        if timer is None:
+            timer = self._timers[event_type] = EVENT_PUBLISH_SECONDS.labels(event_type)
+        return timer
+
+    def stats(self) -> dict[str, list[dict]]:
+        return {
+            event_type: [sub.stats() for sub in subs]
+            for event_type, subs in self._subscribers.items()
+            if subs
+        }
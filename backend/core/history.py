@@ -0,0 +1,300 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import aiosqlite
+
+if TYPE_CHECKING:
+    from core.event_bus import EventBus
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_state (
+    device_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    until REAL NOT NULL,
+    status TEXT,
+    power INTEGER,
+    extra TEXT,
+    PRIMARY KEY (device_id, ts)
+) WITHOUT ROWID;
+"""
+
+# The sample in effect at `start` may have begun earlier, so it is included too
+_SAMPLES_SQL = (
+    "SELECT ts, until, status, power, extra FROM device_state "
+    "WHERE device_id = ? AND ts <= ? AND ts >= COALESCE("
+    "(SELECT MAX(ts) FROM device_state WHERE device_id = ? AND ts <= ?), ?) "
+    "ORDER BY ts LIMIT ?"
+)
+AGGREGATE_CHUNK = 1000
+
+
+class HistoryStore:
+    """Write-behind device state history on SQLite.
+
+    Fed by ``device_state_update`` events. Events are queued and written in
+    batches by a background task, so publishers never wait on disk. A sample
+    identical to the device's previous one (e.g. a heartbeat) only extends that
+    sample's ``until`` time instead of adding a row.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        retention_days: float = 30,
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+        queue_size: int = 10000,
+        gap_tolerance: float = 300.0,
+    ):
+        self.path = Path(path)
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # A sample is assumed to hold until the next one unless the gap is longer than this
+        self.gap_tolerance = gap_tolerance
+        self.dropped = 0
+        self._queue: asyncio.Queue[tuple[str, float, tuple]] = asyncio.Queue(queue_size)
+        self._last: dict[str, tuple[tuple, float]] = {}
+        # Samples taken off the queue but not yet committed; stop() writes them
+        self._held: list[tuple[str, float, tuple]] = []
+        self._db: aiosqlite.Connection | None = None
+        self._readonly = False
+        self._event_bus: EventBus | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self, event_bus: "EventBus", record: bool = True) -> None:
+        """Open the database; with ``record=False`` only serve queries (e.g. a cluster follower).
+
+        A reader opens the file read-only once it exists and leaves the schema to the writer.
+        """
+        if not record:
+            self._readonly = True
+            await self._connection()
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = await aiosqlite.connect(self.path)
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA synchronous=NORMAL")
+        await self._db.executescript(SCHEMA)
+        await self._db.commit()
+        self._event_bus = event_bus
+        event_bus.subscribe("device_state_update", self._on_state_update)
+        self._tasks = [
+            asyncio.create_task(self._writer(), name="history-writer"),
+            asyncio.create_task(self._retention(), name="history-retention"),
+        ]
+        logger.info(f"State history at {self.path} (retention {self.retention_days} days)")
+
+    async def _connection(self) -> aiosqlite.Connection | None:
+        """The open database, or None while a reader waits for the writer to create it."""
+        if self._db is None and self._readonly and self.path.exists():
+            db = await aiosqlite.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True)
+            if self._db is None:
+                self._db = db
+            else:
+                await db.close()  # a concurrent query opened it first
+        return self._db
+
+    async def stop(self) -> None:
+        if self._event_bus:
+            self._event_bus.unsubscribe("device_state_update", self._on_state_update)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._db and not self._readonly:
+            held, self._held = self._held, []
+            await self._flush(held)
+            while not self._queue.empty():
+                await self._flush(self._drain())
+        if self._db:
+            await self._db.close()
+            self._db = None
+
+    async def _on_state_update(self, data: dict) -> None:
+        state = data["state"]
+        sample = (
+            state.get("status"),
+            state.get("power"),
+            json.dumps(state.get("extra", {}), sort_keys=True),
+        )
+        item = (data["device_id"], time.time(), sample)
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Drop the oldest sample rather than block the publisher
+            self._queue.get_nowait()
+            self._queue.put_nowait(item)
+            self.dropped += 1
+
+    def _drain(self) -> list[tuple[str, float, tuple]]:
+        items = []
+        while not self._queue.empty() and len(items) < self.batch_size:
+            items.append(self._queue.get_nowait())
+        return items
+
+    async def _writer(self) -> None:
+        while True:
+            self._held = [await self._queue.get()]
+            await asyncio.sleep(self.flush_interval)
+            self._held.extend(self._drain())
+            try:
+                await self._flush(self._held)
+            except Exception:
+                logger.exception(f"History write failed, {len(self._held)} samples lost")
+            self._held = []
+
+    async def _flush(self, items: list[tuple[str, float, tuple]]) -> None:
+        if not items or self._db is None:
+            return
+        inserts: list[tuple] = []
+        touches: dict[tuple[str, float], float] = {}
+        # Only adopted once committed, so a failed batch can't leave _last naming missing rows
+        last_rows: dict[str, tuple[tuple, float]] = {}
+        for device_id, ts, sample in items:
+            last = last_rows.get(device_id) or self._last.get(device_id)
+            if last and last[0] == sample:
+                touches[(device_id, last[1])] = ts
+                continue
+            status, power, extra = sample
+            power_int = None if power is None else int(power)
+            inserts.append((device_id, ts, ts, status, power_int, extra))
+            last_rows[device_id] = (sample, ts)
+        try:
+            await self._db.executemany(
+                "INSERT OR REPLACE INTO device_state VALUES (?, ?, ?, ?, ?, ?)", inserts
+            )
+            await self._db.executemany(
+                "UPDATE device_state SET until = ? WHERE device_id = ? AND ts = ?",
+                [(until, did, ts) for (did, ts), until in touches.items()],
+            )
+            await self._db.commit()
+        except Exception:
+            await self._db.rollback()
+            raise
+        self._last.update(last_rows)
+
+    async def _retention(self) -> None:
+        while True:
+            if self._db is not None:
+                cutoff = time.time() - self.retention_days * 86400
+                try:
+                    cur = await self._db.execute(
+                        "DELETE FROM device_state WHERE until < ?", (cutoff,)
+                    )
+                    await self._db.commit()
+                    if cur.rowcount:
+                        logger.info(f"History retention removed {cur.rowcount} samples")
+                except Exception:
+                    logger.exception("History retention failed")
+            await asyncio.sleep(3600)
+
+    async def samples(
+        self, device_id: str, start: float, end: float, limit: int = 1000
+    ) -> list[dict[str, Any]]:
+        """State samples overlapping [start, end], oldest first."""
+        db = await self._connection()
+        if db is None:
+            return []
+        cur = await db.execute(_SAMPLES_SQL, (device_id, end, device_id, start, start, limit))
+        return [_sample(row) for row in await cur.fetchall()]
+
+    async def aggregate(
+        self, device_id: str, start: float, end: float, bucket: float
+    ) -> list[dict[str, Any]]:
+        """Downsample history into fixed buckets of online/power-on time and lamp hours."""
+        n_buckets = max(1, math.ceil((end - start) / bucket - 1e-9))
+        buckets = [
+            {
+                "start": start + i * bucket,
+                "online_seconds": 0.0,
+                "power_on_seconds": 0.0,
+                "lamp_hours_min": None,
+                "lamp_hours_max": None,
+                "samples": 0,
+            }
+            for i in range(n_buckets)
+        ]
+
+        # Stream the rows: each sample is added once the next one says where it ended
+        db = await self._connection()
+        if db is None:
+            return buckets
+        previous = None
+        cur = await db.execute(_SAMPLES_SQL, (device_id, end, device_id, start, start, -1))
+        while rows := await cur.fetchmany(AGGREGATE_CHUNK):
+            for row in rows:
+                sample = _sample(row)
+                if previous is not None:
+                    self._add_segment(buckets, previous, sample["ts"], start, end, bucket)
+                previous = sample
+        await cur.close()
+        if previous is not None:
+            self._add_segment(buckets, previous, None, start, end, bucket)
+
+        for b in buckets:
+            b["online_seconds"] = round(b["online_seconds"], 1)
+            b["power_on_seconds"] = round(b["power_on_seconds"], 1)
+        return buckets
+
+    def _add_segment(
+        self,
+        buckets: list[dict],
+        sample: dict,
+        next_ts: float | None,
+        start: float,
+        end: float,
+        bucket: float,
+    ) -> None:
+        if next_ts is not None and next_ts - sample["until"] <= self.gap_tolerance:
+            seg_end = next_ts
+        else:
+            seg_end = sample["until"]
+        seg_start, seg_end = max(sample["ts"], start), min(seg_end, end)
+        lamp = sample["extra"].get("lamp_hours")
+        last = len(buckets) - 1
+        if start <= sample["ts"] < end:
+            b = buckets[min(int((sample["ts"] - start) // bucket), last)]
+            b["samples"] += 1
+            _note_lamp(b, lamp)
+        # Spread the segment over every bucket it overlaps. Walk bucket indices rather than
+        # float edges: with a fractional bucket an edge can round back onto t.
+        i = min(int((seg_start - start) // bucket), last)
+        t = seg_start
+        while t < seg_end:
+            b_end = seg_end if i >= last else min(start + (i + 1) * bucket, seg_end)
+            if b_end > t:
+                b = buckets[i]
+                if sample["status"] == "online":
+                    b["online_seconds"] += b_end - t
+                if sample["power"]:
+                    b["power_on_seconds"] += b_end - t
+                _note_lamp(b, lamp)
+                t = b_end
+            i += 1
+
+
+def _sample(row: tuple) -> dict[str, Any]:
+    ts, until, status, power, extra = row
+    return {
+        "ts": ts,
+        "until": until,
+        "status": status,
+        "power": None if power is None else bool(power),
+        "extra": json.loads(extra) if extra else {},
+    }
+
+
+def _note_lamp(bucket: dict, lamp: Any) -> None:
+    if not isinstance(lamp, (int, float)):
+        return
+    if bucket["lamp_hours_min"] is None or lamp < bucket["lamp_hours_min"]:
+        bucket["lamp_hours_min"] = lamp
+    if bucket["lamp_hours_max"] is None or lamp > bucket["lamp_hours_max"]:
+        bucket["lamp_hours_max"] = lamp
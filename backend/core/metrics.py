@@ -0,0 +1,184 @@
+from bisect import bisect_left
+from collections.abc import Iterable
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class Histogram:
+    __slots__ = ("bounds", "count", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricFamily:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.children: dict[tuple[str, ...], Counter | Gauge | Histogram] = {}
+        if not labelnames:
+            self.labels()  # expose unlabelled metrics as zero before the first update
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            if self.kind == "histogram":
+                child = Histogram(self.buckets)
+            elif self.kind == "gauge":
+                child = Gauge()
+            else:
+                child = Counter()
+            self.children[values] = child
+        return child
+
+    def remove(self, *values: str) -> None:
+        self.children.pop(values, None)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in self.children.items():
+            labels = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, values)]
+            if isinstance(child, Histogram):
+                cumulative = 0
+                for bound, count in zip((*child.bounds, "+Inf"), child.counts):
+                    cumulative += count
+                    le = ",".join([*labels, f'le="{bound}"'])
+                    yield f"{self.name}_bucket{{{le}}} {cumulative}"
+                suffix = "{" + ",".join(labels) + "}" if labels else ""
+                yield f"{self.name}_sum{suffix} {child.sum}"
+                yield f"{self.name}_count{suffix} {child.count}"
+            else:
+                suffix = "{" + ",".join(labels) + "}" if labels else ""
+                yield f"{self.name}{suffix} {child.value}"
+
+
+class Registry:
+    """In-process metrics rendered in the Prometheus text format.
+
+    Cheap enough to leave on in production: histogram buckets are allocated once
+    per label set and ``observe`` is a bisect plus three additions. Hot paths
+    resolve ``family.labels(...)`` once and keep the child.
+    """
+
+    def __init__(self):
+        self._families: dict[str, MetricFamily] = {}
+
+    def _family(self, name: str, help: str, kind: str, labelnames, **kwargs) -> MetricFamily:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = MetricFamily(
+                name, help, kind, tuple(labelnames), **kwargs
+            )
+        return family
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> MetricFamily:
+        return self._family(name, help, "counter", labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = ()) -> MetricFamily:
+        return self._family(name, help, "gauge", labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> MetricFamily:
+        return self._family(name, help, "histogram", labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        for family in self._families.values():
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
+
+PJLINK_PHASE_SECONDS = REGISTRY.histogram(
+    "nomy_pjlink_phase_seconds", "PJLink TCP exchange time by phase", ["phase"]
+)
+DEVICE_POLL_SECONDS = REGISTRY.histogram(
+    "nomy_device_poll_seconds", "Time to poll one device", ["device"]
+)
+POLL_CYCLE_SECONDS = REGISTRY.histogram("nomy_poll_cycle_seconds", "Poll cycle duration")
+POLL_CYCLE_OVERRUNS = REGISTRY.counter(
+    "nomy_poll_cycle_overruns_total", "Poll cycles that hit their deadline"
+)
+POLL_MISSED = REGISTRY.counter(
+    "nomy_poll_missed_total", "Device polls cancelled at the cycle deadline"
+)
+COMMAND_SECONDS = REGISTRY.histogram(
+    "nomy_command_seconds", "Device command latency", ["command", "outcome"]
+)
+NOTIFICATIONS = REGISTRY.counter(
+    "nomy_notifications_total", "Pushed device status notifications applied", ["command"]
+)
+SCENE_SECONDS = REGISTRY.histogram("nomy_scene_seconds", "Scene activation latency", ["scene"])
+EVENT_PUBLISH_SECONDS = REGISTRY.histogram(
+    "nomy_event_publish_seconds", "EventBus.publish fan-out time", ["event"]
+)
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "nomy_event_loop_lag_seconds", "How late the event loop ran a timer"
+)
+LOOP_STALLS = REGISTRY.counter(
+    "nomy_event_loop_stalls_total", "Event loop stalls over the slow threshold", ["kind"]
+)
+ASYNCIO_TASKS = REGISTRY.gauge("nomy_asyncio_tasks", "Pending asyncio tasks", ["kind"])
+WS_CONNECTIONS = REGISTRY.gauge("nomy_ws_connections", "Open WebSocket connections", ["room"])
+WS_SEND_SECONDS = REGISTRY.histogram(
+    "nomy_ws_send_seconds", "WebSocket frame send latency", ["room"]
+)
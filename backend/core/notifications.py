@@ -0,0 +1,145 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+from collections.abc import Callable
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_PORT = 4352  # PJLink Class 2 status notifications arrive on UDP 4352
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, listener: "NotificationListener"):
+        self.listener = listener
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        self.listener.received(data, addr)
+
+
+class NotificationListener:
+    """One UDP socket receiving PJLink Class 2 status notifications for every device.
+
+    A datagram such as ``%2POWR=1`` is routed to the registered device whose
+    host matches the sender, using the sender's port as well when several
+    devices share an address (e.g. simulators on one machine), and handed to
+    ``dispatch(device_id, command, value)``.
+    """
+
+    def __init__(
+        self,
+        dispatch: Callable[[str, str, str], None],
+        host: str = "0.0.0.0",
+        port: int = NOTIFY_PORT,
+    ):
+        self.dispatch = dispatch
+        self.host = host
+        self.port = port
+        self._by_addr: dict[tuple[str, int], str] = {}
+        self._by_host: dict[str, set[str]] = {}
+        self._transport: asyncio.DatagramTransport | None = None
+        # Pending hostname lookups by device, so unregister can call them off
+        self._resolving: dict[str, asyncio.Task] = {}
+        self.received_count = 0
+        self.unmatched = 0
+        self.malformed = 0
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _Protocol(self), local_addr=(self.host, self.port)
+        )
+        logger.info(f"Listening for PJLink notifications on udp/{self.host}:{self.port}")
+
+    def stop(self) -> None:
+        for task in self._resolving.values():
+            task.cancel()
+        self._resolving.clear()
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def register(self, device_id: str, host: str, port: int) -> None:
+        self._cancel_resolve(device_id)
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            task = asyncio.create_task(
+                self._resolve_and_register(device_id, host, port),
+                name=f"notify-resolve:{device_id}",
+            )
+            self._resolving[device_id] = task
+            task.add_done_callback(lambda t: self._resolve_done(device_id, t))
+            return
+        self._add(device_id, host, port)
+
+    def _resolve_done(self, device_id: str, task: asyncio.Task) -> None:
+        if self._resolving.get(device_id) is task:
+            del self._resolving[device_id]
+
+    def _cancel_resolve(self, device_id: str) -> None:
+        task = self._resolving.pop(device_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _resolve_and_register(self, device_id: str, host: str, port: int) -> None:
+        try:
+            # IPv4 only: the socket is bound to an IPv4 address (0.0.0.0 by default), so
+            # senders always arrive as IPv4 and AAAA records could never match
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM
+            )
+        except OSError as e:
+            logger.warning(f"Cannot resolve {host!r} for notifications from {device_id!r}: {e}")
+            return
+        for *_, sockaddr in infos:
+            self._add(device_id, sockaddr[0], port)
+
+    def _add(self, device_id: str, ip: str, port: int) -> None:
+        self._by_addr[(ip, port)] = device_id
+        self._by_host.setdefault(ip, set()).add(device_id)
+
+    def unregister(self, device_id: str) -> None:
+        # A lookup still in flight would otherwise re-add the device when it finishes
+        self._cancel_resolve(device_id)
+        for key in [k for k, did in self._by_addr.items() if did == device_id]:
+            del self._by_addr[key]
+        for ip, ids in list(self._by_host.items()):
+            ids.discard(device_id)
+            if not ids:
+                del self._by_host[ip]
+
+    def _route(self, addr: tuple) -> str | None:
+        ip, port = addr[0], addr[1]
+        device_id = self._by_addr.get((ip, port))
+        if device_id is None:
+            ids = self._by_host.get(ip)
+            if ids and len(ids) == 1:
+                device_id = next(iter(ids))
+        return device_id
+
+    def received(self, data: bytes, addr: tuple) -> None:
+        self.received_count += 1
+        device_id = self._route(addr)
+        if device_id is None:
+            self.unmatched += 1
+            logger.debug(f"PJLink notification from unknown sender {addr}: {data!r}")
+            return
+        for line in data.decode("ascii", errors="ignore").replace("\r", "\n").split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            # "%2POWR=1": class digit, 4-letter command, "=", value
+            if len(line) < 7 or line[0] != "%" or line[6] != "=":
+                self.malformed += 1
+                continue
+            self.dispatch(device_id, line[2:6].upper(), line[7:])
+
+    def stats(self) -> dict:
+        return {
+            "port": self.port,
+            "devices": len(set(self._by_addr.values())),
+            "received": self.received_count,
+            "unmatched": self.unmatched,
+            "malformed": self.malformed,
+        }
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import asdict, dataclass
+
+from core.metrics import POLL_CYCLE_OVERRUNS, POLL_CYCLE_SECONDS, POLL_MISSED
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PollCycle:
+    started_at: float
+    duration: float
+    devices: int
+    completed: int
+    errors: int
+    missed: int
+    on_time: bool
+
+
+class PollSchedule:
+    """Per-device poll intervals.
+
+    Each device has a base interval. Consecutive failed polls back it off
+    exponentially up to ``offline_max``; an expedited device is polled every
+    ``fast_interval`` seconds until its fast window expires.
+    """
+
+    def __init__(
+        self,
+        default_interval: float,
+        offline_max: float = 300.0,
+        fast_interval: float = 2.0,
+        fast_window: float = 30.0,
+    ):
+        self.default_interval = default_interval
+        self.offline_max = offline_max
+        self.fast_interval = fast_interval
+        self.fast_window = fast_window
+        self._intervals: dict[str, float] = {}
+        self._failures: dict[str, int] = {}
+        self._next_due: dict[str, float] = {}
+        self._fast_until: dict[str, float] = {}
+
+    def set_interval(self, device_id: str, interval: float) -> None:
+        self._intervals[device_id] = interval
+
+    def forget(self, device_id: str) -> None:
+        for table in (self._intervals, self._failures, self._next_due, self._fast_until):
+            table.pop(device_id, None)
+
+    def base_interval(self, device_id: str) -> float:
+        return self._intervals.get(device_id, self.default_interval)
+
+    def interval(self, device_id: str) -> float:
+        base = self.base_interval(device_id)
+        failures = self._failures.get(device_id, 0)
+        if failures:
+            return min(base * 2 ** failures, max(base, self.offline_max))
+        return base
+
+    def next_due(self, device_id: str) -> float | None:
+        return self._next_due.get(device_id)
+
+    def set_due(self, device_id: str, when: float) -> None:
+        self._next_due[device_id] = when
+
+    def record(self, device_id: str, ok: bool, now: float) -> None:
+        if ok:
+            self._failures.pop(device_id, None)
+        else:
+            self._failures[device_id] = min(self._failures.get(device_id, 0) + 1, 16)
+        due = self._next_due.get(device_id, now)
+        # Keep the device on its slot so spread-out polls stay spread out
+        self._next_due[device_id] = max(due + self.interval(device_id), now)
+
+    def expedite(self, device_id: str, now: float) -> None:
+        self._fast_until[device_id] = now + self.fast_window
+
+    def is_fast(self, device_id: str, now: float) -> bool:
+        return self._fast_until.get(device_id, 0.0) > now
+
+    def end_fast(self, device_id: str, now: float) -> None:
+        self._fast_until.pop(device_id, None)
+        self._next_due[device_id] = now + self.interval(device_id)
+
+    def stats(self, now: float) -> dict:
+        return {
+            "backed_off": sum(1 for f in self._failures.values() if f),
+            "fast": sum(1 for until in self._fast_until.values() if until > now),
+        }
+
+
+class PollEngine:
+    """Runs device polls in cycles with bounded concurrency and a per-cycle deadline.
+
+    Each cycle polls the devices whose next due time falls inside it, starting
+    each poll at its due time (at most ``spread`` of the way into the cycle) so a
+    large fleet does not open every connection at once. Polls still running at
+    the deadline are cancelled and counted as missed, and a cycle never overlaps
+    the next one. Expedited devices are polled outside the cycles on a fast lane.
+    """
+
+    def __init__(
+        self,
+        poll: Callable[[str], Awaitable[bool]],
+        interval: float,
+        concurrency: int = 64,
+        deadline: float | None = None,
+        spread: float = 0.5,
+        schedule: PollSchedule | None = None,
+        history: int = 100,
+    ):
+        self._poll = poll
+        self.interval = interval
+        self.concurrency = concurrency
+        self._deadline = deadline
+        self.deadline = deadline if deadline is not None else interval
+        self.spread = min(max(spread, 0.0), 1.0)
+        self.schedule = schedule or PollSchedule(interval)
+        self.cycles: deque[PollCycle] = deque(maxlen=history)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: asyncio.Task | None = None
+        self._fast_tasks: dict[str, asyncio.Task] = {}
+
+    def set_interval(self, interval: float) -> None:
+        """Change the cycle interval; a deadline that wasn't configured follows it."""
+        self.interval = interval
+        if self._deadline is None:
+            self.deadline = interval
+
+    def start(self, device_ids: Callable[[], Iterable[str]]) -> None:
+        loop = asyncio.get_running_loop()
+        ids = list(device_ids())
+        now = loop.time()
+        # Stagger first polls across each device's own interval
+        for i, did in enumerate(ids):
+            if self.schedule.next_due(did) is None:
+                offset = self.schedule.interval(did) * self.spread * i / len(ids)
+                self.schedule.set_due(did, now + offset)
+        self._task = asyncio.create_task(self._run(device_ids), name="poll-engine")
+
+    async def stop(self) -> None:
+        tasks = [t for t in [self._task, *self._fast_tasks.values()] if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._fast_tasks.clear()
+
+    def expedite(self, device_id: str) -> None:
+        """Poll a device every fast_interval for a while, e.g. after a command."""
+        self.schedule.expedite(device_id, asyncio.get_running_loop().time())
+        if device_id not in self._fast_tasks:
+            self._fast_tasks[device_id] = asyncio.create_task(
+                self._fast_lane(device_id), name=f"poll-fast:{device_id}"
+            )
+
+    async def _fast_lane(self, device_id: str) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while self.schedule.is_fast(device_id, loop.time()):
+                await asyncio.sleep(self.schedule.fast_interval)
+                async with self._semaphore:
+                    try:
+                        await asyncio.wait_for(self._poll(device_id), timeout=self.deadline)
+                    except Exception as e:
+                        logger.debug(f"Fast poll failed for {device_id}: {e}", exc_info=True)
+        finally:
+            self.schedule.end_fast(device_id, loop.time())
+            self._fast_tasks.pop(device_id, None)
+
+    async def _run(self, device_ids: Callable[[], Iterable[str]]) -> None:
+        loop = asyncio.get_running_loop()
+        next_start = loop.time()
+        while True:
+            await asyncio.sleep(max(0.0, next_start - loop.time()))
+            cycle = await self.run_cycle(list(device_ids()))
+            if not cycle.on_time:
+                logger.warning(
+                    f"Poll cycle overran: {cycle.duration:.2f}s, "
+                    f"{cycle.missed}/{cycle.devices} devices missed the deadline"
+                )
+            # Skip ahead instead of queueing cycles behind a slow one
+            next_start = max(next_start + self.interval, loop.time())
+
+    async def run_cycle(self, device_ids: list[str]) -> PollCycle:
+        loop = asyncio.get_running_loop()
+        started_at = time.time()
+        start = loop.time()
+        window_end = start + self.interval
+        latest_offset = self.interval * self.spread
+
+        due = []
+        for did in device_ids:
+            if self.schedule.is_fast(did, start):
+                continue
+            next_due = self.schedule.next_due(did)
+            if next_due is None or next_due < window_end:
+                offset = 0.0 if next_due is None else next_due - start
+                due.append((did, min(max(offset, 0.0), latest_offset)))
+
+        async def run_one(offset: float, device_id: str) -> bool:
+            if offset > 0:
+                await asyncio.sleep(offset)
+            async with self._semaphore:
+                ok = await self._poll(device_id)
+            self.schedule.record(device_id, ok, loop.time())
+            return ok
+
+        tasks = {
+            asyncio.create_task(run_one(offset, did), name=f"poll:{did}"): did
+            for did, offset in due
+        }
+        done: set[asyncio.Task] = set()
+        pending: set[asyncio.Task] = set()
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in pending:
+                self.schedule.record(tasks[task], False, loop.time())
+
+        errors = sum(1 for t in done if t.exception() is not None or t.result() is False)
+        cycle = PollCycle(
+            started_at=started_at,
+            duration=loop.time() - start,
+            devices=len(due),
+            completed=len(done),
+            errors=errors,
+            missed=len(pending),
+            on_time=not pending,
+        )
+        self.cycles.append(cycle)
+        POLL_CYCLE_SECONDS.labels().observe(cycle.duration)
+        if pending:
+            POLL_CYCLE_OVERRUNS.labels().inc()
+            POLL_MISSED.labels().inc(len(pending))
+        return cycle
+
+    def stats(self) -> dict:
+        cycles = list(self.cycles)
+        return {
+            "interval": self.interval,
+            "concurrency": self.concurrency,
+            "deadline": self.deadline,
+            "cycles": len(cycles),
+            "overruns": sum(1 for c in cycles if not c.on_time),
+            "last_cycle": asdict(cycles[-1]) if cycles else None,
+            **self.schedule.stats(asyncio.get_running_loop().time()),
+        }
@@ -0,0 +1,49 @@
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from core.config import ConfigLoader
+    from core.state import RoomStateManager
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigWatcher:
+    """Watches NOMY_CONFIG and NOMY_ROOMS_DIR and applies changes without a restart."""
+
+    def __init__(
+        self, loader: "ConfigLoader", room_manager: "RoomStateManager", interval: float = 2.0
+    ):
+        self.loader = loader
+        self.room_manager = room_manager
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        # Files that failed to load stay "changed" until edited; report each bad revision once
+        self._failed_revision: tuple | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="config-watcher")
+        logger.info(f"Watching config for changes every {self.interval}s")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.loader.changed():
+                continue
+            revision = self.loader.revision()
+            if revision == self._failed_revision:
+                continue
+            try:
+                await self.room_manager.apply_config(self.loader.load())
+            except Exception:
+                self._failed_revision = revision
+                logger.exception("Config reload failed, keeping current config")
+            else:
+                self._failed_revision = None
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+from itertools import groupby
+from typing import TYPE_CHECKING
+
+from core.metrics import SCENE_SECONDS
+
+if TYPE_CHECKING:
+    from core.config import SceneAction, SceneConfig
+    from core.state import RoomStateManager
+
+logger = logging.getLogger(__name__)
+
+SCENE_ACTION_TIMEOUT = 10.0
+
+
+class SceneEngine:
+    """Runs scene actions concurrently across devices.
+
+    Actions on the same device keep their declared order. Actions may set
+    ``stage`` (default 0): every action of one stage finishes before the next
+    stage starts, e.g. to select inputs only after all displays are powered on.
+    Each action may also set its own ``timeout`` in seconds.
+    """
+
+    def __init__(
+        self, room_manager: "RoomStateManager", action_timeout: float = SCENE_ACTION_TIMEOUT
+    ):
+        self.room_manager = room_manager
+        self.action_timeout = action_timeout
+
+    async def activate(self, scene: "SceneConfig") -> dict:
+        start = time.perf_counter()
+        actions = list(enumerate(scene.actions))
+        results: list[dict] = [{} for _ in actions]
+
+        async def run_chain(chain: list[tuple[int, "SceneAction"]]) -> None:
+            for index, action in chain:
+                results[index] = await self._run_action(action, start)
+
+        actions.sort(key=lambda item: item[1].stage)
+        for _, stage_actions in groupby(actions, key=lambda item: item[1].stage):
+            chains: dict[str, list[tuple[int, SceneAction]]] = {}
+            for index, action in stage_actions:
+                chains.setdefault(action.device, []).append((index, action))
+            await asyncio.gather(*(run_chain(chain) for chain in chains.values()))
+
+        elapsed = time.perf_counter() - start
+        SCENE_SECONDS.labels(scene.name).observe(elapsed)
+        duration_ms = round(elapsed * 1000, 1)
+        logger.info(f"Scene {scene.name!r} finished in {duration_ms} ms")
+        return {"scene": scene.name, "results": results, "duration_ms": duration_ms}
+
+    async def _run_action(self, action: "SceneAction", scene_start: float) -> dict:
+        did = action.device
+        cmd = action.command
+        params = action.params
+        timeout = action.timeout if action.timeout is not None else self.action_timeout
+        started = time.perf_counter()
+        result = {
+            "device": did,
+            "command": cmd,
+            "stage": action.stage,
+            "started_ms": round((started - scene_start) * 1000, 1),
+        }
+        if self.room_manager.get_device(did) is None:
+            result.update(ok=False, error=f"Device {did!r} not found", duration_ms=0.0)
+            return result
+        try:
+            await asyncio.wait_for(self.room_manager.send_command(did, cmd, **params), timeout)
+            result["ok"] = True
+        except TimeoutError:
+            result.update(ok=False, error=f"Timed out after {timeout:g}s")
+        except Exception as e:
+            logger.debug(f"Scene action {cmd!r} on {did} failed", exc_info=True)
+            result.update(ok=False, error=str(e))
+        result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
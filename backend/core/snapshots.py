@@ -0,0 +1,340 @@
+import bisect
+import json
+import time
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+from core.config import ConfigIndex, RoomConfig
+
+# Filterable attributes: the first three come from the config, the rest from device state
+FLEET_FILTERS = ("room", "driver", "type", "status", "power")
+FLEET_FIELDS = ("id", "name", "type", "driver", "room_id", "state")
+FLEET_MAX_LIMIT = 5000
+
+
+def _dumps(value: Any) -> bytes:
+    # Same encoding as FastAPI's JSONResponse, so cached and live bodies are identical
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _key(value: Any) -> str:
+    """Index key for an attribute value, spelled the way it's written in a query."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+class FleetIndex:
+    """Every device's latest state, indexed for fleet-wide queries.
+
+    Kept up to date by SnapshotCache, so a query intersects a few prebuilt
+    sets instead of walking every room. Devices are ordered by id and the
+    cursor is the last id of the previous page, which stays valid while
+    states change underneath it.
+    """
+
+    def __init__(self, index: ConfigIndex):
+        self._states: dict[str, dict] = {}
+        self._bodies: dict[str, bytes] = {}
+        self._by: dict[str, dict[str, set[str]]] = {name: {} for name in FLEET_FILTERS}
+        self.set_index(index)
+
+    def set_index(self, index: ConfigIndex) -> None:
+        self._index = index
+        self._order = sorted(index.devices)
+        for name in ("room", "driver", "type"):
+            self._by[name] = {}
+        for dev in index.devices.values():
+            self._by["room"].setdefault(dev.room_id, set()).add(dev.id)
+            self._by["driver"].setdefault(_key(dev.driver), set()).add(dev.id)
+            self._by["type"].setdefault(_key(dev.type), set()).add(dev.id)
+        self._prefix = {
+            dev.id: _dumps({
+                "id": dev.id, "name": dev.name, "type": dev.type, "driver": dev.driver,
+                "room_id": dev.room_id,
+            })[:-1] + b',"state":'
+            for dev in index.devices.values()
+        }
+        for device_id in [d for d in self._states if d not in index.devices]:
+            self.remove(device_id)
+
+    def update(self, device_id: str, state: dict, body: bytes) -> None:
+        """Record a state and its serialized form (shared with the room snapshots)."""
+        old = self._states.get(device_id)
+        for name in ("status", "power"):
+            key = _key(state[name])
+            if old is not None:
+                old_key = _key(old[name])
+                if old_key == key:
+                    continue
+                self._discard(name, old_key, device_id)
+            self._by[name].setdefault(key, set()).add(device_id)
+        self._states[device_id] = state
+        self._bodies[device_id] = body
+
+    def remove(self, device_id: str) -> None:
+        old = self._states.pop(device_id, None)
+        self._bodies.pop(device_id, None)
+        if old is not None:
+            for name in ("status", "power"):
+                self._discard(name, _key(old[name]), device_id)
+
+    def _discard(self, name: str, key: str, device_id: str) -> None:
+        ids = self._by[name].get(key)
+        if ids is not None:
+            ids.discard(device_id)
+            if not ids:
+                del self._by[name][key]
+
+    def _match(self, filters: Mapping[str, Iterable[str]]) -> set[str] | None:
+        """Ids matching every filter (values within one filter are alternatives); None = all."""
+        result: set[str] | None = None
+        # Intersect the smallest candidate sets first
+        groups = sorted(
+            (set().union(*(self._by[name].get(v, ()) for v in values)) for name, values in
+             filters.items()),
+            key=len,
+        )
+        for ids in groups:
+            result = ids if result is None else result & ids
+            if not result:
+                break
+        return result
+
+    def query(
+        self,
+        filters: Mapping[str, Iterable[str]],
+        fields: Iterable[str] | None = None,
+        cursor: str | None = None,
+        limit: int = 500,
+    ) -> bytes:
+        """The GET /devices response body.
+
+        ``fields`` projects each entry to dotted paths such as ``state.power``
+        or ``state.extra.input``; without it entries carry every field.
+        ``status_counts`` covers the devices matching every filter but status,
+        so a dashboard can show the breakdown while listing one status.
+        """
+        unknown = filters.keys() - set(FLEET_FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown filter: {min(unknown)!r}")
+        paths = None
+        if fields is not None:
+            paths = [f.split(".") for f in fields]
+            for path in paths:
+                if path[0] not in FLEET_FIELDS:
+                    raise ValueError(f"Unknown field: {'.'.join(path)!r}")
+            # "state" already covers "state.power"
+            paths = [p for p in paths if not any(q != p and p[:len(q)] == q for q in paths)]
+        limit = max(1, min(limit, FLEET_MAX_LIMIT))
+
+        matched = self._match(filters)
+        ids = self._order if matched is None else sorted(matched)
+        start = bisect.bisect_right(ids, cursor) if cursor is not None else 0
+        page = ids[start:start + limit]
+        next_cursor = page[-1] if start + limit < len(ids) else None
+
+        if "status" in filters:
+            facet = self._match({k: v for k, v in filters.items() if k != "status"})
+        else:
+            facet = matched
+        counts = {
+            status: len(members) if facet is None else len(members & facet)
+            for status, members in self._by["status"].items()
+        }
+
+        if paths is None:
+            entries = [
+                self._prefix[did] + self._bodies.get(did, b"null") + b"}" for did in page
+            ]
+        else:
+            entries = [_dumps(self._project(did, paths)) for did in page]
+        return b"".join([
+            _dumps({
+                "total": len(ids),
+                "status_counts": {k: v for k, v in sorted(counts.items()) if v},
+                "next_cursor": next_cursor,
+            })[:-1],
+            b',"devices":[', b",".join(entries), b"]}",
+        ])
+
+    def _project(self, device_id: str, paths: list[list[str]]) -> dict:
+        dev = self._index.devices[device_id]
+        full = {
+            "id": dev.id, "name": dev.name, "type": dev.type, "driver": dev.driver,
+            "room_id": dev.room_id, "state": self._states.get(device_id),
+        }
+        out: dict = {}
+        for path in paths:
+            value: Any = full
+            for part in path:
+                value = value.get(part) if isinstance(value, Mapping) else None
+            target = out
+            for part in path[:-1]:
+                target = target.setdefault(part, {})
+            target[path[-1]] = value
+        return out
+
+
+class SnapshotCache:
+    """Pre-serialized device states for the room REST endpoints.
+
+    Every published state change takes the next number of one global
+    ``version`` sequence. A room's version is the newest change among its
+    devices (or its last config change), which doubles as the ETag, and a
+    client holding version N can ask for only the devices changed after N.
+    Room bodies are serialized once per room version and reused until then.
+    """
+
+    def __init__(self, index: ConfigIndex, base: int | None = None):
+        # Start from the clock (in microseconds) so versions keep growing across restarts:
+        # an ETag from an earlier run never matches and its deltas come back full.
+        # Cluster followers start from the owner's base so versions agree across workers.
+        self.version = (base if base is not None else time.time_ns() // 1000) - 1
+        self._index = index
+        self._states: dict[str, bytes] = {}
+        self._statuses: dict[str, str] = {}
+        self._changed: dict[str, int] = {}
+        self._room_versions: dict[str, int] = {}
+        # Version of each room's last config change; deltas from before it must resnapshot
+        self._room_config: dict[str, int] = {}
+        self._entry_prefix: dict[str, bytes] = {}
+        self._bodies: dict[tuple[str, str], tuple[int, bytes]] = {}
+        self.fleet = FleetIndex(index)
+        self.set_index(index, index.rooms)
+        self.base = self.version
+
+    def set_index(
+        self, index: ConfigIndex, rooms_changed: Iterable[str], bump: bool = True
+    ) -> None:
+        """Switch to a reloaded config; ``rooms_changed`` lists rooms added or redefined.
+
+        ``bump=False`` leaves the version alone, for a cluster follower that takes
+        room config versions from the owner (see ``set_room_configs``).
+        """
+        if bump:
+            self.version += 1
+        self._index = index
+        self.fleet.set_index(index)
+        for device_id in [d for d in self._states if d not in index.devices]:
+            self.remove(device_id)
+        for room_id in rooms_changed:
+            self._room_config[room_id] = self._room_versions[room_id] = self.version
+        for room_id in [r for r in self._room_versions if r not in index.rooms]:
+            del self._room_versions[room_id]
+            self._room_config.pop(room_id, None)
+        self._bodies.clear()
+        self._entry_prefix = {
+            dev.id: _dumps({
+                "id": dev.id, "name": dev.name, "type": dev.type, "driver": dev.driver,
+            })[:-1] + b',"state":'
+            for dev in index.devices.values()
+        }
+
+    @property
+    def room_configs(self) -> Mapping[str, int]:
+        """Version of each room's last config change."""
+        return self._room_config
+
+    def set_room_configs(self, versions: Mapping[str, int]) -> None:
+        """Adopt room config versions numbered by another process."""
+        for room_id, version in versions.items():
+            if room_id in self._index.rooms and self._room_config.get(room_id) != version:
+                self._room_config[room_id] = version
+                self._room_versions[room_id] = max(self._room_versions.get(room_id, 0), version)
+                self.version = max(self.version, version)
+
+    def update(self, device_id: str, state: dict, version: int | None = None) -> None:
+        """Record a new state; ``version`` replays a number assigned by another process."""
+        self.version = max(self.version, version) if version is not None else self.version + 1
+        changed = version if version is not None else self.version
+        self._states[device_id] = body = _dumps(state)
+        self.fleet.update(device_id, state, body)
+        self._statuses[device_id] = state["status"]
+        self._changed[device_id] = changed
+        dev = self._index.devices.get(device_id)
+        if dev is not None:
+            room_id = dev.room_id
+            self._room_versions[room_id] = max(self._room_versions.get(room_id, 0), changed)
+
+    def remove(self, device_id: str) -> None:
+        self._states.pop(device_id, None)
+        self._statuses.pop(device_id, None)
+        self._changed.pop(device_id, None)
+        self.fleet.remove(device_id)
+
+    def changed_version(self, device_id: str) -> int:
+        return self._changed.get(device_id, 0)
+
+    @property
+    def statuses(self) -> dict[str, str]:
+        return self._statuses
+
+    def room_version(self, room_id: str) -> int:
+        return self._room_versions.get(room_id, 0)
+
+    def etag(self, room_id: str) -> str:
+        return f'"{self.room_version(room_id)}"'
+
+    def room_body(self, room_id: str) -> bytes:
+        """The GET /rooms/{room_id} response."""
+        return self._cached("room", room_id, self._build_room)
+
+    def devices_body(self, room_id: str) -> bytes:
+        """The GET /rooms/{room_id}/devices response."""
+        return self._cached("devices", room_id, self._build_devices)
+
+    def delta_body(self, room_id: str, since: int) -> bytes:
+        """Devices in a room whose state changed after version ``since``.
+
+        If the room itself was redefined after ``since``, every device is
+        returned with ``"full": true`` and the client should replace its copy.
+        """
+        room = self._index.rooms[room_id]
+        full = since < self._room_config.get(room_id, 0) or since > self.version
+        entries = [
+            self._entry(dev.id) for dev in room.devices
+            if full or self._changed.get(dev.id, 0) > since
+        ]
+        return b"".join([
+            _dumps({
+                "room_id": room_id, "version": self.room_version(room_id),
+                "since": since, "full": full,
+            })[:-1],
+            b',"devices":[', b",".join(entries), b"]}",
+        ])
+
+    def _cached(self, kind: str, room_id: str, build) -> bytes:
+        version = self.room_version(room_id)
+        cached = self._bodies.get((kind, room_id))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        body = build(self._index.rooms[room_id])
+        self._bodies[(kind, room_id)] = (version, body)
+        return body
+
+    def _entry(self, device_id: str) -> bytes:
+        return self._entry_prefix[device_id] + self._states.get(device_id, b"null") + b"}"
+
+    def _build_devices(self, room: RoomConfig) -> bytes:
+        return b"[" + b",".join(self._entry(did) for did in room.device_ids) + b"]"
+
+    def _build_room(self, room: RoomConfig) -> bytes:
+        return b"".join([
+            _dumps({
+                "id": room.id, "name": room.name, "description": room.description,
+                "version": self.room_version(room.id),
+            })[:-1],
+            b',"devices":', self._build_devices(room),
+            b',"scenes":', _dumps(list(room.scenes)), b"}",
+        ])
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header covers ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
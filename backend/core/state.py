@@ -1,8 +1,23 @@
 import asyncio
 import logging
-from typing import TYPE_CHECKING
+import time
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Any
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from core.config import (
+    ConfigDiff,
+    ConfigIndex,
+    DeviceConfig,
+    RoomConfig,
+    compile_config,
+    diff_config,
+)
+from core.metrics import COMMAND_SECONDS, DEVICE_POLL_SECONDS, NOTIFICATIONS, Histogram
+from core.notifications import NOTIFY_PORT, NotificationListener
+from core.poller import PollEngine, PollSchedule
+from core.snapshots import SnapshotCache
+from devices.base import CommandSuperseded, DeviceStatus
+from devices.breaker import DeviceUnavailable
 
 if TYPE_CHECKING:
     from core.event_bus import EventBus
@@ -19,66 +34,387 @@ class RoomStateManager:
         self.config = config
         self.plugin_loader = plugin_loader
         self.event_bus = event_bus
-        self.rooms: dict[str, dict] = {}
+        self.index: ConfigIndex = compile_config(config)
         self.devices: dict[str, "DeviceDriver"] = {}
-        self._scheduler = AsyncIOScheduler()
+        # Per-device state version, bumped only when a poll returns a different state
+        self.versions: dict[str, int] = {}
+        self._last_states: dict[str, dict] = {}
+        self._last_published: dict[str, float] = {}
+        # DEVICE_POLL_SECONDS child per device, resolved when the driver is loaded
+        self._poll_timers: dict[str, Histogram] = {}
+        self.snapshots = SnapshotCache(self.index)
+        self._heartbeat_interval = config.get("heartbeat_interval", 60)
+        self._connect_concurrency = config.get("connect_concurrency", 32)
+        self._connect_task: asyncio.Task | None = None
+        self._reconnects: set[asyncio.Task] = set()
+        # Seconds each device took to connect and report its first state
+        self.startup_times: dict[str, float] = {}
         self._poll_interval = config.get("poll_interval", 10)
+        self._driver_intervals: dict[str, float] = {}
+        # Devices that push status notifications only need an occasional safety-net poll
+        self._notify_poll_interval = 120.0
+        self.notifications: NotificationListener | None = None
+        if config.get("notify_listen", False):
+            self.notifications = NotificationListener(
+                self._on_notification,
+                host=config.get("notify_host", "0.0.0.0"),
+                port=int(config.get("notify_port", NOTIFY_PORT)),
+            )
+        self._notify_tasks: set[asyncio.Task] = set()
+        self.poller = PollEngine(
+            self._poll_device_by_id,
+            interval=self._poll_interval,
+            concurrency=config.get("poll_concurrency", 64),
+            deadline=config.get("poll_deadline"),
+            spread=config.get("poll_spread", 0.5),
+            schedule=PollSchedule(self._poll_interval),
+        )
+        self._configure_polling(config)
+
+    def _configure_polling(self, config: dict) -> None:
+        """Set the base, per-driver, per-device and fast-lane poll intervals from the config."""
+        self._poll_interval = config.get("poll_interval", 10)
+        self._driver_intervals = config.get("poll_intervals", {}) or {}
+        self._notify_poll_interval = float(config.get("notify_poll_interval", 120))
+        schedule = self.poller.schedule
+        schedule.default_interval = self._poll_interval
+        schedule.offline_max = config.get("poll_offline_max", 300)
+        schedule.fast_interval = config.get("poll_fast_interval", 2)
+        schedule.fast_window = config.get("poll_fast_window", 30)
+        # Cycles run at the shortest configured base interval; slower devices skip cycles
+        cycle_interval = min([self._poll_interval, *self._driver_intervals.values()])
+        for dev in self.index.devices.values():
+            interval = self._scheduled_interval(dev, self.devices.get(dev.id))
+            schedule.set_interval(dev.id, interval)
+            cycle_interval = min(cycle_interval, interval)
+        self.poller.set_interval(cycle_interval)
 
     async def startup(self) -> None:
-        """Initialize all rooms and connect to devices."""
-        for room_id, room_data in self.config.get("rooms", {}).items():
-            self.rooms[room_id] = room_data
-            for device_conf in room_data.get("devices", []):
-                device_id = device_conf["id"]
+        """Load all drivers and start connecting in the background.
+
+        Returns without waiting for devices, so the API serves immediately while
+        devices report ``connecting`` until their first state arrives.
+        """
+        if self.notifications is not None:
+            try:
+                await self.notifications.start()
+            except OSError as e:
+                logger.error(f"Cannot listen for device notifications, polling instead: {e}")
+                self.notifications = None
+
+        for device_id, dev in self.index.devices.items():
+            self._load_driver(device_id, dev)
+
+        self._connect_task = asyncio.create_task(self._connect_all(), name="connect-devices")
+        self.poller.start(lambda: list(self.devices))
+        logger.info("RoomStateManager started")
+
+    def _load_driver(self, device_id: str, dev: DeviceConfig) -> "DeviceDriver | None":
+        try:
+            driver = self.plugin_loader.load_driver(device_id, dev.raw)
+        except Exception as e:
+            logger.warning(
+                f"Failed to load driver for device {device_id!r}: {e}", exc_info=True
+            )
+            return None
+        driver.state.status = DeviceStatus.CONNECTING
+        self._poll_timers[device_id] = DEVICE_POLL_SECONDS.labels(device_id)
+        self.snapshots.update(device_id, driver.state.to_dict())
+        driver.on_breaker_change = lambda state: self._on_breaker_change(device_id, state)
+        self.devices[device_id] = driver
+        address = driver.notify_address
+        if self.notifications is not None and address is not None:
+            self.notifications.register(device_id, *address)
+            self.poller.schedule.set_interval(device_id, self._scheduled_interval(dev, driver))
+        return driver
+
+    def _on_breaker_change(self, device_id: str, state: str) -> None:
+        if state == "closed":
+            logger.info(f"Device {device_id!r} answered again, circuit breaker closed")
+        else:
+            logger.warning(f"Device {device_id!r} unreachable, circuit breaker open")
+        # Publish the new state promptly rather than after a backed-off poll
+        self.poller.expedite(device_id)
+
+    def _on_notification(self, device_id: str, command: str, value: str) -> None:
+        driver = self.devices.get(device_id)
+        if driver is None or driver.state.status == DeviceStatus.CONNECTING:
+            return  # the first state comes from the startup connect
+        was_online = driver.state.status == DeviceStatus.ONLINE
+        was_powered = driver.state.power
+        if not driver.apply_notification(command, value):
+            logger.debug(f"Ignored notification {command}={value!r} from {device_id!r}")
+            return
+        NOTIFICATIONS.labels(command).inc()
+        state = driver.state
+        self._spawn_notify_task(self._publish_state(device_id, state.to_dict()), device_id)
+        if driver.in_transition:
+            self.poller.expedite(device_id)
+        elif not was_online or (state.power and not was_powered):
+            # Just came up: poll once for what the notification didn't carry (e.g. input)
+            self._spawn_notify_task(self._poll_device(device_id, driver), device_id)
+
+    def _spawn_notify_task(self, coro, device_id: str) -> None:
+        task = asyncio.create_task(coro, name=f"notify:{device_id}")
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
+
+    async def _connect_all(self) -> None:
+        semaphore = asyncio.Semaphore(self._connect_concurrency)
+        start = time.perf_counter()
+
+        async def connect_one(device_id: str, driver: "DeviceDriver") -> None:
+            async with semaphore:
+                await self._connect_device(device_id, driver)
+
+        await asyncio.gather(*(connect_one(did, drv) for did, drv in list(self.devices.items())))
+        logger.info(f"Connected {len(self.devices)} devices in {time.perf_counter() - start:.2f}s")
+
+    async def _connect_device(self, device_id: str, driver: "DeviceDriver") -> None:
+        t0 = time.perf_counter()
+        try:
+            connected = await driver.connect()
+        except OSError as e:
+            logger.warning(f"Failed to connect device {device_id!r}: {e}")
+            connected = False
+        except Exception:
+            logger.exception(f"Driver error connecting device {device_id!r}")
+            connected = False
+        if connected:
+            await self._poll_device(device_id, driver)
+        else:
+            driver.state.status = DeviceStatus.OFFLINE
+            await self._publish_state(device_id, driver.state.to_dict())
+        self.startup_times[device_id] = round(time.perf_counter() - t0, 3)
+        logger.info(
+            f"Device {device_id!r} {driver.state.status.value} "
+            f"after {self.startup_times[device_id]}s"
+        )
+
+    async def apply_config(self, config: dict) -> ConfigDiff:
+        """Apply a reloaded config, restarting only the drivers whose config changed.
+
+        Rooms whose definition changed get a ``room_config_changed`` event so
+        connected clients can resnapshot. Poll intervals are recomputed from the
+        new config; other global settings still need a restart.
+        """
+        new_index = compile_config(config)
+        diff = diff_config(self.index, new_index)
+
+        for device_id in diff.devices_removed | diff.devices_changed:
+            DEVICE_POLL_SECONDS.remove(device_id)
+            self._poll_timers.pop(device_id, None)
+            if self.notifications is not None:
+                self.notifications.unregister(device_id)
+            driver = self.devices.pop(device_id, None)
+            self.poller.schedule.forget(device_id)
+            self.versions.pop(device_id, None)
+            self._last_states.pop(device_id, None)
+            self._last_published.pop(device_id, None)
+            self.startup_times.pop(device_id, None)
+            self.snapshots.remove(device_id)
+            if driver:
                 try:
-                    driver = self.plugin_loader.load_driver(device_id, device_conf)
-                    self.devices[device_id] = driver
-                    await driver.connect()
-                    logger.info(f"Connected to device {device_id!r}")
+                    await driver.close()
                 except Exception as e:
-                    logger.warning(f"Failed to connect device {device_id!r}: {e}")
+                    logger.warning(f"Error disconnecting {device_id}: {e}", exc_info=True)
 
-        self._scheduler.add_job(
-            self._poll_all_devices,
-            "interval",
-            seconds=self._poll_interval,
-            id="poll_devices",
-        )
-        self._scheduler.start()
-        logger.info("RoomStateManager started")
+        self.config = config
+        self.index = new_index
+        self._configure_polling(config)
+        self._reindex(new_index, diff.rooms_added | diff.rooms_changed)
+
+        for device_id in diff.devices_added | diff.devices_changed:
+            dev = new_index.devices[device_id]
+            driver = self._load_driver(device_id, dev)
+            if driver is None:
+                continue
+            task = asyncio.create_task(
+                self._connect_device(device_id, driver), name=f"connect:{device_id}"
+            )
+            self._reconnects.add(task)
+            task.add_done_callback(self._reconnects.discard)
+
+        for room_id in diff.rooms_added | diff.rooms_removed | diff.rooms_changed:
+            await self.event_bus.publish("room_config_changed", {
+                "room_id": room_id,
+                "removed": room_id in diff.rooms_removed,
+            })
+        if diff:
+            logger.info(f"Config reloaded: {diff}")
+        return diff
+
+    def _reindex(self, index: ConfigIndex, rooms_changed: frozenset[str]) -> None:
+        self.snapshots.set_index(index, rooms_changed)
+
+    def room_snapshot(self, room_id: str) -> dict[str, dict]:
+        room = self.index.rooms.get(room_id)
+        if not room:
+            return {}
+        return {
+            did: self.devices[did].state.to_dict()
+            for did in room.device_ids
+            if did in self.devices
+        }
+
+    def breaker_stats(self) -> dict:
+        tripped = {
+            did: drv.breaker.snapshot()
+            for did, drv in self.devices.items()
+            if drv.breaker.is_open
+        }
+        return {"open": len(tripped), "devices": tripped}
+
+    def notification_stats(self) -> dict | None:
+        return self.notifications.stats() if self.notifications is not None else None
+
+    def startup_stats(self) -> dict:
+        return {
+            "connecting": sum(
+                1 for drv in self.devices.values() if drv.state.status == DeviceStatus.CONNECTING
+            ),
+            "device_seconds": dict(self.startup_times),
+        }
 
     async def shutdown(self) -> None:
-        """Disconnect all devices and stop scheduler."""
-        self._scheduler.shutdown(wait=False)
+        """Disconnect all devices and stop polling."""
+        connects = [t for t in [self._connect_task, *self._reconnects, *self._notify_tasks] if t]
+        for task in connects:
+            task.cancel()
+        await asyncio.gather(*connects, return_exceptions=True)
+        await self.poller.stop()
+        if self.notifications is not None:
+            self.notifications.stop()
         for device_id, driver in self.devices.items():
             try:
-                await driver.disconnect()
+                await driver.close()
             except Exception as e:
                 logger.warning(f"Error disconnecting {device_id}: {e}")
         logger.info("RoomStateManager stopped")
 
-    async def _poll_all_devices(self) -> None:
-        tasks = [self._poll_device(did, drv) for did, drv in self.devices.items()]
-        await asyncio.gather(*tasks, return_exceptions=True)
+    async def _poll_device_by_id(self, device_id: str) -> bool:
+        driver = self.devices.get(device_id)
+        if driver is None:
+            return False
+        if driver.state.status == DeviceStatus.CONNECTING:
+            return True  # first state comes from the startup connect
+        return await self._poll_device(device_id, driver)
 
-    async def _poll_device(self, device_id: str, driver: "DeviceDriver") -> None:
+    async def _poll_device(self, device_id: str, driver: "DeviceDriver") -> bool:
+        """Poll one device; returns whether it answered, which drives offline backoff."""
+        t0 = time.perf_counter()
         try:
             state = await driver.poll()
-            await self.event_bus.publish("device_state_update", {
-                "device_id": device_id,
-                "state": state.model_dump(),
-            })
+            self._poll_timers[device_id].observe(time.perf_counter() - t0)
+            await self._publish_state(device_id, state.to_dict())
+            if driver.in_transition:
+                self.poller.expedite(device_id)
+            return state.status == DeviceStatus.ONLINE
         except Exception as e:
             logger.debug(f"Poll failed for {device_id}: {e}")
+            return False
 
-    def get_room(self, room_id: str) -> dict | None:
-        return self.rooms.get(room_id)
+    async def _publish_state(self, device_id: str, state: dict) -> None:
+        """Publish a device_state_update only if the state changed, or as a heartbeat."""
+        now = time.monotonic()
+        changed = _changed_fields(self._last_states.get(device_id), state)
+        if changed:
+            self.versions[device_id] = self.versions.get(device_id, 0) + 1
+            self._last_states[device_id] = state
+            self.snapshots.update(device_id, state)
+        elif now - self._last_published.get(device_id, 0.0) < self._heartbeat_interval:
+            return
+        self._last_published[device_id] = now
+        await self.event_bus.publish("device_state_update", {
+            "device_id": device_id,
+            "state": state,
+            "version": self.versions.get(device_id, 0),
+            "changed": changed,
+            "heartbeat": not changed,
+        })
+
+    def _scheduled_interval(self, dev: DeviceConfig, driver: "DeviceDriver | None") -> float:
+        interval = self._device_interval(dev)
+        notified = (
+            self.notifications is not None
+            and driver is not None
+            and driver.notify_address is not None
+        )
+        if notified and dev.poll_interval is None:
+            return max(interval, self._notify_poll_interval)
+        return interval
+
+    def _device_interval(self, dev: DeviceConfig) -> float:
+        if dev.poll_interval is not None:
+            return dev.poll_interval
+        return float(self._driver_intervals.get(dev.driver, self._poll_interval))
+
+    async def send_command(self, device_id: str, command: str, **kwargs) -> Any:
+        """Send a command and poll the device quickly for a while to pick up the change."""
+        driver = self.devices[device_id]
+        # Unknown command names would grow the metric's label set without bound
+        label = command.lower() if command.lower() in driver.COMMANDS else "invalid"
+        t0 = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await driver.execute(command, **kwargs)
+            outcome = "ok"
+        except CommandSuperseded:
+            outcome = "superseded"
+            raise
+        except DeviceUnavailable:
+            outcome = "unavailable"
+            raise
+        except ValueError:
+            outcome = "invalid"
+            raise
+        finally:
+            COMMAND_SECONDS.labels(label, outcome).observe(time.perf_counter() - t0)
+        # A rejected command changed nothing; fast polling would defeat the offline backoff
+        self.poller.expedite(device_id)
+        return result
+
+    async def query_command(
+        self, device_id: str, command: str, max_age: float, **kwargs
+    ) -> tuple[Any, str]:
+        """Like send_command, but read-only commands are answered from the polled state
+        when it is at most ``max_age`` seconds old. Returns (result, "cache" or "device").
+        """
+        t0 = time.perf_counter()
+        hit, value = self.devices[device_id].read_cached(command, max_age)
+        if hit:
+            COMMAND_SECONDS.labels(command.lower(), "cached").observe(time.perf_counter() - t0)
+            return value, "cache"
+        return await self.send_command(device_id, command, **kwargs), "device"
+
+    @property
+    def rooms(self) -> Mapping[str, RoomConfig]:
+        return self.index.rooms
+
+    def get_room(self, room_id: str) -> RoomConfig | None:
+        return self.index.rooms.get(room_id)
 
     def get_device(self, device_id: str) -> "DeviceDriver | None":
         return self.devices.get(device_id)
 
-    def get_room_devices(self, room_id: str) -> list[str]:
-        room = self.rooms.get(room_id)
-        if not room:
-            return []
-        return [d["id"] for d in room.get("devices", [])]
+    def get_device_config(self, device_id: str) -> DeviceConfig | None:
+        return self.index.devices.get(device_id)
+
+    def get_room_devices(self, room_id: str) -> tuple[str, ...]:
+        room = self.index.rooms.get(room_id)
+        return room.device_ids if room else ()
+
+
+def _changed_fields(old: dict | None, new: dict) -> list[str]:
+    """Names of the state fields that differ; keys of ``extra`` are reported as ``extra.<key>``."""
+    if old is None:
+        return sorted(new)
+    if old is new:
+        return []  # a state's cached dict is only rebuilt when the state changes
+    changed = [k for k in new if k != "extra" and old.get(k) != new[k]]
+    old_extra, new_extra = old.get("extra", {}), new.get("extra", {})
+    changed += [
+        f"extra.{k}" for k in sorted(old_extra.keys() | new_extra.keys())
+        if old_extra.get(k) != new_extra.get(k)
+    ]
+    return changed
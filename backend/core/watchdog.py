@@ -0,0 +1,213 @@
+import asyncio
+import collections
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any
+
+from core.metrics import ASYNCIO_TASKS, LOOP_LAG_SECONDS, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+TASK_COUNT_INTERVAL = 5.0  # seconds between task census updates of the gauge
+PROFILE_MAX_SECONDS = 60.0
+PROFILE_MIN_INTERVAL = 0.001
+
+# Task name prefixes (before ":") grouped under one kind
+_TASK_KINDS = {
+    "poll-engine": "poll",
+    "poll-fast": "poll",
+    "device-probe": "poll",
+    "device-poll": "poll",
+    "device-queue": "command",
+    "bulk": "command",
+    "ws-bulk": "command",
+    "ws-throttle": "ws",
+}
+_OWN_TASK_NAME = re.compile(r"[a-z][a-z-]*(:|$)")
+_SOURCE_ROOTS = sorted(
+    {os.path.dirname(os.path.dirname(os.path.abspath(__file__)))} | set(sys.path),
+    key=len,
+    reverse=True,
+)
+
+
+def task_kind(task: asyncio.Task) -> str:
+    """Group a task by what it does: its name prefix, or the ASGI cycle for server tasks."""
+    name = task.get_name()
+    if _OWN_TASK_NAME.match(name):
+        prefix = name.split(":", 1)[0]
+        return _TASK_KINDS.get(prefix, prefix)
+    qualname = getattr(task.get_coro(), "__qualname__", "")
+    if "WebSocket" in qualname or "WSProtocol" in qualname:
+        return "ws"
+    if "RequestResponseCycle" in qualname:
+        return "http"
+    return "other"
+
+
+def _describe(task: asyncio.Task | None) -> str:
+    if task is None:
+        return "(no task)"
+    coro = task.get_coro()
+    return f"{task.get_name()} ({getattr(coro, '__qualname__', type(coro).__name__)})"
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    for root in _SOURCE_ROOTS:
+        if root and path.startswith(root + os.sep):
+            path = path[len(root) + 1:]
+            break
+    # ";" separates frames and the last space the count in the folded format
+    return f"{code.co_qualname} ({path}:{frame.f_lineno})".replace(";", ",").replace(" ", "_")
+
+
+def _stack(frame) -> list[str]:
+    """Frame labels from the outermost call to ``frame``."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class LoopWatchdog:
+    """Watches the event loop from a helper thread.
+
+    A coroutine wakes every ``interval`` seconds and records how late it woke
+    (the loop lag). When it hasn't woken ``slow_threshold`` seconds past its
+    deadline, the thread grabs the loop thread's stack and the task that is
+    running, so a stall is reported with the code that caused it rather than
+    only its length. ``profile`` samples the loop thread the same way.
+    """
+
+    def __init__(self, interval: float = 0.25, slow_threshold: float = 0.1, keep: int = 20):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.stalls: collections.deque[dict] = collections.deque(maxlen=keep)
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._deadline = 0.0
+        self._pending: dict | None = None
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._profiling = False
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._deadline = time.monotonic() + self.interval
+        self._stop.clear()
+        self._task = self._loop.create_task(self._run(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+
+    async def _run(self) -> None:
+        next_count = 0.0
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            if now >= next_count:
+                self.task_counts()
+                next_count = now + TASK_COUNT_INTERVAL
+            lag = max(0.0, now - self._deadline)
+            self._deadline = now + self.interval
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.labels().observe(lag)
+            stall, self._pending = self._pending, None
+            if stall is not None:
+                stall["duration_ms"] = round(lag * 1000, 1)
+                self.stalls.append(stall)
+                LOOP_STALLS.labels(stall["kind"]).inc()
+                logger.warning(
+                    f"Event loop blocked for {lag * 1000:.0f} ms by {stall['task']} at "
+                    f"{stall['stack'][-1] if stall['stack'] else '?'}"
+                )
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.slow_threshold / 2):
+            deadline = self._deadline
+            if self._pending is None and time.monotonic() - deadline > self.slow_threshold:
+                task = self._current_task()
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = _stack(frame) if frame is not None else []
+                # The loop may have caught up while we looked; only report if it hasn't
+                if self._deadline == deadline:
+                    self._pending = {
+                        "at": time.time(),
+                        "task": _describe(task),
+                        "kind": task_kind(task) if task is not None else "callback",
+                        "stack": stack[-12:],
+                    }
+
+    def _current_task(self) -> asyncio.Task | None:
+        try:
+            return asyncio.current_task(self._loop)
+        except RuntimeError:
+            return None
+
+    def task_counts(self) -> dict[str, int]:
+        counts = collections.Counter(task_kind(t) for t in asyncio.all_tasks(self._loop))
+        for (kind,), child in ASYNCIO_TASKS.children.items():
+            child.set(counts.get(kind, 0))
+        for kind, n in counts.items():
+            ASYNCIO_TASKS.labels(kind).set(n)
+        return dict(sorted(counts.items()))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "slow_threshold_ms": self.slow_threshold * 1000,
+            "tasks": self.task_counts(),
+            "stalls": list(self.stalls),
+        }
+
+    async def profile(self, seconds: float, interval: float = 0.005) -> str:
+        """Sample the loop thread for ``seconds`` and return folded stacks.
+
+        Each line is ``task-kind;outer;...;inner count``, the input format of
+        flamegraph.pl, speedscope and similar viewers. Samples taken while the
+        loop waits for I/O end in the selector, so idle time shows up too.
+        """
+        if self._profiling:
+            raise RuntimeError("A profile is already being recorded")
+        if self._loop is None:  # profiling works without the watchdog running
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+        self._profiling = True
+        try:
+            interval = max(interval, PROFILE_MIN_INTERVAL)
+            return await asyncio.to_thread(self._sample, seconds, interval)
+        finally:
+            self._profiling = False
+
+    def _sample(self, seconds: float, interval: float) -> str:
+        counts: collections.Counter[str] = collections.Counter()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                task = self._current_task()
+                root = f"task:{task_kind(task)}" if task is not None else "loop"
+                counts[";".join([root, *_stack(frame)])] += 1
+            time.sleep(interval)
+        return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
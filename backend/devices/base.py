@@ -1,7 +1,21 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
 from abc import ABC, abstractmethod
-from enum import Enum
-from typing import Any, Optional
-from pydantic import BaseModel
+from collections.abc import Awaitable, Callable, Hashable, Mapping
+from enum import Enum, IntEnum
+from types import MappingProxyType
+from typing import Any, ClassVar
+
+from devices.breaker import (
+    BREAKER_PROBE_INTERVAL,
+    BREAKER_THRESHOLD,
+    BreakerState,
+    CircuitBreaker,
+    DeviceUnavailable,
+)
 
 
 class DeviceStatus(str, Enum):
@@ -9,19 +23,196 @@ class DeviceStatus(str, Enum):
     OFFLINE = "offline"
     ERROR = "error"
     UNKNOWN = "unknown"
+    CONNECTING = "connecting"
+
+
+_UNSET: Any = object()
+
+
+class DeviceState:
+    """A device's current state, owned by its driver and updated in place.
+
+    ``extra`` is read-only here; change it through ``update``. When the driver
+    declares ``EXTRA_FIELDS``, other keys are rejected. ``to_dict`` is built
+    once per change and shared, so don't mutate it. ``refreshed_at`` is the
+    monotonic time the device last confirmed the state (changed or not), or 0
+    if it may no longer be accurate.
+    """
+
+    __slots__ = (
+        "_breaker", "_dict", "_extra", "_extra_view", "_fields", "_power", "_status",
+        "refreshed_at",
+    )
+
+    def __init__(
+        self,
+        status: DeviceStatus = DeviceStatus.UNKNOWN,
+        power: bool | None = None,
+        extra: Mapping[str, Any] | None = None,
+        breaker: str = "closed",
+        fields: tuple[str, ...] | None = None,
+    ):
+        self._fields = fields
+        self._status = DeviceStatus(status)
+        self._power = power
+        self._breaker = breaker
+        self._set_extra(extra or {})
+        self._dict: dict | None = None
+        self.refreshed_at = 0.0
+
+    @property
+    def status(self) -> DeviceStatus:
+        return self._status
+
+    @status.setter
+    def status(self, value: DeviceStatus) -> None:
+        self.update(status=value)
+
+    @property
+    def power(self) -> bool | None:
+        return self._power
+
+    @power.setter
+    def power(self, value: bool | None) -> None:
+        self.update(power=value)
+
+    @property
+    def breaker(self) -> str:
+        return self._breaker
+
+    @breaker.setter
+    def breaker(self, value: str) -> None:
+        self.update(breaker=value)
+
+    @property
+    def extra(self) -> Mapping[str, Any]:
+        return self._extra_view
+
+    def update(
+        self,
+        status: DeviceStatus = _UNSET,
+        power: bool | None = _UNSET,
+        extra: Mapping[str, Any] = _UNSET,
+        breaker: str = _UNSET,
+    ) -> bool:
+        """Set the given fields (``extra`` is replaced whole); returns whether anything changed."""
+        changed = False
+        if status is not _UNSET and status != self._status:
+            self._status = DeviceStatus(status)
+            changed = True
+        if power is not _UNSET and power != self._power:
+            self._power = power
+            changed = True
+        if extra is not _UNSET and extra != self._extra:
+            self._set_extra(extra)
+            changed = True
+        if breaker is not _UNSET and breaker != self._breaker:
+            self._breaker = breaker
+            changed = True
+        if changed:
+            self._dict = None
+        return changed
+
+    def _set_extra(self, extra: Mapping[str, Any]) -> None:
+        if self._fields is not None:
+            unknown = extra.keys() - set(self._fields)
+            if unknown:
+                raise ValueError(f"Undeclared state fields: {sorted(unknown)}")
+        self._extra = dict(extra)
+        self._extra_view = MappingProxyType(self._extra)
+
+    def to_dict(self) -> dict[str, Any]:
+        if self._dict is None:
+            self._dict = {
+                "status": self._status.value,
+                "power": self._power,
+                "extra": dict(self._extra),
+                "breaker": self._breaker,
+            }
+        return self._dict
+
+    def __repr__(self) -> str:
+        return (
+            f"DeviceState(status={self._status.value!r}, power={self._power!r}, "
+            f"extra={self._extra!r}, breaker={self._breaker!r})"
+        )
+
+
+class CommandPriority(IntEnum):
+    """Lower runs first."""
+    USER = 0
+    POLL = 10
+
+
+# Failures that mean the device could not be reached (PermissionError is a bad password)
+_TRANSPORT_ERRORS = (OSError, EOFError)
+
+
+class CommandSuperseded(Exception):
+    """A queued command was replaced by a newer one of the same kind before it ran."""
+
 
+class _QueuedCommand:
+    __slots__ = ("future", "key", "priority", "run", "seq", "task", "waiters")
 
-class DeviceState(BaseModel):
-    status: DeviceStatus = DeviceStatus.UNKNOWN
-    power: Optional[bool] = None
-    extra: dict[str, Any] = {}
+    def __init__(self, priority: int, seq: int, key: Hashable | None, run, future):
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.run: Callable[[], Awaitable[Any]] | None = run
+        self.future: asyncio.Future = future
+        # Shared polls only: callers still waiting, and the running task so it can be cancelled
+        self.waiters = 0
+        self.task: asyncio.Task | None = None
+
+    def cancel(self) -> None:
+        """Abandon the job, stopping it if it's already running."""
+        self.run = None
+        self.future.cancel()
+        if self.task is not None:
+            self.task.cancel()
+
+    def __lt__(self, other: "_QueuedCommand") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
 
 
 class DeviceDriver(ABC):
+    """Base class for device drivers.
+
+    Commands and polls go through a per-device queue and run one at a time,
+    user commands ahead of polls. A queued command whose ``command_key`` matches
+    a newer one is superseded, so only the latest e.g. input change runs; a
+    queued poll is shared by everyone who asks for one.
+
+    Each driver also has a circuit breaker: after ``breaker_threshold`` failed
+    commands or polls in a row, commands fail at once with DeviceUnavailable and
+    polls report offline without touching the network, while a background probe
+    retries every ``breaker_probe_interval`` seconds until the device answers.
+    """
+
+    # Command names send_command accepts; metrics label anything else "invalid"
+    COMMANDS: ClassVar[frozenset[str]] = frozenset()
+    # Keys a driver may put in DeviceState.extra; None allows any
+    EXTRA_FIELDS: ClassVar[tuple[str, ...] | None] = None
+    # Read-only commands and the state field (dotted path) that answers them
+    QUERY_COMMANDS: ClassVar[Mapping[str, str]] = {}
+
     def __init__(self, device_id: str, config: dict):
         self.device_id = device_id
         self.config = config
-        self._state = DeviceState()
+        self._state = DeviceState(fields=self.EXTRA_FIELDS)
+        self._queue: list[_QueuedCommand] = []
+        self._queued: dict[Hashable, _QueuedCommand] = {}
+        self._queue_seq = itertools.count()
+        self._queue_task: asyncio.Task | None = None
+        self.breaker = CircuitBreaker(
+            int(config.get("breaker_threshold", BREAKER_THRESHOLD)),
+            float(config.get("breaker_probe_interval", BREAKER_PROBE_INTERVAL)),
+            on_change=self._breaker_changed,
+        )
+        # Set by the owner to hear when the breaker opens or closes
+        self.on_breaker_change: Callable[[BreakerState], None] | None = None
+        self._probe_task: asyncio.Task | None = None
 
     @abstractmethod
     async def connect(self) -> bool: ...
@@ -39,6 +230,205 @@ class DeviceDriver(ABC):
     def state(self) -> DeviceState:
         return self._state
 
+    @property
+    def in_transition(self) -> bool:
+        """True while the device is changing state (e.g. warming up) and worth polling fast."""
+        return False
+
+    def command_key(self, command: str, kwargs: dict) -> Hashable | None:
+        """Commands with the same key supersede each other while queued; None never collapses."""
+        return None
+
+    @property
+    def notify_address(self) -> tuple[str, int] | None:
+        """(host, port) the device pushes status notifications from, or None if it doesn't."""
+        return None
+
+    def apply_notification(self, command: str, value: str) -> bool:
+        """Fold a pushed status notification into the state; returns whether it was used."""
+        return False
+
+    def read_cached(self, command: str, max_age: float) -> tuple[bool, Any]:
+        """Answer a read-only command from a state refreshed within ``max_age`` seconds.
+
+        Returns (True, value) on a hit, (False, None) if the device has to be asked.
+        """
+        path = self.QUERY_COMMANDS.get(command.lower())
+        state = self._state
+        if (
+            path is None
+            or not state.refreshed_at
+            or state.status != DeviceStatus.ONLINE
+            # Written as "not <=" so that a NaN max_age misses instead of always hitting
+            or not time.monotonic() - state.refreshed_at <= max_age
+        ):
+            return False, None
+        value: Any = state.to_dict()
+        for part in path.split("."):
+            if not isinstance(value, Mapping) or part not in value:
+                return False, None
+            value = value[part]
+        return True, value
+
+    def submit_command(
+        self, command: str, priority: int = CommandPriority.USER, **kwargs
+    ) -> asyncio.Future:
+        """Queue a command; the future resolves to its result or CommandSuperseded.
+
+        Fails immediately with DeviceUnavailable while the breaker is open.
+        """
+        if self.breaker.is_open:
+            future = asyncio.get_running_loop().create_future()
+            future.set_exception(DeviceUnavailable(
+                self.device_id, self.breaker.retry_after(), self.breaker.last_error
+            ))
+            return future
+
+        async def run() -> Any:
+            try:
+                result = await self.send_command(command, **kwargs)
+            except PermissionError:
+                raise
+            except _TRANSPORT_ERRORS as e:
+                self.breaker.record_failure(str(e) or type(e).__name__)
+                raise
+            if command.lower() not in self.QUERY_COMMANDS:
+                self._state.refreshed_at = 0.0  # the command may have changed the device
+            self.breaker.record_success()
+            return result
+
+        return self._submit(run, priority, self.command_key(command, kwargs)).future
+
+    async def execute(self, command: str, priority: int = CommandPriority.USER, **kwargs) -> Any:
+        return await self.submit_command(command, priority, **kwargs)
+
     async def poll(self) -> DeviceState:
-        self._state = await self.get_state()
+        if self.breaker.is_open:
+            self._state.update(
+                status=DeviceStatus.OFFLINE, power=None, extra={}, breaker=self.breaker.state
+            )
+            return self._state
+        job = self._queued.get(_POLL_KEY)
+        if job is None:
+            job = self._submit(self._refresh_state, CommandPriority.POLL, _POLL_KEY)
+        job.waiters += 1
+        try:
+            # Shielded: one caller giving up must not cancel a poll others are waiting on
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            if job.waiters == 1:
+                # Nobody else wants it: stop the device I/O too, so the poll engine's
+                # concurrency bound and cycle deadline still hold
+                if self._queued.get(_POLL_KEY) is job:
+                    del self._queued[_POLL_KEY]
+                job.cancel()
+            raise
+        finally:
+            job.waiters -= 1
+
+    async def _refresh_state(self) -> DeviceState:
+        try:
+            state = await self.get_state()
+        except Exception as e:
+            self.breaker.record_failure(str(e) or type(e).__name__)
+            raise
+        if state.status == DeviceStatus.OFFLINE:
+            self.breaker.record_failure("no response to poll")
+        else:
+            self.breaker.record_success()
+        if state is not self._state:
+            self._state.update(status=state.status, power=state.power, extra=state.extra)
+        self._state.breaker = self.breaker.state
+        if state.status != DeviceStatus.OFFLINE:
+            self._state.refreshed_at = time.monotonic()
         return self._state
+
+    def _breaker_changed(self, state: BreakerState) -> None:
+        self._state.breaker = state
+        if state == "open" and self._probe_task is None:
+            self._probe_task = asyncio.get_running_loop().create_task(
+                self._probe(), name=f"device-probe:{self.device_id}"
+            )
+        if self.on_breaker_change:
+            self.on_breaker_change(state)
+
+    async def _probe(self) -> None:
+        try:
+            while self.breaker.is_open:
+                await asyncio.sleep(self.breaker.retry_after())
+                self.breaker.start_probe()
+                with contextlib.suppress(Exception):
+                    # A failure is recorded by _refresh_state; the breaker stays open
+                    await self._submit(self._refresh_state, CommandPriority.POLL, None).future
+        finally:
+            self._probe_task = None
+
+    async def close(self) -> None:
+        """Stop probing and disconnect."""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+        await self.disconnect()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queued) + sum(1 for job in self._queue if job.key is None)
+
+    def _submit(self, run, priority: int, key: Hashable | None) -> _QueuedCommand:
+        loop = asyncio.get_running_loop()
+        job = _QueuedCommand(priority, next(self._queue_seq), key, run, loop.create_future())
+        if key is not None:
+            previous = self._queued.get(key)
+            if previous is not None:
+                previous.run = None  # skipped when it reaches the head of the queue
+                if not previous.future.done():
+                    previous.future.set_exception(CommandSuperseded(
+                        f"{self.device_id}: superseded by a newer {key!r} command"
+                    ))
+                    previous.future.exception()  # don't warn if the caller went away
+            self._queued[key] = job
+        heapq.heappush(self._queue, job)
+        if self._queue_task is None:
+            self._queue_task = loop.create_task(
+                self._drain_queue(), name=f"device-queue:{self.device_id}"
+            )
+        return job
+
+    async def _drain_queue(self) -> None:
+        try:
+            while self._queue:
+                job = heapq.heappop(self._queue)
+                if job.key is not None and self._queued.get(job.key) is job:
+                    del self._queued[job.key]
+                if job.run is None or job.future.done():
+                    continue  # superseded, or the caller gave up before it started
+                try:
+                    if job.key == _POLL_KEY:
+                        # In its own task so poll() can cancel it without stopping the queue
+                        job.task = asyncio.get_running_loop().create_task(
+                            job.run(), name=f"device-poll:{self.device_id}"
+                        )
+                        result = await job.task
+                    else:
+                        result = await job.run()
+                except asyncio.CancelledError:
+                    abandoned = job.task is not None and job.task.cancelled()
+                    if abandoned and not asyncio.current_task().cancelling():
+                        continue  # only the abandoned poll was cancelled
+                    job.future.cancel()
+                    raise
+                except Exception as e:  # noqa: BLE001 - handed to the caller through the future
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    if not job.future.done():
+                        job.future.set_result(result)
+        finally:
+            self._queue_task = None
+            for job in self._queue:  # only left over if the worker itself was cancelled
+                job.future.cancel()
+            self._queue.clear()
+            self._queued.clear()
+
+
+_POLL_KEY = ("__poll__",)
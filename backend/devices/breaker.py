@@ -0,0 +1,95 @@
+import time
+from collections.abc import Callable
+from typing import Literal
+
+BreakerState = Literal["closed", "open", "half_open"]
+
+BREAKER_THRESHOLD = 3
+BREAKER_PROBE_INTERVAL = 10.0
+
+
+class DeviceUnavailable(Exception):
+    """Raised without touching the network while a device's circuit breaker is open."""
+
+    def __init__(self, device_id: str, retry_after: float, last_error: str | None = None):
+        self.device_id = device_id
+        self.retry_after = retry_after
+        self.last_error = last_error
+        reason = f" ({last_error})" if last_error else ""
+        super().__init__(
+            f"Device {device_id!r} is unreachable{reason}; retry in {retry_after:.1f}s"
+        )
+
+
+class CircuitBreaker:
+    """Counts consecutive transport failures for one device.
+
+    ``threshold`` failures in a row open the breaker. While open, callers fail
+    fast and the driver probes the device every ``probe_interval`` seconds
+    (half-open); a successful probe closes the breaker, a failed one keeps it open.
+    """
+
+    def __init__(
+        self,
+        threshold: int = BREAKER_THRESHOLD,
+        probe_interval: float = BREAKER_PROBE_INTERVAL,
+        on_change: Callable[[BreakerState], None] | None = None,
+    ):
+        self.threshold = max(1, threshold)
+        self.probe_interval = probe_interval
+        self.on_change = on_change
+        self.state: BreakerState = "closed"
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.next_probe_at: float | None = None
+        self.last_error: str | None = None
+        self.trips = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.state != "closed"
+
+    def retry_after(self) -> float:
+        if self.next_probe_at is None:
+            return 0.0
+        return max(0.0, self.next_probe_at - time.monotonic())
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.last_error = None
+        if self.state != "closed":
+            self.opened_at = self.next_probe_at = None
+            self._set("closed")
+
+    def record_failure(self, error: str) -> None:
+        self.failures += 1
+        self.last_error = error
+        if self.state == "half_open" or (
+            self.state == "closed" and self.failures >= self.threshold
+        ):
+            if self.state == "closed":
+                self.trips += 1
+                self.opened_at = time.monotonic()
+            self.next_probe_at = time.monotonic() + self.probe_interval
+            self._set("open")
+
+    def start_probe(self) -> None:
+        self._set("half_open")
+
+    def _set(self, state: BreakerState) -> None:
+        previous, self.state = self.state, state
+        # Probing flips open <-> half_open every interval; only report opening and closing
+        if self.on_change and (previous == "closed") != (state == "closed"):
+            self.on_change(state)
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "last_error": self.last_error,
+            "open_seconds": (
+                round(time.monotonic() - self.opened_at, 1) if self.opened_at else None
+            ),
+            "retry_after": round(self.retry_after(), 1) if self.is_open else None,
+        }
@@ -1,18 +1,34 @@
 import asyncio
 import hashlib
 import logging
-from typing import Any, Optional
+import time
+from typing import Any, ClassVar
 
+from core.metrics import PJLINK_PHASE_SECONDS
 from devices.base import DeviceDriver, DeviceState, DeviceStatus
 
 logger = logging.getLogger(__name__)
 
 PJLINK_PORT = 4352
 PJLINK_TIMEOUT = 5.0
+PJLINK_IDLE_TIMEOUT = 20.0  # projectors drop idle sessions after ~30 s
+
+_CONNECT_SECONDS = PJLINK_PHASE_SECONDS.labels("connect")
+_GREETING_SECONDS = PJLINK_PHASE_SECONDS.labels("greeting")
+_RESPONSE_SECONDS = PJLINK_PHASE_SECONDS.labels("response")
 
 
 class PJLinkDriver(DeviceDriver):
-    """PJLink Class 1 display/projector driver (TCP, async)."""
+    """PJLink Class 1 display/projector driver (TCP, async).
+
+    With ``notify: true`` the projector is expected to push Class 2 status
+    notifications (power and input changes), which the state manager feeds
+    to ``apply_notification``; such devices are polled much less often.
+    """
+
+    COMMANDS = frozenset(
+        {"power_on", "power_off", "input", "mute_on", "mute_off", "query_power"}
+    )
 
     POWER_STATES = {
         "0": False,   # off
@@ -21,12 +37,69 @@ class PJLinkDriver(DeviceDriver):
         "3": None,    # cooling
     }
 
+    EXTRA_FIELDS = ("raw_power", "input", "lamp_hours")
+    QUERY_COMMANDS: ClassVar[dict[str, str]] = {"query_power": "extra.raw_power"}
+
     def __init__(self, device_id: str, config: dict):
         super().__init__(device_id, config)
         self.host: str = config.get("host", "127.0.0.1")
         self.port: int = int(config.get("port", PJLINK_PORT))
         self.password: str = config.get("password", "")
+        # Session mode keeps one authenticated connection open and pipelines commands over it
+        self.session: bool = bool(config.get("session", False))
+        self.idle_timeout: float = float(config.get("idle_timeout", PJLINK_IDLE_TIMEOUT))
+        self.notify: bool = bool(config.get("notify", False))
         self._lock = asyncio.Lock()
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._auth_prefix = ""
+        self._idle_handle: asyncio.TimerHandle | None = None
+
+    # Queued commands in the same group supersede each other (e.g. power_on then power_off)
+    COMMAND_GROUPS: ClassVar[dict[str, str]] = {
+        "power_on": "power",
+        "power_off": "power",
+        "input": "input",
+        "mute_on": "mute",
+        "mute_off": "mute",
+    }
+
+    @property
+    def in_transition(self) -> bool:
+        return self._state.extra.get("raw_power") in ("2", "3")
+
+    def command_key(self, command: str, kwargs: dict) -> str | None:
+        return self.COMMAND_GROUPS.get(command.lower())
+
+    @property
+    def notify_address(self) -> tuple[str, int] | None:
+        return (self.host, self.port) if self.notify else None
+
+    def apply_notification(self, command: str, value: str) -> bool:
+        value = value.strip()
+        if command == "POWR":
+            power = self.POWER_STATES.get(value)
+            # Like a poll, input and lamp hours are only reported while powered on
+            kept = self._state.extra if power is True else {}
+            extra = {"raw_power": value, **{
+                k: kept[k] for k in ("input", "lamp_hours") if k in kept
+            }}
+            self._state.update(status=DeviceStatus.ONLINE, power=power, extra=extra)
+            self._state.refreshed_at = time.monotonic()  # the projector just told us its power
+        elif command == "INPT":
+            if value.startswith("ERR"):
+                return False
+            self._state.update(
+                status=DeviceStatus.ONLINE, extra={**self._state.extra, "input": value}
+            )
+        elif command == "LKUP":
+            # Sent when the projector joins the network; power and input follow by poll
+            self._state.update(status=DeviceStatus.ONLINE)
+        else:
+            return False
+        self.breaker.record_success()
+        self._state.breaker = self.breaker.state
+        return True
 
     async def connect(self) -> bool:
         try:
@@ -40,38 +113,43 @@ class PJLinkDriver(DeviceDriver):
             return False
 
     async def disconnect(self) -> None:
-        pass  # PJLink is connectionless (new TCP conn per command)
+        # Without session mode PJLink is connectionless (new TCP conn per command)
+        async with self._lock:
+            await self._close_session()
 
     async def get_state(self) -> DeviceState:
+        """Poll the projector and update the driver's state in place."""
         try:
-            power_resp = await self._command("POWR", "?")
+            inp: str | None = None
+            lamp: str | None = None
+            if self.session:
+                # One round trip per poll: input/lamp answers are ignored unless powered on
+                power_resp, inp, lamp = await self._commands(
+                    [("POWR", "?"), ("INPT", "?"), ("LAMP", "?")]
+                )
+            else:
+                power_resp = await self._command("POWR", "?")
             power_str = power_resp.strip()
             power = self.POWER_STATES.get(power_str)
 
             extra: dict[str, Any] = {"raw_power": power_str}
 
             if power is True:
-                try:
-                    inp = await self._command("INPT", "?")
+                if not self.session:
+                    inp = await self._command_or_none("INPT", "?")
+                    lamp = await self._command_or_none("LAMP", "?")
+                if inp is not None:
                     extra["input"] = inp.strip()
-                except Exception:
-                    pass
-                try:
-                    lamp = await self._command("LAMP", "?")
+                if lamp is not None:
                     parts = lamp.strip().split()
-                    if parts:
+                    if parts and parts[0].isdigit():
                         extra["lamp_hours"] = int(parts[0])
-                except Exception:
-                    pass
 
-            return DeviceState(
-                status=DeviceStatus.ONLINE,
-                power=power,
-                extra=extra,
-            )
+            self._state.update(status=DeviceStatus.ONLINE, power=power, extra=extra)
         except Exception as e:
             logger.debug(f"PJLink get_state failed for {self.device_id}: {e}")
-            return DeviceState(status=DeviceStatus.OFFLINE)
+            self._state.update(status=DeviceStatus.OFFLINE, power=None, extra={})
+        return self._state
 
     async def send_command(self, command: str, **kwargs) -> Any:
         cmd = command.lower()
@@ -93,39 +171,150 @@ class PJLinkDriver(DeviceDriver):
 
     async def _command(self, cmd: str, param: str) -> str:
         raw = await self._send_raw(f"%1{cmd} {param}")
+        return self._strip_prefix(cmd, raw)
+
+    async def _command_or_none(self, cmd: str, param: str) -> str | None:
+        try:
+            return await self._command(cmd, param)
+        except Exception:
+            return None
+
+    async def _commands(self, commands: list[tuple[str, str]]) -> list[str]:
+        """Pipeline several commands over one connection and return the responses in order."""
+        raws = await self._send_many([f"%1{cmd} {param}" for cmd, param in commands])
+        return [self._strip_prefix(cmd, raw) for (cmd, _), raw in zip(commands, raws)]
+
+    @staticmethod
+    def _strip_prefix(cmd: str, raw: str) -> str:
         prefix = f"%1{cmd}="
         if raw.startswith(prefix):
             return raw[len(prefix):]
         return raw
 
     async def _send_raw(self, message: str) -> str:
+        return (await self._send_many([message]))[0]
+
+    async def _send_many(self, messages: list[str]) -> list[str]:
         async with self._lock:
-            reader, writer = await asyncio.wait_for(
-                asyncio.open_connection(self.host, self.port),
-                timeout=PJLINK_TIMEOUT,
-            )
-            try:
-                greeting = await asyncio.wait_for(reader.readline(), timeout=PJLINK_TIMEOUT)
-                greeting = greeting.decode("ascii", errors="ignore").strip()
-
-                auth_prefix = ""
-                if greeting.startswith("PJLINK 1"):
-                    token = greeting.split()[-1] if len(greeting.split()) > 2 else ""
-                    if token and self.password:
-                        md5 = hashlib.md5((token + self.password).encode()).hexdigest()
-                        auth_prefix = md5
-                    elif token and not self.password:
-                        auth_prefix = ""
-
-                payload = f"{auth_prefix}{message}" + chr(13) + chr(10)
-                writer.write(payload.encode("ascii"))
-                await writer.drain()
-
-                response = await asyncio.wait_for(reader.readline(), timeout=PJLINK_TIMEOUT)
-                return response.decode("ascii", errors="ignore").strip()
-            finally:
-                writer.close()
+            if not self.session:
+                responses = []
+                for message in messages:
+                    await self._open_session()
+                    try:
+                        responses.extend(await self._exchange([message]))
+                    finally:
+                        await self._close_session()
+                return responses
+
+            # A reused session may have been dropped by the projector. Only reconnect and
+            # resend when that shows before the request is written: once it is out, the
+            # projector may have acted on it, so a lost or slow answer is an error.
+            if self._reader is not None and self._reader.at_eof():
+                await self._close_session()
+            reused = self._writer is not None
+            while True:
                 try:
-                    await writer.wait_closed()
-                except Exception:
-                    pass
+                    if self._writer is None:
+                        await self._open_session()
+                    try:
+                        await self._write(messages)
+                    except ConnectionError:
+                        if not reused:
+                            raise
+                        reused = False
+                        await self._close_session()
+                        logger.debug(f"PJLink {self.device_id} session lost, reconnecting")
+                        continue
+                    responses = await self._read(len(messages))
+                except (PermissionError, asyncio.CancelledError):
+                    # A half-read pipeline would desync later responses, so drop the session
+                    self._drop_session()
+                    raise
+                except (OSError, EOFError, TimeoutError):
+                    await self._close_session()
+                    raise
+                self._arm_idle_timer()
+                return responses
+
+    async def _open_session(self) -> None:
+        t0 = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port),
+            timeout=PJLINK_TIMEOUT,
+        )
+        t1 = time.perf_counter()
+        _CONNECT_SECONDS.observe(t1 - t0)
+        try:
+            greeting = await asyncio.wait_for(reader.readline(), timeout=PJLINK_TIMEOUT)
+        except BaseException:
+            writer.close()
+            raise
+        _GREETING_SECONDS.observe(time.perf_counter() - t1)
+        greeting = greeting.decode("ascii", errors="ignore").strip()
+
+        auth_prefix = ""
+        if greeting.startswith("PJLINK 1"):
+            token = greeting.split()[-1] if len(greeting.split()) > 2 else ""
+            if token and self.password:
+                auth_prefix = hashlib.md5((token + self.password).encode()).hexdigest()
+
+        self._reader, self._writer = reader, writer
+        self._auth_prefix = auth_prefix
+
+    async def _exchange(self, messages: list[str]) -> list[str]:
+        """Write all messages, then read one response line per message."""
+        await self._write(messages)
+        return await self._read(len(messages))
+
+    async def _write(self, messages: list[str]) -> None:
+        assert self._writer is not None
+        # The auth digest only prefixes the first command sent on a connection
+        payload = "".join(message + chr(13) + chr(10) for message in messages)
+        self._writer.write(f"{self._auth_prefix}{payload}".encode("ascii"))
+        self._auth_prefix = ""
+        await self._writer.drain()
+
+    async def _read(self, count: int) -> list[str]:
+        assert self._reader is not None
+        t0 = time.perf_counter()
+        responses = []
+        for _ in range(count):
+            line = await asyncio.wait_for(self._reader.readline(), timeout=PJLINK_TIMEOUT)
+            if not line:
+                raise EOFError("PJLink connection closed by device")
+            response = line.decode("ascii", errors="ignore").strip()
+            if response == "PJLINK ERRA":
+                raise PermissionError(f"PJLink authentication failed for {self.device_id}")
+            responses.append(response)
+        _RESPONSE_SECONDS.observe(time.perf_counter() - t0)
+        return responses
+
+    def _arm_idle_timer(self) -> None:
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+        self._idle_handle = asyncio.get_running_loop().call_later(
+            self.idle_timeout, self._expire_session
+        )
+
+    def _expire_session(self) -> None:
+        self._idle_handle = None
+        if not self._lock.locked():
+            self._drop_session()
+
+    def _drop_session(self) -> None:
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _close_session(self) -> None:
+        writer = self._writer
+        self._drop_session()
+        if writer is None:
+            return
+        try:
+            await writer.wait_closed()
+        except OSError as e:
+            logger.debug(f"PJLink {self.device_id} session close: {e}")
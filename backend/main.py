@@ -1,30 +1,106 @@
+import os
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from pathlib import Path
 
-from api.routes import devices, rooms, system
+from api.routes import devices, history, rooms, system
 from api.websocket import router as ws_router
-from core.config import load_config
+from core.bulk import BulkDispatcher
+from core.cluster import ClusterOwner, FollowerStateManager, OwnerLease
+from core.config import PROJECT_ROOT, ConfigLoader
 from core.event_bus import EventBus
+from core.history import HistoryStore
 from core.plugin_loader import PluginLoader
+from core.reload import ConfigWatcher
+from core.scenes import SceneEngine
 from core.state import RoomStateManager
+from core.watchdog import LoopWatchdog
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    config = load_config()
+    config_loader = ConfigLoader()
+    config = config_loader.load()
+    watchdog_conf = config.get("watchdog", {}) or {}
+    watchdog = LoopWatchdog(
+        interval=watchdog_conf.get("interval", 0.25),
+        slow_threshold=watchdog_conf.get("slow_threshold", 0.1),
+    )
+    if watchdog_conf.get("enabled", True):
+        watchdog.start()  # first, so slow startup work is caught too
+    app.state.watchdog = watchdog
     event_bus = EventBus()
     plugin_loader = PluginLoader(config, event_bus)
-    room_manager = RoomStateManager(config, plugin_loader, event_bus)
+
+    # With several workers, one owns the devices and the others follow it
+    cluster_conf = config.get("cluster", {}) or {}
+    lease = cluster = None
+    if cluster_conf.get("enabled") or os.getenv("NOMY_CLUSTER"):
+        cluster_dir = Path(cluster_conf.get("path", "data/cluster"))
+        if not cluster_dir.is_absolute():
+            cluster_dir = PROJECT_ROOT / cluster_dir
+        sync_interval = cluster_conf.get("sync_interval", 0.1)
+        lease = OwnerLease(cluster_dir / "owner.lock")
+        if lease.acquire():
+            room_manager = RoomStateManager(config, plugin_loader, event_bus)
+            cluster = ClusterOwner(room_manager, cluster_dir, sync_interval)
+        else:
+            lease = None
+            room_manager = cluster = FollowerStateManager(
+                config, plugin_loader, event_bus, cluster_dir, sync_interval
+            )
+    else:
+        room_manager = RoomStateManager(config, plugin_loader, event_bus)
+    follower = isinstance(room_manager, FollowerStateManager)
+    scene_engine = SceneEngine(room_manager, config.get("scene_action_timeout", 10.0))
 
     app.state.config = config
     app.state.event_bus = event_bus
     app.state.plugin_loader = plugin_loader
     app.state.room_manager = room_manager
+    app.state.cluster = cluster
+    app.state.scene_engine = scene_engine
+    app.state.bulk = BulkDispatcher(
+        room_manager,
+        concurrency=config.get("bulk_concurrency", 64),
+        command_timeout=config.get("bulk_command_timeout", 10.0),
+    )
+
+    history_conf = config.get("history", {}) or {}
+    history_store = None
+    if history_conf.get("enabled", True):
+        history_path = Path(
+            os.getenv("NOMY_HISTORY_DB", history_conf.get("path", "data/history.db"))
+        )
+        if not history_path.is_absolute():
+            history_path = PROJECT_ROOT / history_path
+        history_store = HistoryStore(
+            history_path,
+            retention_days=history_conf.get("retention_days", 30),
+            flush_interval=history_conf.get("flush_interval", 1.0),
+        )
+        await history_store.start(event_bus, record=not follower)
+    app.state.history = history_store
 
+    if isinstance(cluster, ClusterOwner):
+        await cluster.start()  # before startup, so followers see the first states too
     await room_manager.startup()
+    watcher = None
+    if config.get("reload") or os.getenv("NOMY_RELOAD"):
+        watcher = ConfigWatcher(config_loader, room_manager, config.get("reload_interval", 2.0))
+        watcher.start()
     yield
+    if watcher:
+        await watcher.stop()
+    if isinstance(cluster, ClusterOwner):
+        await cluster.stop()
     await room_manager.shutdown()
+    if lease:
+        lease.release()
+    if history_store:
+        await history_store.stop()
+    await watchdog.stop()
 
 
 app = FastAPI(
@@ -45,4 +121,5 @@ app.add_middleware(
 app.include_router(system.router, prefix="/api/v1", tags=["system"])
 app.include_router(rooms.router, prefix="/api/v1", tags=["rooms"])
 app.include_router(devices.router, prefix="/api/v1", tags=["devices"])
+app.include_router(history.router, prefix="/api/v1", tags=["history"])
 app.include_router(ws_router, tags=["websocket"])
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""Runs the real app against a fleet of simulated projectors.
+
+Starts simulators/pjlink_fleet.py in a subprocess, serves backend/main.py with
+uvicorn in this process and measures startup, poll-cycle time, scene latency
+over the REST API, WebSocket fan-out latency to many clients and resident
+memory per device:
+
+    python3 benchmarks/fleet.py --devices 2000 --ws-clients 300
+    python3 benchmarks/fleet.py --devices 2000 --compare benchmarks/results/old.json
+
+Results are written as JSON (see --output) so runs can be compared between releases.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+import httpx
+import uvicorn
+import websockets
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+sys.path.insert(0, str(ROOT / "simulators"))
+
+from pjlink_fleet import raise_fd_limit
+
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+
+def _summary(samples: list[float]) -> dict:
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+
+    def pct(q: float) -> float:  # nearest-rank percentile
+        return round(ordered[min(len(ordered) - 1, math.ceil(len(ordered) * q) - 1)] * 1000, 3)
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _rss_bytes() -> int | None:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, timeout=5, check=False,
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _start_fleet(args, rooms_dir: Path) -> tuple[subprocess.Popen, dict]:
+    proc = subprocess.Popen(
+        [
+            sys.executable, str(ROOT / "simulators" / "pjlink_fleet.py"),
+            "--count", str(args.devices),
+            "--base-port", str(args.base_port),
+            "--rooms-dir", str(rooms_dir),
+            "--devices-per-room", str(args.devices_per_room),
+            *(["--session"] if args.session else []),
+            *(["--profile", args.profile, "--faulty-ratio", str(args.faulty_ratio)]
+              if args.profile else []),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    line = proc.stdout.readline()
+    info = json.loads(line) if line else {}
+    if not info.get("ready"):
+        proc.kill()
+        raise RuntimeError("Simulator fleet failed to start")
+    return proc, info
+
+
+async def _wait_connected(room_manager, start: float) -> float:
+    """Seconds from ``start`` until no device reports ``connecting`` any more."""
+    while room_manager.startup_stats()["connecting"]:
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start
+
+
+async def _bench_poll_cycles(room_manager, cycles: int) -> dict:
+    poller = room_manager.poller
+    # Only time cycles that ran after startup settled; the deque may already be full
+    poller.cycles.clear()
+    while len(poller.cycles) < min(cycles, poller.cycles.maxlen):
+        await asyncio.sleep(0.1)
+    recent = list(poller.cycles)
+    return {
+        "interval": poller.interval,
+        "duration": _summary([c.duration for c in recent]),
+        "devices_per_cycle": round(statistics.fmean(c.devices for c in recent), 1),
+        "errors": sum(c.errors for c in recent),
+        "missed": sum(c.missed for c in recent),
+        "overruns": sum(1 for c in recent if not c.on_time),
+    }
+
+
+async def _bench_scenes(base_url: str, room_ids: list[str], count: int) -> dict:
+    samples, failures = [], 0
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        for i in range(count):
+            room_id = room_ids[i % len(room_ids)]
+            scene = "All On" if (i // len(room_ids)) % 2 == 0 else "All Off"
+            start = time.perf_counter()
+            resp = await client.post(f"/api/v1/rooms/{room_id}/scene/{scene}")
+            samples.append(time.perf_counter() - start)
+            if resp.status_code != 200 or not all(r["ok"] for r in resp.json()["results"]):
+                failures += 1
+    return {"latency": _summary(samples), "failures": failures}
+
+
+async def _bench_fanout(
+    base_url: str, room_manager, room_id: str, clients: int, events: int
+) -> dict:
+    """Publish marked state updates and time their arrival at every client."""
+    ws_url = base_url.replace("http://", "ws://") + f"/ws/rooms/{room_id}"
+    device_id = room_manager.get_room(room_id).device_ids[0]
+    sent: dict[int, float] = {}
+    received: dict[int, list[float]] = {}
+    ready = asyncio.Event()
+    connected = 0
+
+    async def client() -> None:
+        nonlocal connected
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            await ws.recv()  # snapshot
+            connected += 1
+            if connected == clients:
+                ready.set()
+            async for frame in ws:
+                message = json.loads(frame)
+                if message.get("type") != "device_state_update":
+                    continue
+                seq = message["state"].get("extra", {}).get("bench_seq")
+                if seq is not None:
+                    received.setdefault(seq, []).append(time.perf_counter() - sent[seq])
+
+    tasks = [asyncio.create_task(client()) for _ in range(clients)]
+    await asyncio.wait_for(ready.wait(), timeout=60)
+
+    state = dict(room_manager.get_device(device_id).state.to_dict())
+    for seq in range(events):
+        sent[seq] = time.perf_counter()
+        await room_manager.event_bus.publish("device_state_update", {
+            "device_id": device_id,
+            "state": {**state, "extra": {**state.get("extra", {}), "bench_seq": seq}},
+            "version": -1,
+            "changed": ["extra"],
+        })
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(1.0)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    deliveries = [d for seq in received.values() for d in seq]
+    complete = [max(seq) for seq in received.values() if len(seq) == clients]
+    return {
+        "clients": clients,
+        "events": events,
+        "delivery": _summary(deliveries),
+        "all_clients": _summary(complete),
+        "lost": events * clients - len(deliveries),
+    }
+
+
+async def run(args) -> dict:
+    tmp = Path(tempfile.mkdtemp(prefix="nomy-fleet-"))
+    rooms_dir = tmp / "rooms"
+    config_path = tmp / "nomy.yaml"
+    config_path.write_text(yaml.safe_dump({
+        "poll_interval": args.poll_interval,
+        "poll_concurrency": args.poll_concurrency,
+        "connect_concurrency": args.connect_concurrency,
+        "log_level": "WARNING",
+        "history": {"enabled": False},
+    }))
+    os.environ["NOMY_CONFIG"] = str(config_path)
+    os.environ["NOMY_ROOMS_DIR"] = str(rooms_dir)
+
+    fleet, fleet_info = _start_fleet(args, rooms_dir)
+    try:
+        import main  # reads NOMY_* at import
+
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        server = uvicorn.Server(uvicorn.Config(
+            main.app, host="127.0.0.1", port=args.port, log_level="warning", ws="websockets"
+        ))
+        serve = asyncio.create_task(server.serve())
+        while not server.started:
+            if serve.done():
+                serve.result()
+            await asyncio.sleep(0.01)
+        base_url = f"http://127.0.0.1:{args.port}"
+        room_manager = main.app.state.room_manager
+
+        results: dict = {"startup_seconds": round(await _wait_connected(room_manager, start), 3)}
+        results["faulty_devices"] = fleet_info["faulty"]
+        online = sum(1 for d in room_manager.devices.values() if d.state.status.value == "online")
+        results["devices_online"] = online
+        results["poll_cycles"] = await _bench_poll_cycles(room_manager, args.cycles)
+
+        rss_after = _rss_bytes()
+        if rss_before and rss_after:
+            results["memory"] = {
+                "rss_mb": round(rss_after / 2**20, 1),
+                "per_device_kb": round((rss_after - rss_before) / args.devices / 1024, 2),
+            }
+
+        room_ids = sorted(room_manager.rooms)
+        results["scenes"] = await _bench_scenes(base_url, room_ids, args.scenes)
+        results["ws_fanout"] = await _bench_fanout(
+            base_url, room_manager, room_ids[0], args.ws_clients, args.fanout_events
+        )
+
+        server.should_exit = True
+        await serve
+        return {
+            "benchmark": "fleet",
+            "version": main.app.version,
+            "commit": _git_commit(),
+            "timestamp": datetime.now(UTC).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {
+                k: v for k, v in vars(args).items() if k not in ("output", "compare", "port")
+            },
+            "results": results,
+        }
+    finally:
+        fleet.terminate()
+        fleet.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _flatten(data: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict) -> list[str]:
+    old, new = _flatten(baseline["results"]), _flatten(current["results"])
+    lines = [f"{'metric':<40} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for name in sorted(old.keys() & new.keys()):
+        change = f"{(new[name] - old[name]) / old[name] * 100:+.1f}%" if old[name] else ""
+        lines.append(f"{name:<40} {old[name]:>12} {new[name]:>12} {change:>8}")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Nomy fleet benchmark")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--devices-per-room", type=int, default=10)
+    parser.add_argument("--base-port", type=int, default=20000)
+    parser.add_argument("--session", action="store_true", help="use PJLink session mode")
+    parser.add_argument("--profile", help="simulator fault profile YAML (simulators/profiles/)")
+    parser.add_argument("--faulty-ratio", type=float, default=1.0,
+                        help="fraction of simulators that get the fault profile")
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+    parser.add_argument("--poll-concurrency", type=int, default=64)
+    parser.add_argument("--connect-concurrency", type=int, default=32)
+    parser.add_argument("--cycles", type=int, default=3, help="poll cycles to measure")
+    parser.add_argument("--scenes", type=int, default=20, help="scene activations to time")
+    parser.add_argument("--ws-clients", type=int, default=200)
+    parser.add_argument("--fanout-events", type=int, default=50)
+    parser.add_argument("--port", type=int, default=18000, help="port for the app under test")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/...)")
+    parser.add_argument("--compare", help="baseline results file to diff against")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    raise_fd_limit()
+    result = asyncio.run(run(args))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"fleet-{result['version']}-{result['commit'] or 'local'}-{args.devices}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2) + "\n")
+    print(json.dumps(result["results"], indent=2))
+    print(f"Results written to {output}")
+    if args.compare:
+        print("\n".join(compare(json.loads(Path(args.compare).read_text()), result)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Per-poll latency of PJLinkDriver with and without session mode.
+
+Runs an in-process simulator from simulators/pjlink_sim.py and polls it with
+one driver per mode:
+
+    python3 benchmarks/pjlink_session.py --polls 500 --password secret
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+sys.path.insert(0, str(ROOT / "simulators"))
+
+from devices.display.pjlink import PJLinkDriver
+from pjlink_sim import POWER_ON, PJLinkSimulator
+
+
+def _summary(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "polls": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+async def _bench(port: int, password: str, session: bool, polls: int) -> dict:
+    driver = PJLinkDriver("bench", {
+        "host": "127.0.0.1", "port": port, "password": password, "session": session,
+    })
+    await driver.get_state()  # warm up
+    samples = []
+    for _ in range(polls):
+        start = time.perf_counter()
+        state = await driver.get_state()
+        samples.append(time.perf_counter() - start)
+        if state.status.value != "online":
+            raise RuntimeError(f"Poll failed in session={session} mode")
+    await driver.disconnect()
+    return _summary(samples)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="PJLink session-mode benchmark")
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--power", choices=["on", "off"], default="on")
+    args = parser.parse_args()
+
+    logging.getLogger("pjlink_sim").setLevel(logging.WARNING)
+    sim = PJLinkSimulator(name="Bench Projector", password=args.password)
+    if args.power == "on":
+        sim.power = POWER_ON
+    server = await asyncio.start_server(sim.handle_client, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    async with server:
+        results = {
+            "per_command": await _bench(port, args.password, False, args.polls),
+            "session": await _bench(port, args.password, True, args.polls),
+        }
+    results["speedup"] = round(
+        results["per_command"]["mean_ms"] / results["session"]["mean_ms"], 2
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -11,11 +11,13 @@ const statusColors: Record<string, string> = {
   offline: "bg-red-500",
   error: "bg-amber-500",
   unknown: "bg-gray-500",
+  connecting: "bg-blue-500 animate-pulse",
 };
 
 export function DeviceCard({ device, onCommand }: Props) {
   const status = device.state?.status ?? "unknown";
   const isPowered = device.state?.power === true;
+  const unreachable = device.state?.breaker !== undefined && device.state.breaker !== "closed";
 
   return (
     <div className="bg-gray-800 rounded-xl p-4 flex flex-col gap-3 border border-gray-700">
@@ -24,12 +26,17 @@ export function DeviceCard({ device, onCommand }: Props) {
           <div className="text-white font-medium">{device.name}</div>
           <div className="text-gray-400 text-xs capitalize">{device.type} • {device.driver}</div>
         </div>
-        <span className={`w2.5 h-2.5 rounded-full ${statusColors[status]}`} title={status} />
+        <span
+          className={`w2.5 h-2.5 rounded-full ${statusColors[status]}`}
+          title={unreachable ? `${status} (unreachable, retrying)` : status}
+        />
       </div>
 
       <button
         onClick={() => onCommand(device.id, isPowered ? "power_off" : "power_on")}
-        disabled={status === "offline" || status === "unknown"}
+        disabled={
+          status === "offline" || status === "unknown" || status === "connecting" || unreachable
+        }
         className={`flex items-center justify-center gap-2 py-3 rounded-lg font-medium transition-colors
           ${isPowered
             ? "bg-green-600 hover:bg-green-700 text-white"
@@ -34,6 +34,12 @@ export function RoomView({ roomId }: Props) {
       setDeviceStates(msg.states);
     } else if (msg.type === "device_state_update") {
       setDeviceStates((prev) => ({ ...prev, [msg.device_id]: msg.state }));
+    } else if (msg.type === "device_state_batch") {
+      setDeviceStates((prev) => {
+        const next = { ...prev };
+        for (const u of msg.updates) next[u.device_id] = u.state;
+        return next;
+      });
     } else if (msg.type === "error") {
       toast.error(msg.message);
     } else if (msg.type === "scene_result") {
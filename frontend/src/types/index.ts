@@ -1,9 +1,12 @@
-export type DeviceStatus = "online" | "offline" | "error" | "unknown";
+export type DeviceStatus = "online" | "offline" | "error" | "unknown" | "connecting";
+
+export type BreakerState = "closed" | "open" | "half_open";
 
 export interface DeviceState {
   status: DeviceStatus;
   power: boolean | null;
   extra: Record<string, unknown>;
+  breaker?: BreakerState;
 }
 
 export interface Device {
@@ -20,11 +23,57 @@ export interface Room {
   description: string;
   devices: Device[];
   scenes: string[];
+  version: number;
+}
+
+export interface DeviceStateUpdate {
+  type: "device_state_update";
+  device_id: string;
+  state: DeviceState;
+  version: number;
+  changed: string[];
+  timestamp: string;
 }
 
 export type WsMessage =
-  | { type: "snapshot"; states: Record<string, DeviceState> }
-  | { type: "device_state_update"; device_id: string; state: DeviceState; timestamp: string }
+  | { type: "snapshot"; states: Record<string, DeviceState>; max_rate: number | null }
+  | DeviceStateUpdate
+  | { type: "device_state_batch"; updates: DeviceStateUpdate[] }
   | { type: "command_result"; device_id: string; result: string }
-  | { type: "scene_result"; scene: string; results: Array<{ device: string; ok: boolean; error?: string }> }
+  | { type: "command_superseded"; device_id: string; message: string }
+  | {
+      type: "scene_result";
+      scene: string;
+      duration_ms: number;
+      results: Array<{
+        device: string;
+        command: string;
+        ok: boolean;
+        error?: string;
+        stage: number;
+        started_ms: number;
+        duration_ms: number;
+      }>;
+    }
+  | {
+      type: "bulk_command_result";
+      request_id: string | null;
+      index: number;
+      device_id: string;
+      command: string;
+      ok: boolean;
+      status: number;
+      result?: string | null;
+      error?: string;
+      duration_ms: number;
+      finished_ms: number;
+    }
+  | {
+      type: "bulk_command_done";
+      request_id: string | null;
+      total: number;
+      ok: number;
+      failed: number;
+      duration_ms: number;
+    }
   | { type: "error"; message: string };
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Thousands of simulated PJLink projectors in one event loop.
+
+Each projector is a PJLinkSimulator listening on its own port, starting at
+--base-port. With --rooms-dir, matching room YAMLs are written so Nomy can be
+pointed straight at the fleet:
+
+    python3 simulators/pjlink_fleet.py --count 2000 --rooms-dir /tmp/fleet-rooms
+    NOMY_ROOMS_DIR=/tmp/fleet-rooms uvicorn main:app   # from backend/
+
+Prints one JSON line ({"ready": ...}) to stdout once every port is listening.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import resource
+import sys
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from pjlink_sim import POWER_OFF, POWER_ON, FaultProfile, PJLinkSimulator
+
+logger = logging.getLogger("pjlink_fleet")
+
+
+def raise_fd_limit() -> int:
+    """Lift the soft open-file limit to the hard limit; a fleet needs a socket per port."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        target = hard if hard != resource.RLIM_INFINITY else max(soft, 1 << 16)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+class Fleet:
+    """A set of PJLinkSimulators served from one process."""
+
+    def __init__(
+        self,
+        count: int,
+        base_port: int = 20000,
+        host: str = "127.0.0.1",
+        password: str = "",
+        power_on_ratio: float = 0.5,
+        seed: int = 0,
+        profile: dict | None = None,
+        faulty_ratio: float = 1.0,
+        notify: tuple[str, int] | None = None,
+    ):
+        self.count = count
+        self.base_port = base_port
+        self.host = host
+        self.password = password
+        self.notify = notify
+        rng = random.Random(seed)
+        self.simulators = []
+        self.faulty: list[int] = []
+        for i in range(count):
+            fault = None
+            if profile and rng.random() < faulty_ratio:
+                fault = FaultProfile.from_dict(profile, seed=seed + i)
+                self.faulty.append(i)
+            sim = PJLinkSimulator(
+                name=f"Fleet Projector {i}", password=password, profile=fault, notify=notify
+            )
+            sim.power = POWER_ON if rng.random() < power_on_ratio else POWER_OFF
+            sim.lamp_hours = rng.randint(0, 20000)
+            self.simulators.append(sim)
+        self._servers: list[asyncio.Server] = []
+
+    def port(self, index: int) -> int:
+        return self.base_port + index
+
+    async def start(self) -> None:
+        for i, sim in enumerate(self.simulators):
+            server = await asyncio.start_server(
+                sim.handle_client, self.host, self.port(i), reuse_address=True
+            )
+            self._servers.append(server)
+            await sim.start_notifications((self.host, self.port(i)))
+
+    async def stop(self) -> None:
+        for sim in self.simulators:
+            sim.stop_notifications()
+        for server in self._servers:
+            server.close()
+        await asyncio.gather(*(s.wait_closed() for s in self._servers), return_exceptions=True)
+        self._servers.clear()
+
+    def write_rooms(
+        self,
+        rooms_dir: str | Path,
+        devices_per_room: int = 10,
+        session: bool = False,
+    ) -> list[str]:
+        """Write one room YAML per ``devices_per_room`` projectors and return the room ids."""
+        rooms_dir = Path(rooms_dir)
+        rooms_dir.mkdir(parents=True, exist_ok=True)
+        for stale in rooms_dir.glob("fleet-*.yaml"):
+            stale.unlink()
+        room_ids = []
+        for start in range(0, self.count, devices_per_room):
+            room_id = f"fleet-{start // devices_per_room:04d}"
+            devices = []
+            for i in range(start, min(start + devices_per_room, self.count)):
+                devices.append({
+                    "id": f"proj-{i:05d}",
+                    "name": f"Projector {i}",
+                    "type": "display",
+                    "driver": "pjlink",
+                    "config": {
+                        "host": self.host,
+                        "port": self.port(i),
+                        "password": self.password,
+                        "session": session,
+                        "notify": self.notify is not None,
+                    },
+                })
+            scenes = [
+                {
+                    "name": name,
+                    "actions": [{"device": d["id"], "command": command} for d in devices],
+                }
+                for name, command in (("All On", "power_on"), ("All Off", "power_off"))
+            ]
+            room = {
+                "room": {"id": room_id, "name": f"Fleet Room {start // devices_per_room}"},
+                "devices": devices,
+                "scenes": scenes,
+            }
+            (rooms_dir / f"{room_id}.yaml").write_text(yaml.safe_dump(room, sort_keys=False))
+            room_ids.append(room_id)
+        return room_ids
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="PJLink simulator fleet")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--base-port", type=int, default=20000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--power-on-ratio", type=float, default=0.5)
+    parser.add_argument("--rooms-dir", help="write matching room YAMLs here")
+    parser.add_argument("--devices-per-room", type=int, default=10)
+    parser.add_argument("--session", action="store_true", help="enable session mode in the YAMLs")
+    parser.add_argument("--profile", help="YAML fault profile (see pjlink_sim.FaultProfile)")
+    parser.add_argument("--faulty-ratio", type=float, default=1.0,
+                        help="fraction of simulators that get the fault profile")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--notify", metavar="HOST:PORT",
+                        help="send Class 2 status notifications (UDP) to Nomy at this address")
+    parser.add_argument("--verbose", action="store_true", help="log every simulated command")
+    args = parser.parse_args()
+
+    logging.getLogger("pjlink_sim").setLevel(logging.INFO if args.verbose else logging.WARNING)
+    fd_limit = raise_fd_limit()
+    if args.count * (2 if args.notify else 1) + 64 > fd_limit:
+        logger.warning(f"Open-file limit {fd_limit} is too low for {args.count} simulators")
+
+    notify = None
+    if args.notify:
+        notify_host, notify_port = args.notify.rsplit(":", 1)
+        notify = (notify_host, int(notify_port))
+    profile = None
+    if args.profile:
+        profile = yaml.safe_load(Path(args.profile).read_text()) or {}
+    fleet = Fleet(
+        args.count, args.base_port, args.host, args.password, args.power_on_ratio,
+        seed=args.seed, profile=profile, faulty_ratio=args.faulty_ratio, notify=notify,
+    )
+    rooms = []
+    if args.rooms_dir:
+        rooms = fleet.write_rooms(args.rooms_dir, args.devices_per_room, args.session)
+    await fleet.start()
+    print(json.dumps({
+        "ready": True,
+        "count": args.count,
+        "ports": [fleet.port(0), fleet.port(args.count - 1)],
+        "rooms": len(rooms),
+        "faulty": len(fleet.faulty),
+    }), flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fleet.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
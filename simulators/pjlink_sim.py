@@ -1,37 +1,141 @@
 #!/usr/bin/env python3
-import argparse, asyncio, hashlib, logging, random, string
+import argparse
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import string
+import time
+
+import yaml
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [pjlink-sim] %(message)s")
 logger = logging.getLogger(__name__)
 POWER_OFF, POWER_ON, POWER_WARMING, POWER_COOLING = "0", "1", "2", "3"
+SESSION_IDLE_TIMEOUT = 30.0
+CRLF = chr(13) + chr(10)
+
+class Delay:
+    """A delay distribution: "0.2", "fixed:0.2", "uniform:0.01:0.5", "normal:0.1:0.03",
+    "lognormal:<median>:<sigma>" or "exp:<mean>" (seconds)."""
+    def __init__(self, spec="0"):
+        self.spec = str(spec); kind, *args = self.spec.split(":") if ":" in self.spec else ("fixed", self.spec)
+        self.kind = kind; self.args = [float(a) for a in args]
+        if kind not in ("fixed", "uniform", "normal", "lognormal", "exp"): raise ValueError(f"Unknown delay {spec!r}")
+    def sample(self, rng):
+        a = self.args
+        if self.kind == "fixed": return a[0]
+        if self.kind == "uniform": return rng.uniform(a[0], a[1])
+        if self.kind == "normal": return max(0.0, rng.gauss(a[0], a[1]))
+        if self.kind == "lognormal": return rng.lognormvariate(math.log(a[0]), a[1])
+        return rng.expovariate(1.0 / a[0])
+
+class FaultProfile:
+    """How a simulated projector misbehaves. Rates are per connection (refuse) or per command.
+
+    outages: [{at, duration, mode}] in seconds since the simulator started, repeating every
+    `repeat` seconds if set; mode "refuse" resets connections, "silent" accepts and never greets.
+    """
+    RATES = ("refuse_rate", "drop_rate", "hang_rate", "busy_rate", "auth_error_rate")
+    def __init__(self, greeting_delay="0", response_delay="0", refuse_rate=0.0, drop_rate=0.0,
+                 hang_rate=0.0, busy_rate=0.0, auth_error_rate=0.0, outages=(), repeat=None, seed=None):
+        self.greeting_delay = Delay(greeting_delay); self.response_delay = Delay(response_delay)
+        self.refuse_rate = float(refuse_rate); self.drop_rate = float(drop_rate); self.hang_rate = float(hang_rate)
+        self.busy_rate = float(busy_rate); self.auth_error_rate = float(auth_error_rate)
+        self.outages = [(float(o["at"]), float(o["duration"]), o.get("mode", "refuse")) for o in outages]
+        self.repeat = float(repeat) if repeat else None; self.rng = random.Random(seed)
+        for _, _, mode in self.outages:
+            if mode not in ("refuse", "silent"): raise ValueError(f"Unknown outage mode {mode!r}")
+    @classmethod
+    def from_dict(cls, data, seed=None):
+        return cls(**{"seed": seed, **(data or {})})
+    @classmethod
+    def load(cls, path, seed=None):
+        with open(path) as f: return cls.from_dict(yaml.safe_load(f), seed)
+    def roll(self, rate): return rate > 0 and self.rng.random() < rate
+    async def delay(self, dist):
+        seconds = dist.sample(self.rng)
+        if seconds > 0: await asyncio.sleep(seconds)
+    def outage(self, elapsed):
+        """The outage mode in effect `elapsed` seconds after start, or None."""
+        if self.repeat: elapsed %= self.repeat
+        for at, duration, mode in self.outages:
+            if at <= elapsed < at + duration: return mode
+        return None
 
 class PJLinkSimulator:
-    def __init__(self, name="Sim Projector", password=""):
+    def __init__(self, name="Sim Projector", password="", profile=None, notify=None):
         self.name = name; self.password = password; self.manufacturer = "Nomy"
         self.model = "VirtualDisplay"; self.power = POWER_OFF; self.input = "31"
         self.avmt = "30"; self.lamp_hours = 1250
+        self.profile = profile or FaultProfile(); self.started = time.monotonic()
+        self.notify = notify; self._notify_transport = None  # (host, port) for Class 2 notifications
+        self.mac = "".join(random.choices("0123456789abcdef", k=12))
+    async def start_notifications(self, local_addr):
+        """Push Class 2 status notifications to self.notify, sent from local_addr (the TCP host/port,
+        so a controller can tell simulators sharing one IP apart), starting with LKUP."""
+        if not self.notify: return
+        self._notify_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            asyncio.DatagramProtocol, local_addr=local_addr)
+        self._send_notification("LKUP", self.mac)
+    def stop_notifications(self):
+        if self._notify_transport: self._notify_transport.close(); self._notify_transport = None
+    def _send_notification(self, cmd, value):
+        if self._notify_transport is None: return
+        logger.info(f"  NOTIFY: %2{cmd}={value}")
+        self._notify_transport.sendto(f"%2{cmd}={value}\r".encode("ascii"), self.notify)
+    def _outage(self): return self.profile.outage(time.monotonic() - self.started)
+    async def _linger(self, reader):
+        """Hold the socket open without answering until the client gives up."""
+        try: await asyncio.wait_for(reader.read(), timeout=SESSION_IDLE_TIMEOUT)
+        except (TimeoutError, ConnectionError): pass
     def _random_token(self, length=8):
         return "".join(random.choices(string.hexdigits[:16], k=length))
     async def handle_client(self, reader, writer):
         addr = writer.get_extra_info("peername")
         logger.info(f"Connection from {addr}")
+        p = self.profile
         try:
+            outage = self._outage()
+            if outage == "refuse" or p.roll(p.refuse_rate):
+                logger.info("  fault: refusing connection"); writer.transport.abort(); return
+            if outage == "silent":
+                await self._linger(reader); return
             if self.password:
                 token = self._random_token(); greeting = f"PJLINK 1 {token}\r\n"
             else:
                 token = ""; greeting = "PJLINK 0\r\n"
+            await p.delay(p.greeting_delay)
             writer.write(greeting.encode("ascii")); await writer.drain()
-            raw = await asyncio.wait_for(reader.readline(), timeout=10.0)
-            line = raw.decode("ascii", errors="ignore").strip()
-            if not line: return
-            if self.password and token:
-                exp = hashlib.md5((token + self.password).encode()).hexdigest()
-                if len(line) >= 32:
-                    if line[:32] != exp:
-                        writer.write(("PJLINK ERRA" + chr(13) + chr(10)).encode("ascii")); await writer.drain(); return
-                    line = line[32:]
-            response = self._process_command(line)
-            logger.info(f"  CMD: {line!r}  ->  {response!r}")
-            writer.write((response + chr(13) + chr(10)).encode("ascii")); await writer.drain()
+            authed = not (self.password and token); first = True
+            while True:  # real projectors keep the session open until ~30 s idle
+                raw = await asyncio.wait_for(reader.readline(), timeout=SESSION_IDLE_TIMEOUT)
+                line = raw.decode("ascii", errors="ignore").strip()
+                if not line: return
+                if self._outage() == "refuse":
+                    logger.info("  fault: outage, resetting session"); writer.transport.abort(); return
+                if first and p.roll(p.auth_error_rate):
+                    logger.info("  fault: ERRA"); writer.write(("PJLINK ERRA" + CRLF).encode("ascii")); await writer.drain(); return
+                first = False
+                if not authed:  # only the first command carries the digest
+                    exp = hashlib.md5((token + self.password).encode()).hexdigest()
+                    if len(line) < 32 or line[:32] != exp:
+                        writer.write(("PJLINK ERRA" + CRLF).encode("ascii")); await writer.drain(); return
+                    line = line[32:]; authed = True
+                await p.delay(p.response_delay)
+                if p.roll(p.drop_rate):
+                    logger.info(f"  fault: dropped response to {line!r}"); continue
+                if p.roll(p.busy_rate):
+                    response = line[:6].upper() + "=ERR3" if len(line) >= 6 else "%1ERR3"
+                else:
+                    response = self._process_command(line)
+                if p.roll(p.hang_rate):  # half a response, then a half-open socket
+                    logger.info(f"  fault: hanging mid-response to {line!r}")
+                    writer.write(response[:len(response) // 2].encode("ascii")); await writer.drain()
+                    await self._linger(reader); return
+                logger.info(f"  CMD: {line!r}  ->  {response!r}")
+                writer.write((response + CRLF).encode("ascii")); await writer.drain()
         except asyncio.TimeoutError: pass
         except Exception as e: logger.error(f"Handler error: {e}")
         finally:
@@ -63,30 +167,51 @@ class PJLinkSimulator:
     def _cmd_input(self, param):
         if param == "?": return f"%1INPT={self.input}"
         elif self.power != POWER_ON: return "%1INPT=ERR3"
-        else: self.input = param; return "%1INPT=OK"
+        else:
+            changed = param != self.input; self.input = param
+            if changed: self._send_notification("INPT", param)
+            return "%1INPT=OK"
     def _cmd_avmt(self, param):
         if param == "?": return f"%1AVMT={self.avmt}"
         elif param in ("10", "11", "20", "21", "30", "31"): self.avmt = param; return "%1AVMT=OK"
         return "%1AVMT=ERR2"
     async def _power_on_sequence(self):
         logger.info("Power: warming up (3s)..."); await asyncio.sleep(3)
-        self.power = POWER_ON; logger.info("Power: ON")
+        self.power = POWER_ON; logger.info("Power: ON"); self._send_notification("POWR", POWER_ON)
     async def _power_off_sequence(self):
         logger.info("Power: cooling down (5s)..."); await asyncio.sleep(5)
-        self.power = POWER_OFF; logger.info("Power: OFF")
+        self.power = POWER_OFF; logger.info("Power: OFF"); self._send_notification("POWR", POWER_OFF)
 
-async def main():
+async def serve(sim, host, port):
+    server = await asyncio.start_server(sim.handle_client, host, port)
+    await sim.start_notifications((host, port))
+    logger.info(f"PJLink simulator listening on {host}:{port} (name={sim.name!r})")
+    async with server:
+        await server.serve_forever()
+
+def main():
     parser = argparse.ArgumentParser(description="PJLink Display Simulator")
     parser.add_argument("--port", type=int, default=4352)
     parser.add_argument("--host", default="0.0.0.0")
     parser.add_argument("--name", default="Sim Projector")
     parser.add_argument("--password", default="")
+    parser.add_argument("--profile", help="YAML fault profile (delays, fault rates, outages)")
+    parser.add_argument("--fault", action="append", default=[], metavar="KEY=VALUE",
+                        help="fault profile setting, e.g. response_delay=lognormal:0.05:0.8 or busy_rate=0.1")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--notify", metavar="HOST:PORT",
+                        help="send PJLink Class 2 status notifications (UDP) to this controller")
     args = parser.parse_args()
-    sim = PJLinkSimulator(name=args.name, password=args.password)
-    server = await asyncio.start_server(sim.handle_client, args.host, args.port)
-    logger.info(f"PJLink simulator listening on {args.host}:{args.port} (name={args.name!r})")
-    async with server:
-        await server.serve_forever()
+    data = {}
+    if args.profile:
+        with open(args.profile) as f: data = yaml.safe_load(f) or {}
+    data.update(kv.split("=", 1) for kv in args.fault)
+    notify = None
+    if args.notify:
+        host, port = args.notify.rsplit(":", 1); notify = (host, int(port))
+    sim = PJLinkSimulator(name=args.name, password=args.password,
+                          profile=FaultProfile.from_dict(data, args.seed), notify=notify)
+    asyncio.run(serve(sim, args.host, args.port))
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -0,0 +1,64 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "backend"))
+
+from core.event_bus import EventBus
+from devices.base import DeviceDriver, DeviceState, DeviceStatus
+
+
+class FakeDriver(DeviceDriver):
+    """In-memory driver: records commands and reports whatever ``power`` is set to."""
+
+    COMMANDS = frozenset({"power_on", "power_off"})
+
+    def __init__(self, device_id: str, config: dict):
+        super().__init__(device_id, config)
+        self.power = False
+        self.commands: list[str] = []
+        self.fail_with: Exception | None = None
+
+    async def connect(self) -> bool:
+        return True
+
+    async def disconnect(self) -> None:
+        pass
+
+    async def get_state(self) -> DeviceState:
+        self._state.update(status=DeviceStatus.ONLINE, power=self.power)
+        return self._state
+
+    async def send_command(self, command: str, **kwargs):
+        if command.lower() not in self.COMMANDS:
+            raise ValueError(f"Unknown command: {command!r}")
+        if self.fail_with is not None:
+            raise self.fail_with
+        self.commands.append(command)
+        self.power = command.lower() == "power_on"
+        return "OK"
+
+
+class FakeLoader:
+    def load_driver(self, device_id: str, device_config: dict) -> DeviceDriver:
+        return FakeDriver(device_id, dict(device_config.get("config", {})))
+
+
+def room_config(rooms: dict[str, list[str]], **settings) -> dict:
+    """A loaded-config dict with one fake device per id, e.g. {"r1": ["d1", "d2"]}."""
+    return {
+        **settings,
+        "rooms": {
+            room_id: {
+                "room": {"id": room_id, "name": room_id},
+                "devices": [{"id": did, "driver": "fake", "type": "display"} for did in ids],
+            }
+            for room_id, ids in rooms.items()
+        },
+    }
+
+
+@pytest.fixture
+def event_bus() -> EventBus:
+    return EventBus()
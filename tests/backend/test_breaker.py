@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from api.routes.devices import CommandRequest, send_command
+from conftest import FakeDriver
+from devices.base import DeviceStatus
+from devices.breaker import CircuitBreaker, DeviceUnavailable
+from fastapi import HTTPException
+
+
+def test_breaker_opens_after_threshold_and_closes_on_success():
+    changes = []
+    breaker = CircuitBreaker(threshold=2, probe_interval=5, on_change=changes.append)
+    breaker.record_failure("reset")
+    assert breaker.state == "closed"
+    breaker.record_failure("reset")
+    assert breaker.state == "open"
+    assert breaker.trips == 1
+    assert 0 < breaker.retry_after() <= 5
+
+    breaker.start_probe()
+    assert breaker.state == "half_open"
+    breaker.record_failure("still down")  # a failed probe reopens at once
+    assert breaker.state == "open"
+    assert breaker.trips == 1
+
+    breaker.start_probe()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    # Probing flips open/half_open without reporting it
+    assert changes == ["open", "closed"]
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(threshold=2)
+    breaker.record_failure("reset")
+    breaker.record_success()
+    breaker.record_failure("reset")
+    assert breaker.state == "closed"
+
+
+async def test_open_breaker_fails_fast_and_probe_recovers():
+    drv = FakeDriver("d1", {"breaker_threshold": 2, "breaker_probe_interval": 0.05})
+    drv.fail_with = ConnectionResetError("reset")
+    for _ in range(2):
+        with pytest.raises(ConnectionResetError):
+            await drv.execute("power_on")
+    assert drv.breaker.state == "open"
+    assert drv.state.breaker == "open"
+
+    drv.fail_with = None
+    with pytest.raises(DeviceUnavailable):
+        await drv.execute("power_on")
+    assert drv.commands == []  # never reached the device
+    assert (await drv.poll()).status == DeviceStatus.OFFLINE
+
+    await asyncio.sleep(0.15)  # the background probe polls and finds it answering
+    assert drv.breaker.state == "closed"
+    assert await drv.execute("power_on") == "OK"
+    await drv.close()
+
+
+async def test_unavailable_device_is_503_with_retry_after():
+    drv = FakeDriver("d1", {"breaker_threshold": 1, "breaker_probe_interval": 30})
+    rm = SimpleNamespace(
+        get_device=lambda device_id: drv,
+        send_command=lambda device_id, command, **params: drv.execute(command, **params),
+    )
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(room_manager=rm)))
+    drv.fail_with = OSError("unreachable")
+    with pytest.raises(HTTPException) as exc:
+        await send_command("r1", "d1", CommandRequest(command="power_on"), request)
+    assert exc.value.status_code == 502
+
+    with pytest.raises(HTTPException) as exc:
+        await send_command("r1", "d1", CommandRequest(command="power_on"), request)
+    assert exc.value.status_code == 503
+    assert 1 <= int(exc.value.headers["Retry-After"]) <= 30
+    await drv.close()
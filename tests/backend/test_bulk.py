@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from api.websocket import _handle_client_message
+from conftest import FakeLoader, room_config
+from core.bulk import BulkCommand, BulkDispatcher
+from core.state import RoomStateManager
+
+
+class JsonSocket:
+    def __init__(self, bulk=None):
+        self.sent: list[dict] = []
+        self.app = SimpleNamespace(state=SimpleNamespace(bulk=bulk))
+
+    async def send_json(self, data: dict) -> None:
+        self.sent.append(data)
+
+
+@pytest.fixture
+async def manager(event_bus):
+    rm = RoomStateManager(
+        room_config({"r1": ["d1"], "r2": ["d2"]}, poll_interval=60), FakeLoader(), event_bus
+    )
+    await rm.startup()
+    yield rm
+    await rm.shutdown()
+
+
+async def test_bulk_keeps_per_device_order_and_reports_status(manager):
+    dispatcher = BulkDispatcher(manager)
+    commands = [
+        BulkCommand("d1", "power_on", {}),
+        BulkCommand("d2", "power_on", {}),
+        BulkCommand("d1", "power_off", {}),
+        BulkCommand("d1", "bogus", {}),
+        BulkCommand("nope", "power_on", {}),
+    ]
+    results = {r["index"]: r async for r in dispatcher.run(commands)}
+    assert [results[i]["status"] for i in range(5)] == [200, 200, 200, 400, 404]
+    assert manager.devices["d1"].commands == ["power_on", "power_off"]
+    assert manager.devices["d2"].commands == ["power_on"]
+
+
+async def test_bulk_command_timeout():
+    async def hang(device_id, command, **params):
+        await asyncio.sleep(10)
+
+    rm = SimpleNamespace(get_device=lambda device_id: object(), send_command=hang)
+    dispatcher = BulkDispatcher(rm, command_timeout=0.01)
+    [result] = [r async for r in dispatcher.run([BulkCommand("d1", "power_on", {})])]
+    assert result["status"] == 504
+
+
+@pytest.mark.parametrize("msg", [
+    {"type": "command", "device_id": "d1", "command": "power_on", "params": [1]},
+    {"type": "bulk_command", "commands": [
+        {"device_id": "d1", "command": "power_on", "params": "x"},
+    ]},
+])
+async def test_ws_rejects_params_that_are_not_an_object(manager, msg):
+    ws = JsonSocket(BulkDispatcher(manager))
+    tasks: set[asyncio.Task] = set()
+    await _handle_client_message(msg, "r1", manager, ws, tasks)
+    assert [m["type"] for m in ws.sent] == ["error"]
+    assert not tasks
+    assert manager.devices["d1"].commands == []
+
+
+async def test_ws_bulk_runs_beside_the_receive_loop(manager):
+    release = asyncio.Event()
+
+    class GatedBulk:
+        async def run(self, commands):
+            await release.wait()
+            for index, cmd in enumerate(commands):
+                yield {"index": index, "device_id": cmd.device_id, "ok": True}
+
+    ws = JsonSocket(GatedBulk())
+    tasks: set[asyncio.Task] = set()
+    bulk = {"type": "bulk_command", "request_id": 7, "commands": [
+        {"device_id": "d1", "command": "power_on"},
+    ]}
+    await _handle_client_message(bulk, "r1", manager, ws, tasks)
+    assert len(tasks) == 1  # returned without waiting for the batch
+
+    command = {"type": "command", "device_id": "d2", "command": "power_on"}
+    await _handle_client_message(command, "r2", manager, ws, tasks)
+    assert ws.sent[0]["type"] == "command_result"
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert [m["type"] for m in ws.sent[1:]] == ["bulk_command_result", "bulk_command_done"]
+    assert ws.sent[-1]["request_id"] == 7
+    assert not tasks
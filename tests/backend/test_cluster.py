@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from conftest import FakeLoader, room_config
+from core.cluster import ClusterOwner, FollowerStateManager
+from core.event_bus import EventBus
+from core.state import RoomStateManager
+from devices.base import DeviceStatus
+
+
+async def until(condition, timeout: float = 2.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+async def cluster(tmp_path):
+    config = room_config({"r1": ["d1"]}, poll_fast_interval=0.01)
+    owner_rm = RoomStateManager(config, FakeLoader(), EventBus())
+    owner = ClusterOwner(owner_rm, tmp_path, sync_interval=0.01)
+    await owner.start()
+    await owner_rm.startup()
+    follower = FollowerStateManager(config, FakeLoader(), EventBus(), tmp_path, 0.01)
+    await follower.startup()
+    yield owner_rm, follower, owner
+    await follower.shutdown()
+    await owner.stop()
+    await owner_rm.shutdown()
+
+
+async def test_follower_mirrors_owner(cluster):
+    owner, follower, _ = cluster
+    assert await follower.send_command("d1", "power_on") == "OK"
+    assert owner.devices["d1"].commands == ["power_on"]
+
+    await until(lambda: follower.devices["d1"].state.power is True)
+    await until(lambda: follower.snapshots.etag("r1") == owner.snapshots.etag("r1"))
+    assert follower.snapshots.room_body("r1") == owner.snapshots.room_body("r1")
+
+
+async def test_config_reload_keeps_versions_in_step(cluster):
+    owner, follower, _ = cluster
+    await until(lambda: follower.snapshots.etag("r1") == owner.snapshots.etag("r1"))
+    reloaded = room_config({"r1": ["d1", "d2"], "r2": ["d3"]})
+
+    # The follower reloads first: it must not number the change itself
+    before = follower.snapshots.version
+    await follower.apply_config(reloaded)
+    assert follower.snapshots.version == before
+    await owner.apply_config(reloaded)
+
+    await until(lambda: follower.snapshots.room_configs == owner.snapshots.room_configs)
+    await until(lambda: all(
+        follower.snapshots.etag(room) == owner.snapshots.etag(room) for room in ("r1", "r2")
+    ))
+    assert follower.snapshots.room_configs["r1"] > follower.snapshots.base
+
+
+async def test_follower_reports_unknown_while_the_owner_is_gone(cluster, tmp_path):
+    owner, follower, lease = cluster
+    await until(lambda: follower.devices["d1"].state.status == DeviceStatus.ONLINE)
+    await asyncio.sleep(follower.owner_timeout * 2)  # quiet, but the heartbeat continues
+    assert follower.cluster_stats()["owner_connected"] is True
+    assert follower.lag < follower.owner_timeout
+
+    await lease.stop()
+    await until(lambda: follower.devices["d1"].state.status == DeviceStatus.UNKNOWN)
+    assert follower.cluster_stats()["owner_connected"] is False
+    assert follower.snapshots.statuses["d1"] == "unknown"
+    assert follower.snapshots.etag("r1") != owner.snapshots.etag("r1")
+
+    replacement = ClusterOwner(owner, tmp_path, sync_interval=0.01)
+    await replacement.start()
+    try:
+        await until(lambda: follower.cluster_stats()["owner_connected"])
+        await until(lambda: follower.snapshots.etag("r1") == owner.snapshots.etag("r1"))
+        assert follower.devices["d1"].state.status == DeviceStatus.ONLINE
+        assert follower.snapshots.room_body("r1") == owner.snapshots.room_body("r1")
+    finally:
+        await replacement.stop()
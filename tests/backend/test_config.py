@@ -0,0 +1,38 @@
+import pytest
+from conftest import room_config
+from core.config import compile_config
+
+
+def test_compiled_config_is_detached_from_the_loaded_dict():
+    config = room_config({"r1": ["d1"]})
+    device = config["rooms"]["r1"]["devices"][0]
+    device["config"] = {"host": "10.0.0.1"}
+    index = compile_config(config)
+
+    device["config"]["host"] = "10.0.0.2"
+    config["rooms"]["r1"]["room"]["name"] = "changed"
+    assert index.devices["d1"].raw["config"]["host"] == "10.0.0.1"
+    assert index.rooms["r1"].raw["room"]["name"] == "r1"
+    with pytest.raises(TypeError):
+        index.devices["d1"].raw["driver"] = "other"  # type: ignore[index]
+
+
+def test_lookups():
+    index = compile_config(room_config({"r1": ["d1", "d2"], "r2": ["d3"]}))
+    assert index.rooms["r1"].device_ids == ("d1", "d2")
+    assert index.room_of("d3").id == "r2"
+    assert index.room_of("nope") is None
+
+
+def test_device_in_two_rooms_is_rejected():
+    with pytest.raises(ValueError, match="both 'r1' and 'r2'"):
+        compile_config(room_config({"r1": ["d1"], "r2": ["d1"]}))
+
+
+def test_scene_with_unknown_device_is_rejected():
+    config = room_config({"r1": ["d1"]})
+    config["rooms"]["r1"]["scenes"] = [
+        {"name": "on", "actions": [{"device": "d9", "command": "power_on"}]}
+    ]
+    with pytest.raises(ValueError, match="unknown device 'd9'"):
+        compile_config(config)
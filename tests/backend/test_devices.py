@@ -0,0 +1,171 @@
+import asyncio
+from types import SimpleNamespace
+from typing import ClassVar
+
+import pytest
+from api.routes.devices import CommandRequest, send_command
+from conftest import FakeDriver
+from devices.base import CommandPriority, CommandSuperseded, DeviceState, DeviceStatus
+from fastapi import HTTPException
+
+
+class SlowDriver(FakeDriver):
+    """Commands and polls block until ``release`` is set; records the order they ran in."""
+
+    COMMANDS = frozenset({"power_on", "power_off", "input_a", "input_b"})
+
+    def __init__(self, device_id: str, config: dict):
+        super().__init__(device_id, config)
+        self.release = asyncio.Event()
+        self.ran: list[str] = []
+        self.in_flight = 0
+
+    def command_key(self, command: str, kwargs: dict):
+        return "input" if command.startswith("input_") else None
+
+    async def get_state(self):
+        self.ran.append("poll")
+        self.in_flight += 1
+        try:
+            await self.release.wait()
+            return await super().get_state()
+        finally:
+            self.in_flight -= 1
+
+    async def send_command(self, command: str, **kwargs):
+        self.ran.append(command)
+        await self.release.wait()
+        return await super().send_command(command, **kwargs)
+
+
+async def test_user_commands_run_ahead_of_queued_polls():
+    drv = SlowDriver("d1", {})
+    first = drv.submit_command("power_off")  # occupies the device
+    await asyncio.sleep(0)
+    poll = asyncio.create_task(drv.poll())
+    await asyncio.sleep(0)
+    command = drv.submit_command("power_on")
+    drv.release.set()
+    await asyncio.gather(first, poll, command)
+    assert drv.ran == ["power_off", "power_on", "poll"]
+    assert drv.state.power is True
+
+
+async def test_queued_command_is_superseded_by_a_newer_one():
+    drv = SlowDriver("d1", {})
+    busy = drv.submit_command("power_on")
+    await asyncio.sleep(0)
+    older = drv.submit_command("input_a")
+    other = drv.submit_command("power_off", CommandPriority.USER)
+    newer = drv.submit_command("input_b")
+    drv.release.set()
+
+    with pytest.raises(CommandSuperseded):
+        await older
+    assert await asyncio.gather(busy, other, newer) == ["OK", "OK", "OK"]
+    assert drv.ran == ["power_on", "power_off", "input_b"]
+
+
+async def test_concurrent_polls_share_one_device_read():
+    drv = SlowDriver("d1", {})
+    polls = [asyncio.create_task(drv.poll()) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    drv.release.set()
+    states = await asyncio.gather(*polls)
+    assert drv.ran == ["poll"]
+    assert states[0] is states[1] is states[2]
+
+
+async def test_abandoned_poll_stops_device_io():
+    drv = SlowDriver("d1", {})
+    poll = asyncio.create_task(drv.poll())
+    await asyncio.sleep(0.01)
+    assert drv.in_flight == 1
+
+    poll.cancel()
+    await asyncio.gather(poll, return_exceptions=True)
+    await asyncio.sleep(0)
+    assert drv.in_flight == 0  # the I/O was cancelled, not left running
+
+    # The queue keeps serving later commands and polls
+    drv.release.set()
+    assert await drv.execute("power_on") == "OK"
+    assert (await drv.poll()).power is True
+
+
+async def test_shared_poll_survives_one_waiter_cancelling():
+    drv = SlowDriver("d1", {})
+    first = asyncio.create_task(drv.poll())
+    second = asyncio.create_task(drv.poll())
+    await asyncio.sleep(0.01)
+
+    first.cancel()
+    await asyncio.gather(first, return_exceptions=True)
+    assert drv.in_flight == 1  # still wanted by the second caller
+
+    drv.release.set()
+    assert (await second).status == "online"
+    assert drv.ran == ["poll"]
+
+
+async def test_superseded_command_is_409():
+    drv = SlowDriver("d1", {})
+    rm = SimpleNamespace(
+        get_device=lambda device_id: drv,
+        send_command=lambda device_id, command, **params: drv.execute(command, **params),
+    )
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(room_manager=rm)))
+    busy = drv.submit_command("power_on")
+    await asyncio.sleep(0)
+    older = asyncio.create_task(
+        send_command("r1", "d1", CommandRequest(command="input_a"), request)
+    )
+    await asyncio.sleep(0)  # queued behind power_on, not yet run
+    newer = drv.submit_command("input_b")
+    drv.release.set()
+
+    with pytest.raises(HTTPException) as exc:
+        await older
+    assert exc.value.status_code == 409
+    assert await asyncio.gather(busy, newer) == ["OK", "OK"]
+
+
+def test_state_update_reports_changes_and_keeps_its_dict():
+    state = DeviceState(fields=("input",))
+    assert state.update(status=DeviceStatus.ONLINE, power=True, extra={"input": "31"})
+    cached = state.to_dict()
+    assert not state.update(status=DeviceStatus.ONLINE, power=True, extra={"input": "31"})
+    assert state.to_dict() is cached
+    assert state.update(power=False)
+    assert state.to_dict() == {
+        "status": "online", "power": False, "extra": {"input": "31"}, "breaker": "closed",
+    }
+    with pytest.raises(ValueError):
+        state.update(extra={"lamp": 1})
+    with pytest.raises(TypeError):
+        state.extra["input"] = "32"
+
+
+class QueryDriver(FakeDriver):
+    COMMANDS = frozenset({"power_on", "power_off", "query_power"})
+    QUERY_COMMANDS: ClassVar[dict[str, str]] = {"query_power": "power"}
+
+    async def send_command(self, command: str, **kwargs):
+        if command == "query_power":
+            self.commands.append(command)
+            return self.power
+        return await super().send_command(command, **kwargs)
+
+
+async def test_read_only_command_answered_from_fresh_state():
+    drv = QueryDriver("d1", {})
+    assert drv.read_cached("query_power", 60) == (False, None)  # never polled
+    drv.power = True
+    await drv.poll()
+    assert drv.read_cached("QUERY_POWER", 60) == (True, True)
+    assert drv.read_cached("query_power", float("nan")) == (False, None)
+    assert drv.read_cached("power_on", 60) == (False, None)  # not read-only
+
+    await drv.execute("power_off")  # may have changed the device
+    assert drv.read_cached("query_power", 60) == (False, None)
+    assert await drv.execute("query_power") is False
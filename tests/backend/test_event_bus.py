@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from core.event_bus import EventBus
+
+
+class Gate:
+    """Handler that records events and blocks until opened."""
+
+    def __init__(self):
+        self.seen: list = []
+        self.open = asyncio.Event()
+
+    async def __call__(self, data) -> None:
+        await self.open.wait()
+        self.seen.append(data)
+
+
+def stats(bus: EventBus, event_type: str = "e") -> dict:
+    return bus.stats()[event_type][0]
+
+
+async def test_plain_subscribers_run_concurrently(event_bus):
+    gates = [Gate(), Gate()]
+    for gate in gates:
+        event_bus.subscribe("e", gate)
+    publish = asyncio.create_task(event_bus.publish("e", 1))
+    await asyncio.sleep(0.01)
+    assert not publish.done()
+    for gate in gates:
+        gate.open.set()
+    await publish
+    assert [g.seen for g in gates] == [[1], [1]]
+
+
+async def test_queued_subscriber_never_blocks_and_keeps_every_event(event_bus):
+    gate = Gate()
+    event_bus.subscribe("e", gate, queue_size=10, overflow="coalesce", key=lambda d: d["id"])
+    for value in range(3):
+        await event_bus.publish("e", {"id": "d1", "v": value})
+    assert stats(event_bus)["queued"] == 3  # not full, so nothing coalesced
+    gate.open.set()
+    await asyncio.sleep(0.01)
+    assert [d["v"] for d in gate.seen] == [0, 1, 2]
+    assert stats(event_bus)["delivered"] == 3
+
+
+async def test_overflow_drops_the_oldest(event_bus):
+    gate = Gate()
+    event_bus.subscribe("e", gate, queue_size=2)
+    await event_bus.publish("e", 0)
+    await asyncio.sleep(0)  # the worker takes 0 and waits on the gate
+    for value in range(1, 4):
+        await event_bus.publish("e", value)
+    gate.open.set()
+    await asyncio.sleep(0.01)
+    assert gate.seen == [0, 2, 3]
+    assert stats(event_bus)["dropped"] == 1
+
+
+async def test_overflow_coalesces_by_key(event_bus):
+    gate = Gate()
+    event_bus.subscribe("e", gate, queue_size=2, overflow="coalesce", key=lambda d: d["id"])
+    for device_id, value in [("a", 1), ("b", 1), ("a", 2), ("c", 1)]:
+        await event_bus.publish("e", {"id": device_id, "v": value})
+    gate.open.set()
+    await asyncio.sleep(0.01)
+    # "a" replaced its queued event in place; "c" had nothing to replace, so "a" was dropped
+    assert [(d["id"], d["v"]) for d in gate.seen] == [("b", 1), ("c", 1)]
+    s = stats(event_bus)
+    assert (s["coalesced"], s["dropped"]) == (1, 1)
+
+
+async def test_coalesce_needs_a_key(event_bus):
+    with pytest.raises(ValueError):
+        event_bus.subscribe("e", Gate(), queue_size=2, overflow="coalesce")
+
+
+async def test_failed_deliveries_are_not_counted_as_delivered(event_bus):
+    async def broken(data):
+        raise RuntimeError("boom")
+
+    event_bus.subscribe("e", broken, queue_size=4)
+    for value in range(2):
+        await event_bus.publish("e", value)
+    await asyncio.sleep(0.01)
+    s = stats(event_bus)
+    assert (s["delivered"], s["errors"]) == (0, 2)
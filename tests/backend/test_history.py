@@ -0,0 +1,133 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+from core.history import HistoryStore
+
+
+def update(device_id: str, status: str = "online", power: bool | None = True, **extra) -> dict:
+    return {
+        "device_id": device_id,
+        "state": {"status": status, "power": power, "extra": extra, "breaker": "closed"},
+    }
+
+
+@pytest.fixture
+async def store(tmp_path, event_bus):
+    history = HistoryStore(tmp_path / "history.db", flush_interval=0.01)
+    await history.start(event_bus)
+    yield history
+    await history.stop()
+
+
+async def insert(store: HistoryStore, device_id: str, ts: float, until: float, **state) -> None:
+    sample = {"status": "online", "power": True, "extra": "{}", **state}
+    power = None if sample["power"] is None else int(sample["power"])
+    await store._db.execute(
+        "INSERT INTO device_state VALUES (?, ?, ?, ?, ?, ?)",
+        (device_id, ts, until, sample["status"], power, sample["extra"]),
+    )
+    await store._db.commit()
+
+
+async def test_identical_samples_extend_one_row(store, event_bus):
+    for _ in range(3):
+        await event_bus.publish("device_state_update", update("d1"))
+    await event_bus.publish("device_state_update", update("d1", power=False))
+    await asyncio.sleep(0.1)
+    samples = await store.samples("d1", time.time() - 60, time.time())
+    assert [s["power"] for s in samples] == [True, False]
+    assert samples[0]["until"] > samples[0]["ts"]
+
+
+async def test_failed_write_does_not_advance_last(store):
+    now = time.time()
+    await store._flush([("d1", now, ("online", True, "{}"))])
+    real_db = store._db
+
+    class FailingDB:
+        def __getattr__(self, name):
+            return getattr(real_db, name)
+
+        async def commit(self):
+            raise OSError("disk full")
+
+    store._db = FailingDB()
+    with pytest.raises(OSError):
+        await store._flush([("d1", now + 1, ("online", False, "{}"))])
+    store._db = real_db
+    assert store._last["d1"] == (("online", True, "{}"), now)
+
+    # The next identical sample must be inserted, not applied as an update to a missing row
+    await store._flush([("d1", now + 2, ("online", False, "{}"))])
+    samples = await store.samples("d1", now - 1, now + 3)
+    assert [(s["ts"], s["power"]) for s in samples] == [(now, True), (now + 2, False)]
+
+
+async def test_stop_writes_sample_held_by_writer(tmp_path, event_bus):
+    history = HistoryStore(tmp_path / "history.db", flush_interval=60)
+    await history.start(event_bus)
+    await event_bus.publish("device_state_update", update("d1"))
+    await asyncio.sleep(0.05)  # the writer has taken it off the queue and is sleeping
+    assert history._queue.empty()
+    await history.stop()
+
+    reopened = HistoryStore(tmp_path / "history.db")
+    await reopened.start(event_bus)
+    assert len(await reopened.samples("d1", time.time() - 60, time.time())) == 1
+    await reopened.stop()
+
+
+async def test_retention_removes_expired_samples(store):
+    now = time.time()
+    await insert(store, "d1", now - 40 * 86400, now - 35 * 86400)
+    await insert(store, "d1", now - 10, now)
+    store._tasks[1].cancel()
+    await asyncio.gather(store._tasks[1], return_exceptions=True)
+    task = asyncio.create_task(store._retention())
+    await asyncio.sleep(0.05)
+    task.cancel()
+    samples = await store.samples("d1", now - 50 * 86400, now)
+    assert [s["ts"] for s in samples] == [now - 10]
+
+
+async def test_aggregate_spreads_segments_over_buckets(store):
+    start = 1_000_000.0
+    await insert(store, "d1", start, start + 90, extra='{"lamp_hours": 5}')
+    await insert(store, "d1", start + 90, start + 180, power=0, extra='{"lamp_hours": 6}')
+    buckets = await store.aggregate("d1", start, start + 180, 60)
+    assert [b["online_seconds"] for b in buckets] == [60, 60, 60]
+    assert [b["power_on_seconds"] for b in buckets] == [60, 30, 0]
+    assert [b["samples"] for b in buckets] == [1, 1, 0]
+    assert buckets[1]["lamp_hours_min"] == 5 and buckets[1]["lamp_hours_max"] == 6
+
+
+async def test_aggregate_fractional_bucket_terminates(store):
+    # Float edges here round back onto the segment start; this used to loop forever
+    start, bucket = 1751516880.563318, 61.3
+    end = start + 24 * 3600
+    await insert(store, "d1", start - 10, end + 10)
+    buckets = await asyncio.wait_for(store.aggregate("d1", start, end, bucket), timeout=5)
+    assert len(buckets) == int(24 * 3600 // bucket) + 1
+    assert sum(b["online_seconds"] for b in buckets) == pytest.approx(24 * 3600, abs=1)
+
+
+async def test_reader_opens_read_only(tmp_path, event_bus):
+    path = tmp_path / "history.db"
+    reader = HistoryStore(path)
+    await reader.start(event_bus, record=False)
+    assert await reader.samples("d1", 0, time.time()) == []
+    assert not path.exists()  # left for the writer to create
+
+    writer = HistoryStore(path, flush_interval=0.01)
+    await writer.start(event_bus)
+    now = time.time()
+    await writer._flush([("d1", now, ("online", True, "{}"))])
+    try:
+        assert [s["ts"] for s in await reader.samples("d1", now - 60, now + 60)] == [now]
+        with pytest.raises(sqlite3.OperationalError):
+            await reader._db.execute("DELETE FROM device_state")
+    finally:
+        await reader.stop()
+        await writer.stop()
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from conftest import FakeLoader, room_config
+from core.metrics import COMMAND_SECONDS, DEVICE_POLL_SECONDS, Registry
+from core.state import RoomStateManager
+from devices.breaker import DeviceUnavailable
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    latency = registry.histogram("t_seconds", "Latency", ["op"], buckets=(0.1, 1.0))
+    latency.labels('say "hi"').observe(0.5)
+    registry.counter("t_total", "Count").labels().inc(2)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE t_seconds histogram" in lines
+    assert 't_seconds_bucket{op="say \\"hi\\"",le="0.1"} 0' in lines
+    assert 't_seconds_bucket{op="say \\"hi\\"",le="1.0"} 1' in lines
+    assert 't_seconds_bucket{op="say \\"hi\\"",le="+Inf"} 1' in lines
+    assert 't_seconds_count{op="say \\"hi\\""} 1' in lines
+    assert "t_total 2.0" in lines
+
+
+def test_wrong_label_count_is_rejected():
+    with pytest.raises(ValueError):
+        Registry().gauge("g", "Gauge", ["room"]).labels()
+
+
+@pytest.fixture
+async def manager(event_bus):
+    rm = RoomStateManager(room_config({"r1": ["d1"]}, poll_interval=60), FakeLoader(), event_bus)
+    await rm.startup()
+    yield rm
+    await rm.shutdown()
+
+
+async def test_unknown_commands_share_one_label(manager):
+    for command in ("bogus", "bogus2", "rm -rf"):
+        with pytest.raises(ValueError):
+            await manager.send_command("d1", command)
+    await manager.send_command("d1", "POWER_ON")
+    labels = set(COMMAND_SECONDS.children)
+    assert ("invalid", "invalid") in labels
+    assert ("power_on", "ok") in labels
+    assert not any(command.startswith("bogus") for command, _ in labels)
+
+
+async def test_junk_commands_to_unavailable_device_add_no_labels(manager):
+    drv = manager.devices["d1"]
+    for _ in range(drv.breaker.threshold):
+        drv.breaker.record_failure("unreachable")
+    before = set(COMMAND_SECONDS.children)
+    for i in range(20):
+        with pytest.raises(DeviceUnavailable):
+            await manager.send_command("d1", f"junk-{i}")
+    assert set(COMMAND_SECONDS.children) - before <= {("invalid", "unavailable")}
+
+
+async def test_poll_timer_is_resolved_when_driver_loads(manager):
+    await asyncio.sleep(0.05)  # let the startup connect and its first poll finish
+    timer = manager._poll_timers["d1"]
+    assert timer is DEVICE_POLL_SECONDS.labels("d1")
+    before = timer.count
+    assert await manager._poll_device("d1", manager.devices["d1"])
+    assert timer.count == before + 1
+
+    await manager.apply_config(room_config({"r1": []}))
+    assert "d1" not in manager._poll_timers
+    assert ("d1",) not in DEVICE_POLL_SECONDS.children
+
+
+async def test_publish_timer_is_resolved_once(event_bus):
+    async def handler(data):
+        pass
+
+    event_bus.subscribe("timed", handler)
+    timer = event_bus._timers["timed"]
+    before = timer.count
+    await event_bus.publish("timed", 1)
+    await event_bus.publish("timed", 2)
+    assert timer.count == before + 2
+    assert event_bus._timers["timed"] is timer
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from conftest import FakeDriver, room_config
+from core.notifications import NotificationListener
+from core.state import RoomStateManager
+from devices.base import DeviceStatus
+
+
+def test_routes_by_sender_address():
+    received = []
+    listener = NotificationListener(lambda *args: received.append(args))
+    listener.register("d1", "10.0.0.1", 4352)
+    listener.register("d2", "10.0.0.2", 4352)
+    listener.register("d3", "10.0.0.2", 4353)  # shares an IP: told apart by port
+
+    listener.received(b"%2POWR=1\r", ("10.0.0.1", 50000))
+    listener.received(b"%2INPT=31\r%2POWR=0\r", ("10.0.0.2", 4353))
+    listener.received(b"%2POWR=1\r", ("10.0.0.2", 50000))  # ambiguous
+    listener.received(b"garbage\r", ("10.0.0.1", 50000))
+
+    assert received == [("d1", "POWR", "1"), ("d3", "INPT", "31"), ("d3", "POWR", "0")]
+    assert listener.stats()["unmatched"] == 1
+    assert listener.stats()["malformed"] == 1
+
+
+async def test_unregister_during_lookup_does_not_readd(monkeypatch):
+    release = asyncio.Event()
+
+    async def slow_getaddrinfo(host, port, **kwargs):
+        await release.wait()
+        return [(None, None, None, "", ("10.0.0.9", port))]
+
+    monkeypatch.setattr(asyncio.get_running_loop(), "getaddrinfo", slow_getaddrinfo)
+    listener = NotificationListener(lambda *args: None)
+    listener.register("d1", "projector.local", 4352)
+    await asyncio.sleep(0)
+    listener.unregister("d1")
+    release.set()
+    await asyncio.sleep(0.01)
+    assert listener.stats()["devices"] == 0
+    assert not listener._resolving
+
+
+class NotifyingDriver(FakeDriver):
+    @property
+    def notify_address(self) -> tuple[str, int]:
+        return ("127.0.0.1", 4352)
+
+    def apply_notification(self, command: str, value: str) -> bool:
+        if command != "POWR":
+            return False
+        self.power = value == "1"  # what the follow-up poll will find
+        self._state.update(status=DeviceStatus.ONLINE, power=self.power)
+        return True
+
+
+class NotifyingLoader:
+    def load_driver(self, device_id: str, device_config: dict) -> NotifyingDriver:
+        return NotifyingDriver(device_id, {})
+
+
+@pytest.fixture
+async def manager(event_bus):
+    config = room_config(
+        {"r1": ["d1"]}, poll_interval=10, notify_listen=True, notify_host="127.0.0.1",
+        notify_port=0, notify_poll_interval=120,
+    )
+    rm = RoomStateManager(config, NotifyingLoader(), event_bus)
+    await rm.startup()
+    yield rm
+    await rm.shutdown()
+
+
+async def test_notifying_devices_keep_their_slow_interval_on_reload(manager):
+    assert manager.poller.schedule.base_interval("d1") == 120
+    config = room_config({"r1": ["d1"]}, poll_interval=5, notify_poll_interval=90)
+    await manager.apply_config(config)
+    assert manager.poller.schedule.base_interval("d1") == 90
+
+
+async def test_notification_publishes_state(manager, event_bus):
+    published = []
+
+    async def collect(event):
+        published.append(event)
+
+    event_bus.subscribe("device_state_update", collect)
+    await asyncio.sleep(0.05)  # startup connect reports the first state
+    manager.notifications.received(b"%2POWR=1\r", ("127.0.0.1", 4352))
+    await asyncio.sleep(0.05)
+    assert manager.devices["d1"].state.power is True
+    assert any(event["state"]["power"] is True for event in published)
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from devices.display import pjlink
+from devices.display.pjlink import PJLinkDriver
+
+
+class Projector:
+    """A PJLink server that records every command line it receives."""
+
+    def __init__(self, answer: bool = True):
+        self.answer = answer
+        self.received: list[str] = []
+        self.connections = 0
+        self._writers: list[asyncio.StreamWriter] = []
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._writers.append(writer)
+        writer.write(b"PJLINK 0\r\n")
+        while line := await reader.readline():
+            command = line.decode().strip()
+            self.received.append(command)
+            if self.answer:
+                writer.write(f"{command.split()[0]}=OK\r\n".encode())
+        writer.close()
+
+    def drop_sessions(self) -> None:
+        for writer in self._writers:
+            writer.close()
+        self._writers.clear()
+
+    async def stop(self) -> None:
+        self.drop_sessions()
+        self._server.close()
+        await self._server.wait_closed()
+
+
+@pytest.fixture
+async def projector():
+    server = Projector()
+    port = await server.start()
+    yield server, PJLinkDriver("p1", {"port": port, "session": True})
+    await server.stop()
+
+
+async def test_session_is_reused(projector):
+    server, driver = projector
+    assert await driver.send_command("power_on") == "OK"
+    assert await driver.send_command("mute_on") == "OK"
+    assert server.connections == 1
+    await driver.disconnect()
+
+
+async def test_session_dropped_while_idle_reconnects(projector):
+    server, driver = projector
+    await driver.send_command("power_on")
+    server.drop_sessions()
+    await asyncio.sleep(0.05)
+
+    assert await driver.send_command("power_off") == "OK"
+    assert server.connections == 2
+    assert server.received == ["%1POWR 1", "%1POWR 0"]
+    await driver.disconnect()
+
+
+async def test_slow_answer_is_not_resent(projector, monkeypatch):
+    server, driver = projector
+    monkeypatch.setattr(pjlink, "PJLINK_TIMEOUT", 0.1)
+    await driver.send_command("power_on")
+    server.answer = False
+
+    with pytest.raises(TimeoutError):
+        await driver.send_command("power_off")
+    assert server.received == ["%1POWR 1", "%1POWR 0"]  # sent once, not retried
+    await driver.disconnect()
@@ -0,0 +1,112 @@
+import asyncio
+import itertools
+
+from core.poller import PollEngine, PollSchedule
+
+
+class Recorder:
+    """A poll function that records when each device was polled and how many ran at once."""
+
+    def __init__(self, duration: float = 0.0, hang: frozenset[str] = frozenset()):
+        self.duration = duration
+        self.hang = hang
+        self.started: dict[str, float] = {}
+        self.cancelled: list[str] = []
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, device_id: str) -> bool:
+        self.started[device_id] = asyncio.get_running_loop().time()
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(3600 if device_id in self.hang else self.duration)
+            return device_id != "bad"
+        except asyncio.CancelledError:
+            self.cancelled.append(device_id)
+            raise
+        finally:
+            self.running -= 1
+
+
+async def test_first_polls_are_spread_over_the_interval():
+    poll = Recorder()
+    engine = PollEngine(poll, interval=0.4, spread=0.5)
+    start = asyncio.get_running_loop().time()
+    engine.start(lambda: ["d1", "d2", "d3", "d4"])
+    await asyncio.sleep(0.25)
+    await engine.stop()
+
+    offsets = [poll.started[d] - start for d in ("d1", "d2", "d3", "d4")]
+    assert offsets == sorted(offsets)
+    assert offsets[0] < 0.02
+    assert 0.13 < offsets[-1] < 0.2  # 3/4 of the spread window (0.2 s)
+    assert engine.cycles[0].completed == 4 and engine.cycles[0].on_time
+
+
+async def test_concurrency_is_bounded():
+    poll = Recorder(duration=0.02)
+    engine = PollEngine(poll, interval=1.0, concurrency=2, spread=0.0)
+    cycle = await engine.run_cycle([f"d{i}" for i in range(6)])
+    assert poll.max_running == 2
+    assert cycle.completed == 6
+
+
+async def test_stragglers_are_cancelled_at_the_deadline():
+    poll = Recorder(hang=frozenset({"slow"}))
+    engine = PollEngine(poll, interval=1.0, deadline=0.05, spread=0.0)
+    cycle = await engine.run_cycle(["fast", "slow", "bad"])
+
+    assert poll.cancelled == ["slow"]
+    assert cycle.missed == 1 and not cycle.on_time
+    assert cycle.completed == 2
+    assert cycle.errors == 1  # "bad" answered False
+    assert cycle.duration < 0.5
+
+
+async def test_cycles_never_overlap():
+    poll = Recorder(duration=0.06)
+    engine = PollEngine(poll, interval=0.03, deadline=1.0, spread=0.0)
+    engine.start(lambda: ["d1"])
+    await asyncio.sleep(0.3)
+    await engine.stop()
+
+    cycles = list(engine.cycles)
+    assert len(cycles) >= 2
+    for previous, cycle in itertools.pairwise(cycles):
+        assert cycle.started_at >= previous.started_at + previous.duration - 0.005
+    assert engine.stats()["cycles"] == len(cycles)
+
+
+def test_failures_back_off_up_to_offline_max():
+    schedule = PollSchedule(10, offline_max=60)
+    for _ in range(3):
+        schedule.record("d1", False, now=0.0)
+    assert schedule.interval("d1") == 60  # 10 * 2**3, capped
+    schedule.record("d1", True, now=0.0)
+    assert schedule.interval("d1") == 10
+
+
+async def test_expedited_device_is_polled_on_the_fast_lane():
+    poll = Recorder()
+    schedule = PollSchedule(60, fast_interval=0.01, fast_window=0.1)
+    engine = PollEngine(poll, interval=60, schedule=schedule)
+    engine.expedite("d1")
+    assert engine.stats()["fast"] == 1
+    await asyncio.sleep(0.05)
+    assert "d1" in poll.started
+
+    await asyncio.sleep(0.1)
+    assert engine.stats()["fast"] == 0
+    assert schedule.next_due("d1") is not None  # back on its normal interval
+    await engine.stop()
+
+
+def test_deadline_follows_the_interval_unless_configured():
+    engine = PollEngine(Recorder(), interval=10)
+    engine.set_interval(5)
+    assert engine.deadline == 5
+
+    engine = PollEngine(Recorder(), interval=10, deadline=8)
+    engine.set_interval(5)
+    assert engine.deadline == 8
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+
+import pytest
+from conftest import FakeLoader, room_config
+from core.config import ConfigLoader
+from core.reload import ConfigWatcher
+from core.state import RoomStateManager
+
+ROOM = """
+room: {{id: r1, name: Room 1}}
+devices:
+  - {{id: d1, driver: fake, poll_interval: {interval}}}
+"""
+
+
+def write(path, text: str) -> None:
+    path.write_text(text)
+    # Filesystems with coarse timestamps could otherwise hide the edit
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+@pytest.fixture
+def files(tmp_path):
+    rooms = tmp_path / "rooms"
+    rooms.mkdir()
+    write(tmp_path / "nomy.yaml", "poll_interval: 10\n")
+    write(rooms / "r1.yaml", ROOM.format(interval=5))
+    return tmp_path
+
+
+def test_loader_notices_edits_and_reuses_unchanged_files(files):
+    loader = ConfigLoader(files / "nomy.yaml", files / "rooms")
+    first = loader.load()
+    assert not loader.changed()
+
+    write(files / "nomy.yaml", "poll_interval: 10\n")  # touched, same content
+    assert loader.changed()
+    second = loader.load()
+    assert second["rooms"]["r1"] is first["rooms"]["r1"]
+
+    write(files / "rooms" / "r2.yaml", "room: {id: r2}\n")
+    assert loader.changed()
+    assert set(loader.load()["rooms"]) == {"r1", "r2"}
+
+
+async def test_apply_config_restarts_only_changed_devices(event_bus):
+    rm = RoomStateManager(room_config({"r1": ["d1", "d2"]}), FakeLoader(), event_bus)
+    await rm.startup()
+    d1, d2 = rm.get_device("d1"), rm.get_device("d2")
+
+    config = room_config({"r1": ["d1", "d2"], "r2": ["d3"]})
+    config["rooms"]["r1"]["devices"][1]["config"] = {"host": "new"}
+    diff = await rm.apply_config(config)
+    assert diff.devices_added == {"d3"}
+    assert diff.devices_changed == {"d2"}
+    assert rm.get_device("d1") is d1
+    assert rm.get_device("d2") is not d2
+    await rm.shutdown()
+
+
+async def test_reload_recomputes_poll_intervals(event_bus):
+    rm = RoomStateManager(room_config({"r1": ["d1"]}, poll_interval=30), FakeLoader(), event_bus)
+    await rm.apply_config(room_config({"r1": ["d1"]}, poll_interval=4, poll_fast_interval=1))
+    assert rm.poller.schedule.base_interval("d1") == 4
+    assert rm.poller.schedule.fast_interval == 1
+    assert rm.poller.interval == 4
+
+
+async def test_bad_revision_is_reported_once(files, event_bus, caplog):
+    loader = ConfigLoader(files / "nomy.yaml", files / "rooms")
+    rm = RoomStateManager(loader.load(), FakeLoader(), event_bus)
+    watcher = ConfigWatcher(loader, rm, interval=0.01)
+    watcher.start()
+
+    write(files / "rooms" / "r1.yaml", "room: [unclosed\n")
+    with caplog.at_level(logging.ERROR, logger="core.reload"):
+        await asyncio.sleep(0.1)
+    assert len(caplog.records) == 1
+
+    write(files / "rooms" / "r1.yaml", ROOM.format(interval=3))
+    await asyncio.sleep(0.1)
+    await watcher.stop()
+    assert rm.poller.schedule.base_interval("d1") == 3
+    assert len(caplog.records) == 1
@@ -0,0 +1,75 @@
+import asyncio
+
+from conftest import FakeLoader, room_config
+from core.config import compile_room
+from core.scenes import SceneEngine
+from core.state import RoomStateManager
+
+
+def scene(*actions: dict):
+    devices = [{"id": did} for did in {a["device"] for a in actions}]
+    room = compile_room("r1", {"devices": devices, "scenes": [{"name": "s", "actions": actions}]})
+    return room.scenes["s"]
+
+
+class SlowRooms:
+    """Just enough of RoomStateManager for the engine: every command takes ``delay``."""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.log: list[tuple[str, str, str]] = []
+
+    def get_device(self, device_id: str):
+        return None if device_id == "missing" else object()
+
+    async def send_command(self, device_id: str, command: str, **kwargs):
+        self.log.append(("start", device_id, command))
+        await asyncio.sleep(kwargs.get("delay", self.delay))
+        self.log.append(("end", device_id, command))
+
+
+async def test_devices_run_concurrently_in_declared_order():
+    rooms = SlowRooms()
+    actions = scene(
+        {"device": "d1", "command": "power_on"},
+        {"device": "d2", "command": "power_on"},
+        {"device": "d1", "command": "input_hdmi1"},
+    )
+    result = await SceneEngine(rooms).activate(actions)
+
+    assert all(r["ok"] for r in result["results"])
+    assert [r["command"] for r in result["results"]] == ["power_on", "power_on", "input_hdmi1"]
+    # d1 and d2 overlap, d1's second action waits for its first
+    assert rooms.log[:2] == [("start", "d1", "power_on"), ("start", "d2", "power_on")]
+    assert rooms.log.index(("start", "d1", "input_hdmi1")) > rooms.log.index(("end", "d1", "power_on"))
+    assert result["duration_ms"] < 140
+
+
+async def test_stages_run_one_after_another():
+    rooms = SlowRooms()
+    actions = scene(
+        {"device": "d1", "command": "input_hdmi1", "stage": 1},
+        {"device": "d2", "command": "power_on"},
+    )
+    await SceneEngine(rooms).activate(actions)
+    assert rooms.log == [
+        ("start", "d2", "power_on"), ("end", "d2", "power_on"),
+        ("start", "d1", "input_hdmi1"), ("end", "d1", "input_hdmi1"),
+    ]
+
+
+async def test_failures_are_reported_per_action(event_bus):
+    rm = RoomStateManager(room_config({"r1": ["d1"]}), FakeLoader(), event_bus)
+    await rm.startup()
+    rooms = SlowRooms()
+    actions = scene(
+        {"device": "d1", "command": "power_on", "params": {"delay": 1}, "timeout": 0.05},
+        {"device": "missing", "command": "power_on"},
+    )
+    slow, missing = (await SceneEngine(rooms).activate(actions))["results"]
+    assert slow == {**slow, "ok": False, "error": "Timed out after 0.05s"}
+    assert missing == {**missing, "ok": False, "error": "Device 'missing' not found"}
+
+    bogus = await SceneEngine(rm).activate(scene({"device": "d1", "command": "bogus"}))
+    assert bogus["results"][0]["error"] == "Unknown command: 'bogus'"
+    await rm.shutdown()
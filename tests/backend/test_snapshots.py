@@ -0,0 +1,146 @@
+import json
+
+import pytest
+from api.routes import rooms
+from conftest import FakeLoader, room_config
+from core.config import compile_config
+from core.snapshots import SnapshotCache, etag_matches
+from core.state import RoomStateManager
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+
+def state(power: bool) -> dict:
+    return {"status": "online", "power": power, "extra": {}, "breaker": "closed"}
+
+
+@pytest.fixture
+def cache() -> SnapshotCache:
+    cache = SnapshotCache(compile_config(room_config({"r1": ["d1", "d2"]})))
+    cache.update("d1", state(False))
+    cache.update("d2", state(False))
+    return cache
+
+
+def test_room_body_is_reused_until_the_room_changes(cache):
+    body = cache.room_body("r1")
+    assert cache.room_body("r1") is body
+    assert [d["state"]["power"] for d in json.loads(body)["devices"]] == [False, False]
+
+    cache.update("d2", state(True))
+    assert json.loads(cache.room_body("r1"))["devices"][1]["state"]["power"] is True
+
+
+def test_delta_holds_only_changed_devices(cache):
+    since = cache.room_version("r1")
+    cache.update("d2", state(True))
+    delta = json.loads(cache.delta_body("r1", since))
+    assert delta["full"] is False
+    assert [d["id"] for d in delta["devices"]] == ["d2"]
+    assert delta["version"] == cache.room_version("r1")
+
+
+def test_delta_is_full_after_a_config_change(cache):
+    since = cache.room_version("r1")
+    cache.set_index(compile_config(room_config({"r1": ["d1", "d2"]})), {"r1"})
+    delta = json.loads(cache.delta_body("r1", since))
+    assert delta["full"] is True
+    assert [d["id"] for d in delta["devices"]] == ["d1", "d2"]
+
+
+def test_delta_from_the_future_is_full(cache):
+    # e.g. a version from a server whose clock ran ahead
+    delta = json.loads(cache.delta_body("r1", cache.version + 1000))
+    assert delta["full"] is True
+    assert len(delta["devices"]) == 2
+
+
+def test_adopted_room_config_versions(cache):
+    since = cache.room_version("r1")
+    cache.set_room_configs({"r1": since + 5, "gone": 1})
+    assert cache.room_configs["r1"] == since + 5
+    assert "gone" not in cache.room_configs
+    assert cache.room_version("r1") == since + 5
+    assert cache.version >= since + 5
+    assert json.loads(cache.delta_body("r1", since))["full"] is True
+
+
+def test_etag_matching():
+    assert etag_matches('"5"', '"5"')
+    assert etag_matches('"4", W/"5"', '"5"')
+    assert etag_matches("*", '"5"')
+    assert not etag_matches('"4"', '"5"')
+    assert not etag_matches(None, '"5"')
+
+
+def test_room_route_answers_304_while_unchanged(event_bus):
+    rm = RoomStateManager(room_config({"r1": ["d1"]}), FakeLoader(), event_bus)
+    rm.snapshots.update("d1", state(False))
+    app = FastAPI()
+    app.include_router(rooms.router)
+    app.state.room_manager = rm
+    client = TestClient(app)
+
+    first = client.get("/rooms/r1")
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+    assert client.get("/rooms/r1", headers={"If-None-Match": etag}).status_code == 304
+
+    rm.snapshots.update("d1", state(True))
+    changed = client.get("/rooms/r1", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["devices"][0]["state"]["power"] is True
+
+
+@pytest.fixture
+def fleet() -> SnapshotCache:
+    cache = SnapshotCache(compile_config(room_config({"r1": ["d1", "d2", "d3"], "r2": ["d4"]})))
+    cache.update("d1", state(True))
+    cache.update("d2", state(False))
+    cache.update("d3", {**state(False), "status": "offline", "power": None})
+    cache.update("d4", {**state(True), "extra": {"input": "31"}})
+    return cache
+
+
+def query(cache: SnapshotCache, **kwargs) -> dict:
+    return json.loads(cache.fleet.query(**kwargs))
+
+
+def test_fleet_filters_intersect(fleet):
+    body = query(fleet, filters={"status": ["online"], "power": ["true"]})
+    assert [d["id"] for d in body["devices"]] == ["d1", "d4"]
+    body = query(fleet, filters={"room": ["r1"], "power": ["false", "null"]})
+    assert [d["id"] for d in body["devices"]] == ["d2", "d3"]
+    assert query(fleet, filters={"room": ["nope"]})["devices"] == []
+    with pytest.raises(ValueError):
+        fleet.fleet.query({"colour": ["red"]})
+
+
+def test_fleet_status_counts_ignore_the_status_filter(fleet):
+    body = query(fleet, filters={"status": ["offline"], "room": ["r1"]})
+    assert [d["id"] for d in body["devices"]] == ["d3"]
+    assert body["status_counts"] == {"offline": 1, "online": 2}
+
+    fleet.update("d3", state(True))
+    assert query(fleet, filters={})["status_counts"] == {"online": 4}
+
+
+def test_fleet_cursor_pages_in_id_order(fleet):
+    first = query(fleet, filters={}, limit=3)
+    assert [d["id"] for d in first["devices"]] == ["d1", "d2", "d3"]
+    assert first["total"] == 4
+    rest = query(fleet, filters={}, cursor=first["next_cursor"], limit=3)
+    assert [d["id"] for d in rest["devices"]] == ["d4"]
+    assert rest["next_cursor"] is None
+
+
+def test_fleet_field_projection(fleet):
+    body = query(
+        fleet, filters={"room": ["r2"]}, fields=["id", "state.extra.input", "state.power"]
+    )
+    assert body["devices"] == [{"id": "d4", "state": {"extra": {"input": "31"}, "power": True}}]
+    full = query(fleet, filters={"room": ["r2"]}, fields=["state", "state.power"])
+    assert full["devices"][0]["state"]["status"] == "online"
+    with pytest.raises(ValueError):
+        fleet.fleet.query({}, fields=["password"])
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from conftest import FakeDriver, FakeLoader, room_config
+from core.state import RoomStateManager
+from devices.base import DeviceStatus
+
+
+@pytest.fixture
+async def manager(event_bus):
+    rm = RoomStateManager(room_config({"r1": ["d1"]}, poll_interval=60), FakeLoader(), event_bus)
+    await rm.startup()
+    yield rm
+    await rm.shutdown()
+
+
+def fast_devices(rm: RoomStateManager) -> int:
+    return rm.poller.stats()["fast"]
+
+
+async def test_successful_command_expedites_polling(manager):
+    assert await manager.send_command("d1", "power_on") == "OK"
+    assert fast_devices(manager) == 1
+
+
+async def test_invalid_command_does_not_expedite(manager):
+    with pytest.raises(ValueError):
+        await manager.send_command("d1", "bogus")
+    assert fast_devices(manager) == 0
+
+
+async def test_failed_command_does_not_expedite(manager):
+    manager.get_device("d1").fail_with = ConnectionRefusedError("refused")
+    with pytest.raises(ConnectionRefusedError):
+        await manager.send_command("d1", "power_on")
+    assert fast_devices(manager) == 0
+
+
+async def test_poll_intervals_follow_the_config(event_bus):
+    config = room_config({"r1": ["d1", "d2"]}, poll_interval=30, poll_intervals={"fake": 20})
+    config["rooms"]["r1"]["devices"][1]["poll_interval"] = 5
+    rm = RoomStateManager(config, FakeLoader(), event_bus)
+    assert rm.poller.schedule.base_interval("d1") == 20
+    assert rm.poller.schedule.base_interval("d2") == 5
+    assert rm.poller.interval == rm.poller.deadline == 5
+
+
+async def test_only_changed_states_are_published(event_bus):
+    rm = RoomStateManager(room_config({"r1": ["d1"]}, poll_interval=0.02), FakeLoader(), event_bus)
+    await rm.startup()
+    await asyncio.sleep(0.05)  # first poll published
+    events = []
+
+    async def collect(data):
+        events.append(data)
+
+    event_bus.subscribe("device_state_update", collect)
+    await asyncio.sleep(0.1)
+    assert events == []  # polled several times, unchanged
+    rm.get_device("d1").power = True
+    await asyncio.sleep(0.1)
+    await rm.shutdown()
+
+    assert [e["changed"] for e in events] == [["power"]]
+    assert events[0]["version"] == rm.versions["d1"] == 2
+
+
+class SlowDriver(FakeDriver):
+    async def connect(self) -> bool:
+        await asyncio.sleep(0.1)
+        return self.device_id != "down"
+
+
+class SlowLoader(FakeLoader):
+    def load_driver(self, device_id: str, device_config: dict) -> FakeDriver:
+        return SlowDriver(device_id, {})
+
+
+async def test_startup_connects_in_the_background(event_bus):
+    rm = RoomStateManager(room_config({"r1": ["d1", "down"]}), SlowLoader(), event_bus)
+    await asyncio.wait_for(rm.startup(), 0.05)
+    assert rm.startup_stats()["connecting"] == 2
+    await asyncio.sleep(0.15)  # both connect concurrently
+    assert rm.get_device("d1").state.status == DeviceStatus.ONLINE
+    assert rm.get_device("down").state.status == DeviceStatus.OFFLINE
+    assert rm.startup_stats()["connecting"] == 0
+    await rm.shutdown()
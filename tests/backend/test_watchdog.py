@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+from api.routes import system
+from core.watchdog import LoopWatchdog, task_kind
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+
+async def test_task_kind_groups_by_name_prefix():
+    async def idle():
+        await asyncio.sleep(1)
+
+    tasks = [
+        asyncio.create_task(idle(), name="device-poll:d1"),
+        asyncio.create_task(idle(), name="connect:d1"),
+        asyncio.create_task(idle()),
+    ]
+    try:
+        assert [task_kind(t) for t in tasks] == ["poll", "connect", "other"]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def test_stall_is_reported_with_its_task_and_stack():
+    watchdog = LoopWatchdog(interval=0.02, slow_threshold=0.05)
+    watchdog.start()
+
+    async def hog():
+        time.sleep(0.3)  # noqa: ASYNC251 - the stall under test
+
+    try:
+        await asyncio.sleep(0.05)
+        await asyncio.create_task(hog(), name="bulk:d1")
+        await asyncio.sleep(0.1)
+    finally:
+        await watchdog.stop()
+    [stall] = watchdog.stalls
+    assert stall["kind"] == "command"
+    assert stall["task"].startswith("bulk:d1")
+    assert any("hog" in frame for frame in stall["stack"])
+    assert stall["duration_ms"] >= 200
+    assert watchdog.max_lag >= 0.2
+
+
+async def test_one_profile_at_a_time():
+    watchdog = LoopWatchdog()
+    first = asyncio.create_task(watchdog.profile(0.1))
+    await asyncio.sleep(0.01)
+    with pytest.raises(RuntimeError):
+        await watchdog.profile(0.1)
+    await first
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(system.router)
+    app.state.watchdog = LoopWatchdog()
+    with TestClient(app) as client:
+        yield client
+
+
+def test_profile_returns_folded_stacks(client):
+    response = client.get("/system/profile", params={"seconds": 0.05, "interval": 0.005})
+    assert response.status_code == 200
+    assert "attachment" in response.headers["content-disposition"]
+    line = response.text.splitlines()[0]
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+
+@pytest.mark.parametrize("params", [
+    {"seconds": "nan"},
+    {"seconds": 61},
+    {"seconds": 0},
+    {"interval": "nan"},
+    {"interval": 0},
+    {"interval": 1e9},
+    {"seconds": 0.1, "interval": 0.2},
+])
+def test_profile_rejects_bad_parameters(client, params):
+    assert client.get("/system/profile", params=params).status_code == 400
@@ -0,0 +1,147 @@
+import asyncio
+import json
+
+import pytest
+from api.websocket import ConnectionManager, RoomHub, router
+from conftest import FakeLoader, room_config
+from core.metrics import WS_CONNECTIONS, WS_SEND_SECONDS
+from core.state import RoomStateManager
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+
+class FakeSocket:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.sent: list[str] = []
+        self.closed: tuple | None = None
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, frame: str) -> None:
+        if self.fail:
+            raise ConnectionResetError("gone")
+        self.sent.append(frame)
+
+    async def close(self, code: int = 1000, reason: str | None = None) -> None:
+        await asyncio.sleep(0)
+        self.closed = (code, reason)
+
+
+def manager_for(event_bus, rooms: dict[str, list[str]]) -> RoomStateManager:
+    return RoomStateManager(room_config(rooms), FakeLoader(), event_bus)
+
+
+async def test_dead_client_is_dropped_and_closed(event_bus):
+    hub = RoomHub("r1", manager_for(event_bus, {"r1": ["d1"]}))
+    good, dead = FakeSocket(), FakeSocket(fail=True)
+    hub.add(good)
+    hub.add(dead)
+
+    await hub.broadcast({"type": "ping"})
+    assert hub.connections == {good}
+    assert len(good.sent) == 1
+    assert len(hub._closing) == 1  # the close task is referenced until it finishes
+    await asyncio.gather(*hub._closing)
+    assert dead.closed == (1000, None)
+    await asyncio.sleep(0)
+    assert not hub._closing
+    hub.close()
+
+
+async def test_one_subscription_per_room(event_bus):
+    hub = RoomHub("r1", manager_for(event_bus, {"r1": ["d1"]}))
+    ws = FakeSocket()
+    hub.add(ws)
+
+    await event_bus.publish("device_state_update", {"device_id": "d2", "state": {}})
+    await event_bus.publish("device_state_update", {"device_id": "d1", "state": {}, "version": 3})
+    await asyncio.sleep(0.01)
+    assert len(ws.sent) == 1
+    assert '"version": 3' in ws.sent[0]
+    hub.close()
+    await event_bus.publish("device_state_update", {"device_id": "d1", "state": {}})
+    await asyncio.sleep(0.01)
+    assert len(ws.sent) == 1
+
+
+async def test_throttled_client_gets_latest_state_batched(event_bus):
+    hub = RoomHub("r1", manager_for(event_bus, {"r1": ["d1", "d2"]}))
+    ws = FakeSocket()
+    hub.add(ws, max_rate=5)
+
+    await event_bus.publish("device_state_update", {"device_id": "d1", "state": {"power": False}})
+    await asyncio.sleep(0.01)
+    assert len(ws.sent) == 1
+    # Updates inside the window wait it out and collapse to the latest state per device
+    await event_bus.publish("device_state_update", {"device_id": "d1", "state": {"power": True}})
+    await event_bus.publish("device_state_update", {"device_id": "d2", "state": {}})
+    await asyncio.sleep(0.05)
+    assert len(ws.sent) == 1
+    await asyncio.sleep(0.25)
+    assert len(ws.sent) == 2
+    batch = json.loads(ws.sent[1])
+    assert batch["type"] == "device_state_batch"
+    assert [u["state"] for u in batch["updates"]] == [{"power": True}, {}]
+    hub.close()
+
+
+async def test_hub_teardown_removes_its_metrics(event_bus):
+    rm = manager_for(event_bus, {"r1": ["d1"]})
+    manager = ConnectionManager()
+    ws = FakeSocket()
+    await manager.connect("r1", ws, rm)
+    await manager.broadcast("r1", {"type": "ping"})
+    assert ("r1",) in WS_CONNECTIONS.children
+    assert ("r1",) in WS_SEND_SECONDS.children
+
+    manager.disconnect("r1", ws)
+    assert ("r1",) not in WS_CONNECTIONS.children
+    assert ("r1",) not in WS_SEND_SECONDS.children
+
+
+async def test_connect_to_room_removed_during_accept(event_bus):
+    rm = manager_for(event_bus, {"r1": ["d1"]})
+    manager = ConnectionManager()
+
+    class RacingSocket(FakeSocket):
+        async def accept(self) -> None:
+            await rm.apply_config(room_config({}))
+
+    ws = RacingSocket()
+    assert not await manager.connect("r1", ws, rm)
+    assert ws.closed == (4004, "Room 'r1' removed")
+    assert not manager._hubs
+
+
+async def test_clients_of_a_removed_room_are_closed(event_bus):
+    rm = manager_for(event_bus, {"r1": ["d1"]})
+    manager = ConnectionManager()
+    ws = FakeSocket()
+    assert await manager.connect("r1", ws, rm)
+
+    await rm.apply_config(room_config({}))
+    await asyncio.sleep(0.01)
+    assert ws.closed == (4004, "Room 'r1' removed")
+
+
+class StubRooms:
+    def get_room(self, room_id: str) -> dict:
+        return {"id": room_id}
+
+
+@pytest.mark.parametrize("rate", ["nan", "inf"])
+def test_non_finite_max_rate_is_rejected(rate):
+    app = FastAPI()
+    app.include_router(router)
+    app.state.room_manager = StubRooms()
+    app.state.event_bus = None
+    with (
+        TestClient(app) as client,
+        pytest.raises(WebSocketDisconnect) as exc,
+        client.websocket_connect(f"/ws/rooms/r1?max_rate={rate}") as ws,
+    ):
+        ws.receive_text()
+    assert exc.value.code == 4400